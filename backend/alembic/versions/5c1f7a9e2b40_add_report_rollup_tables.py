@@ -0,0 +1,55 @@
+"""Add payments_daily and dues_daily report rollup tables
+
+Revision ID: 5c1f7a9e2b40
+Revises: 30eb3abe5954
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1f7a9e2b40'
+down_revision: Union[str, None] = '30eb3abe5954'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the daily rollup tables and backfill them from the raw tables."""
+    op.create_table(
+        'payments_daily',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('total_amount', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('payment_count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'dues_daily',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('total_remaining', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('installment_count', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+    # Backfill from the existing payments and installments
+    op.execute("""
+        INSERT INTO payments_daily (day, total_amount, payment_count)
+        SELECT (payment_date AT TIME ZONE 'UTC')::date, SUM(amount), COUNT(*)
+        FROM payments
+        WHERE payment_date IS NOT NULL
+        GROUP BY 1
+    """)
+    op.execute("""
+        INSERT INTO dues_daily (day, total_remaining, installment_count)
+        SELECT due_date::date, SUM(COALESCE(remaining_amount, 0)), COUNT(*)
+        FROM installments
+        WHERE due_date IS NOT NULL
+        GROUP BY 1
+    """)
+
+
+def downgrade() -> None:
+    """Drop the daily rollup tables."""
+    op.drop_table('dues_daily')
+    op.drop_table('payments_daily')
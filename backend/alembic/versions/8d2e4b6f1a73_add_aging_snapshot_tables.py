@@ -0,0 +1,55 @@
+"""Add aging report snapshot tables
+
+Revision ID: 8d2e4b6f1a73
+Revises: 5c1f7a9e2b40
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2e4b6f1a73'
+down_revision: Union[str, None] = '5c1f7a9e2b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BUCKET_PREFIXES = ['current', 'days_1_30', 'days_31_60', 'days_61_90', 'days_90_plus']
+
+
+def upgrade() -> None:
+    """Create the per-customer and per-bucket aging snapshot tables."""
+    bucket_columns = []
+    for prefix in BUCKET_PREFIXES:
+        bucket_columns.append(sa.Column(f'{prefix}_amount', sa.BigInteger(), nullable=False, server_default='0'))
+        bucket_columns.append(sa.Column(f'{prefix}_count', sa.Integer(), nullable=False, server_default='0'))
+
+    op.create_table(
+        'aging_customer_snapshots',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), primary_key=True),
+        sa.Column('as_of', sa.Date(), nullable=False),
+        *bucket_columns,
+        sa.Column('total_overdue', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('max_days_overdue', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_index(
+        'ix_aging_customer_snapshots_total_overdue_user',
+        'aging_customer_snapshots',
+        [sa.text('total_overdue DESC'), 'user_id'],
+    )
+    op.create_table(
+        'aging_bucket_snapshots',
+        sa.Column('bucket', sa.String(16), primary_key=True),
+        sa.Column('as_of', sa.Date(), nullable=False),
+        sa.Column('installment_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_amount', sa.BigInteger(), nullable=False, server_default='0'),
+    )
+
+
+def downgrade() -> None:
+    """Drop the aging snapshot tables."""
+    op.drop_table('aging_bucket_snapshots')
+    op.drop_index('ix_aging_customer_snapshots_total_overdue_user', table_name='aging_customer_snapshots')
+    op.drop_table('aging_customer_snapshots')
@@ -0,0 +1,33 @@
+"""Add notification delivery ledger
+
+Revision ID: b3a9c6d2e815
+Revises: 8d2e4b6f1a73
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3a9c6d2e815'
+down_revision: Union[str, None] = '8d2e4b6f1a73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the notification_deliveries ledger."""
+    op.create_table(
+        'notification_deliveries',
+        sa.Column('installment_id', sa.Integer(), sa.ForeignKey('installments.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('due_date', sa.Date(), primary_key=True),
+        sa.Column('kind', sa.String(32), primary_key=True),
+        sa.Column('sent_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    """Drop the notification_deliveries ledger."""
+    op.drop_table('notification_deliveries')
@@ -0,0 +1,27 @@
+"""Add users.timezone for reminder send times
+
+Revision ID: e41f0d7c9a52
+Revises: b3a9c6d2e815
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41f0d7c9a52'
+down_revision: Union[str, None] = 'b3a9c6d2e815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add the nullable users.timezone column."""
+    op.add_column('users', sa.Column('timezone', sa.String(64), nullable=True))
+
+
+def downgrade() -> None:
+    """Drop users.timezone."""
+    op.drop_column('users', 'timezone')
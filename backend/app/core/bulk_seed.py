@@ -0,0 +1,321 @@
+"""
+Generate production-scale synthetic data: customers, installments with
+varied products, periods and due days, and payment histories that add up to
+each installment's remaining_amount and due_date exactly as the API would
+have left them.
+
+Rows are bulk loaded with COPY (or pipelined executemany) by parallel
+worker processes. The data depends only on --seed and --as-of (not on the
+number of workers), so a run can be reproduced. Afterwards the sequences
+are moved past the loaded ids, the tables analyzed, and the report rollups,
+aging snapshot and Redis due index rebuilt. Usage:
+
+    python -m app.core.bulk_seed --users 500000 --installments 1500000 --reset
+
+An installment gets six or seven payments on average, so the example
+above loads roughly ten million payments.
+"""
+import argparse
+import asyncio
+import bisect
+import calendar
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from multiprocessing import get_context
+from typing import List, Optional, Tuple
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from app.core.cache import cache
+from app.core.client import QUEUE, close_redis_pools, get_redis
+from app.core.database import AsyncSessionLocal, async_engine, get_async_database_url
+from app.core.security import PRINCIPAL_CACHE_NAMESPACE, get_password_hash
+from app.core.seed import seed_products
+from app.services import aging, due_index, report_cache, rollups
+
+SEED_DOMAIN = "seed.example.com"
+SEED_PASSWORD = "seed-password"
+
+# Installments generated (and committed) per unit of work
+PARTITION_SIZE = 20_000
+
+FIRST_NAMES = ["Ayesha", "Rahim", "Karim", "Nusrat", "Tanvir", "Farhana", "Imran", "Sadia", "Arif", "Mim",
+               "Hasan", "Jannat", "Rafi", "Tania", "Sakib", "Nadia", "Fahim", "Sumaiya", "Rakib", "Lamia"]
+LAST_NAMES = ["Rahman", "Hossain", "Islam", "Ahmed", "Chowdhury", "Khan", "Akter", "Uddin", "Sarkar", "Das"]
+
+# (value, weight) distributions
+TIMEZONES = [("Asia/Dhaka", 70), (None, 15), ("UTC", 5), ("Europe/London", 4), ("Asia/Dubai", 3), ("America/New_York", 3)]
+PERIODS = [(3, 20), (6, 30), (9, 10), (12, 40)]
+
+# Share of customers who pay on time, pay late, or stop paying (percent)
+ON_TIME, LATE = 70, 90
+
+INSTALLMENT_COLUMNS = ["id", "user_id", "product_id", "total_amount", "installment_amount",
+                       "remaining_amount", "due_date", "created_at"]
+PAYMENT_COLUMNS = ["installment_id", "amount", "payment_date"]
+
+
+class _Choice:
+    """Weighted choice by bisecting cumulative weights (cheaper than random.choices per call)"""
+
+    def __init__(self, weighted: List[Tuple[object, float]]):
+        self.values = [value for value, _ in weighted]
+        self.cumulative = []
+        total = 0.0
+        for _, weight in weighted:
+            total += weight
+            self.cumulative.append(total)
+        self.total = total
+
+    def pick(self, rng: random.Random):
+        return self.values[bisect.bisect_right(self.cumulative, rng.random() * self.total)]
+
+
+def _dsn() -> str:
+    """asyncpg DSN for the configured database"""
+    return make_url(get_async_database_url()).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def _behaviour(user_id: int) -> int:
+    """Stable 0-99 payment behaviour score of a customer (below ON_TIME pays on time, ...)"""
+    return (user_id * 2654435761 >> 7) % 100
+
+
+def _next_due(due: date, day: int) -> date:
+    # Same as adding relativedelta(months=1): the day is clamped to the month's length
+    year, month = (due.year + 1, 1) if due.month == 12 else (due.year, due.month + 1)
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def generate_partition(
+    seed: int,
+    partition: int,
+    first_index: int,
+    count: int,
+    installment_base: int,
+    user_base: int,
+    users: int,
+    products: List[Tuple[int, int]],
+    as_of: datetime,
+    history_days: int,
+) -> Tuple[list, list]:
+    """Installment and payment rows of one partition, from its own deterministic generator"""
+    rng = random.Random(f"{seed}:{partition}")
+    periods = _Choice(PERIODS)
+    # A few products sell far more than the rest
+    product_choice = _Choice([(product, 1 / (rank + 1)) for rank, product in enumerate(products)])
+    history_seconds = history_days * 86400
+    utc = timezone.utc
+
+    installments, payments = [], []
+    for index in range(first_index, first_index + count):
+        installment_id = installment_base + index + 1
+        # Older customers (lower ids) hold more installments
+        user_id = user_base + 1 + int(users * rng.random() ** 1.5)
+        product_id, price = product_choice.pick(rng)
+        period = periods.pick(rng)
+        due_day = rng.randint(1, 28) if rng.random() < 0.9 else rng.randint(29, 31)
+        created_at = as_of - timedelta(seconds=rng.random() * history_seconds)
+
+        remaining = price
+        if rng.random() < 0.4:
+            initial = int(price * rng.uniform(0.1, 0.3))
+            payments.append((installment_id, initial, created_at))
+            remaining -= initial
+        monthly = math.ceil(remaining / period)
+
+        # The first due date falls in the creation month (Installment.create_due_date)
+        due = date(created_at.year, created_at.month,
+                   min(due_day, calendar.monthrange(created_at.year, created_at.month)[1]))
+        behaviour = _behaviour(user_id)
+        if behaviour < ON_TIME:
+            max_paid, delays = period, (-5, 0)
+        elif behaviour < LATE:
+            max_paid, delays = period, (0, 25)
+        else:
+            max_paid, delays = rng.randint(0, period - 1), (-2, 15)
+
+        paid = 0
+        while remaining > 0 and paid < max_paid:
+            paid_at = datetime(due.year, due.month, due.day, tzinfo=utc) + timedelta(
+                days=rng.randint(*delays), seconds=rng.randrange(86400)
+            )
+            if paid_at < created_at:
+                paid_at = created_at + timedelta(seconds=rng.randrange(86400))
+            if paid_at > as_of:
+                break
+            amount = min(monthly, remaining)
+            payments.append((installment_id, amount, paid_at))
+            remaining -= amount
+            paid += 1
+            # Posting a payment moves the due date on, unless it was the last one
+            if remaining > 0:
+                due = _next_due(due, due_day)
+
+        installments.append((installment_id, user_id, product_id, price, monthly, remaining, due, created_at))
+    return installments, payments
+
+
+async def _load_rows(connection, table: str, columns: List[str], rows: list, method: str, batch_size: int) -> None:
+    if method == "copy":
+        await connection.copy_records_to_table(table, records=rows, columns=columns)
+        return
+    placeholders = ", ".join(f"${position}" for position in range(1, len(columns) + 1))
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    async with connection.transaction():
+        for start in range(0, len(rows), batch_size):
+            await connection.executemany(statement, rows[start:start + batch_size])
+
+
+async def _load_partition_async(task: dict) -> Tuple[int, int]:
+    installments, payments = generate_partition(**task["generate"])
+    connection = await asyncpg.connect(task["dsn"])
+    try:
+        async with connection.transaction():
+            await _load_rows(connection, "installments", INSTALLMENT_COLUMNS, installments, task["method"], task["batch_size"])
+            await _load_rows(connection, "payments", PAYMENT_COLUMNS, payments, task["method"], task["batch_size"])
+    finally:
+        await connection.close()
+    return len(installments), len(payments)
+
+
+def load_partition(task: dict) -> Tuple[int, int]:
+    """Generate and load one partition (runs in a worker process)"""
+    return asyncio.run(_load_partition_async(task))
+
+
+def generate_users(seed: int, user_base: int, users: int, password_hash: str) -> list:
+    rng = random.Random(f"{seed}:users")
+    zones = _Choice(TIMEZONES)
+    rows = []
+    for user_id in range(user_base + 1, user_base + users + 1):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        rows.append((user_id, name, f"customer{user_id}@{SEED_DOMAIN}", password_hash,
+                     "CUSTOMER", rng.random() < 0.95, zones.pick(rng)))
+    return rows
+
+
+async def prepare(args) -> Tuple[int, int, List[Tuple[int, int]]]:
+    """Optionally clear existing data; returns the user and installment id bases and the products"""
+    await seed_products()
+    connection = await asyncpg.connect(_dsn())
+    try:
+        if args.reset:
+            await connection.execute(
+                "TRUNCATE payments, notification_deliveries, installments, aging_customer_snapshots, "
+                "aging_bucket_snapshots, payments_daily, dues_daily"
+            )
+            await connection.execute("DELETE FROM users WHERE role <> 'ADMIN'")
+        user_base = await connection.fetchval("SELECT COALESCE(MAX(id), 0) FROM users")
+        installment_base = await connection.fetchval("SELECT COALESCE(MAX(id), 0) FROM installments")
+        products = [tuple(row) for row in await connection.fetch("SELECT id, price FROM products ORDER BY id")]
+    finally:
+        await connection.close()
+    return user_base, installment_base, products
+
+
+async def load_users(args, user_base: int) -> int:
+    # bcrypt is slow on purpose; every generated customer shares one hash
+    rows = generate_users(args.seed, user_base, args.users, get_password_hash(SEED_PASSWORD))
+    connection = await asyncpg.connect(_dsn())
+    try:
+        await _load_rows(connection, "users", ["id", "name", "email", "hashed_password", "role", "is_verified", "timezone"],
+                         rows, args.method, args.batch_size)
+    finally:
+        await connection.close()
+    return len(rows)
+
+
+async def finish() -> dict:
+    """Move sequences past the loaded ids, analyze, and rebuild the derived data"""
+    connection = await asyncpg.connect(_dsn())
+    try:
+        for table in ("users", "installments"):
+            await connection.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {table}))"
+            )
+        await connection.execute("ANALYZE users, installments, payments")
+    finally:
+        await connection.close()
+
+    async with AsyncSessionLocal() as db:
+        summary = {"rollups": await rollups.rebuild_rollups(db), "aging": await aging.rebuild_snapshot(db)}
+        try:
+            summary["due_index"] = await due_index.rebuild(db, get_redis(QUEUE))
+        except Exception as e:
+            summary["due_index"] = f"skipped ({e})"
+    # Reports, the aging summary and (after --reset) users changed underneath the cache
+    await cache.invalidate(report_cache.NAMESPACE, aging.CACHE_NAMESPACE, PRINCIPAL_CACHE_NAMESPACE)
+    await close_redis_pools()
+    await async_engine.dispose()
+    return summary
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--installments", type=int, default=15_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--as-of", type=date.fromisoformat, default=date.today(),
+                        help="Day the history ends (YYYY-MM-DD); fix it to reproduce a dataset exactly")
+    parser.add_argument("--history-days", type=int, default=730, help="How far back installments were created")
+    parser.add_argument("--method", choices=["copy", "executemany"], default="copy")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Rows per executemany call")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Parallel loading processes")
+    parser.add_argument("--reset", action="store_true",
+                        help="Delete all customers, installments, payments and derived data first")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    user_base, installment_base, products = asyncio.run(prepare(args))
+    if not products:
+        parser.error("No products to sell")
+    users = asyncio.run(load_users(args, user_base))
+    print(f"Loaded {users} users in {time.perf_counter() - started:.1f}s")
+
+    as_of = datetime.combine(args.as_of, datetime.max.time(), tzinfo=timezone.utc).replace(microsecond=0)
+    tasks = [
+        {
+            "dsn": _dsn(),
+            "method": args.method,
+            "batch_size": args.batch_size,
+            "generate": {
+                "seed": args.seed,
+                "partition": partition,
+                "first_index": first_index,
+                "count": min(PARTITION_SIZE, args.installments - first_index),
+                "installment_base": installment_base,
+                "user_base": user_base,
+                "users": args.users,
+                "products": products,
+                "as_of": as_of,
+                "history_days": args.history_days,
+            },
+        }
+        for partition, first_index in enumerate(range(0, args.installments, PARTITION_SIZE))
+    ]
+
+    loading = time.perf_counter()
+    installments = payments = 0
+    # Spawned workers start without the parent's engine and connections
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=get_context("spawn")) as pool:
+        for done, (partition_installments, partition_payments) in enumerate(pool.map(load_partition, tasks), 1):
+            installments += partition_installments
+            payments += partition_payments
+            elapsed = time.perf_counter() - loading
+            print(f"[{done}/{len(tasks)}] {installments} installments, {payments} payments "
+                  f"({payments / elapsed:,.0f} payments/sec)")
+
+    summary = asyncio.run(finish())
+    print(f"Rebuilt derived data: {summary}")
+    print(f"Done in {time.perf_counter() - started:.1f}s: {users} users, {installments} installments, "
+          f"{payments} payments (seed={args.seed}, as of {args.as_of})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from fastapi.encoders import jsonable_encoder
+
+from app.core import metrics
+from app.core.client import CACHE, get_redis
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Two-tier cache for hot reads:
+# - local: an LRU of decoded values in each process, kept for at most
+#   CACHE_LOCAL_TTL seconds and only used while the process listens for
+#   invalidations;
+# - Redis (cache pool): the JSON values, shared by every web and Celery worker.
+#
+# Entries carry tags, their namespace always being one of them. Each tag has a
+# random version in Redis, and an entry records the versions its tags had when
+# its computation started: a read that finds a different version treats the
+# entry as a miss. Invalidating a tag is therefore one write however many
+# entries carry it, a value computed while its tag was invalidated is never
+# served, and an evicted version invalidates its entries instead of reviving
+# them. Invalidations are published on CACHE_CHANNEL so that every process
+# drops its local copies as well.
+
+KEY_PREFIX = "cache"
+
+_MISSING = object()
+
+
+def _entry_key(key: str) -> str:
+    return f"{KEY_PREFIX}:entry:{key}"
+
+
+def _tag_key(tag: str) -> str:
+    return f"{KEY_PREFIX}:tag:{tag}"
+
+
+def _new_version() -> str:
+    return uuid.uuid4().hex
+
+
+class LocalCache:
+    """Per-process LRU of decoded values with an expiry per entry, indexed by tag"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, Tuple[str, ...], Any]]" = OrderedDict()
+        self.tags: Dict[str, set] = {}
+        # Bumped by every invalidation; a value read or computed across one is not kept
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Any:
+        entry = self.entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires, _, value = entry
+        if expires <= time.monotonic():
+            self._remove(key)
+            return _MISSING
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, tags: Tuple[str, ...], ttl: float) -> None:
+        if self.max_entries <= 0 or ttl <= 0:
+            return
+        self._remove(key)
+        self.entries[key] = (time.monotonic() + ttl, tags, value)
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def invalidate(self, tags: Iterable[str]) -> None:
+        self.generation += 1
+        for tag in tags:
+            for key in list(self.tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.entries.clear()
+        self.tags.clear()
+
+
+async def _read(redis, key: str, tags: Tuple[str, ...]) -> Tuple[Any, List[Optional[str]]]:
+    """The cached value (or _MISSING) and the current versions of its tags, in one round trip"""
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.get(_entry_key(key))
+    pipeline.mget([_tag_key(tag) for tag in tags])
+    payload, versions = await pipeline.execute()
+    if payload is not None and None not in versions:
+        entry = json.loads(payload)
+        if entry["t"] == versions:
+            return entry["v"], versions
+    return _MISSING, versions
+
+
+async def _initialise_versions(redis, tags: Tuple[str, ...], versions: List[Optional[str]]) -> List[str]:
+    """Give the tags without a version (never invalidated, or evicted) one"""
+    missing = [tag for tag, version in zip(tags, versions) if version is None]
+    if not missing:
+        return versions
+    pipeline = redis.pipeline(transaction=False)
+    for tag in missing:
+        pipeline.set(_tag_key(tag), _new_version(), nx=True)
+    pipeline.mget([_tag_key(tag) for tag in tags])
+    return (await pipeline.execute())[-1]
+
+
+async def _release(redis, lock_key: str, token: str) -> None:
+    try:
+        # Only release the lock if it is still ours
+        if await redis.get(lock_key) == token:
+            await redis.delete(lock_key)
+    except Exception:
+        pass
+
+
+class Cache:
+    """The process's two-tier cache; use the module's `cache` instance or `cached`"""
+
+    def __init__(self):
+        self.local = LocalCache(settings.CACHE_LOCAL_MAX_ENTRIES)
+        # Set while the invalidation listener is subscribed; the local tier is unused otherwise
+        self.listening = False
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    async def get_or_compute(
+        self,
+        namespace: str,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[int] = None,
+        tags: Iterable[str] = (),
+        local_ttl: Optional[float] = None,
+    ) -> Any:
+        """
+        Return the cached value of namespace:key, computing it on a miss.
+
+        Values are returned in their JSON form (as jsonable_encoder makes it),
+        on a miss too, and are shared between callers, who must not modify
+        them. ttl (seconds, None = no expiry) applies in Redis; the local tier
+        keeps a value for at most local_ttl (default CACHE_LOCAL_TTL, 0 = Redis
+        only). Concurrent misses compute a key once: callers in one process
+        wait for the first one's result, and other processes wait for the
+        holder of a Redis lock. If Redis is unavailable the value is computed
+        directly.
+        """
+        full_key = f"{namespace}:{key}"
+        tags = tuple(sorted({namespace, *tags}))
+        if self.listening:
+            value = self.local.get(full_key)
+            if value is not _MISSING:
+                metrics.cache_requests.inc(namespace=namespace, result="local_hit")
+                return value
+
+        loop = asyncio.get_running_loop()
+        while True:
+            future = self._inflight.get(full_key)
+            if future is None or future.get_loop() is not loop:
+                break
+            try:
+                value = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    # The computing caller was cancelled, not this one; take over
+                    continue
+                raise
+            metrics.cache_requests.inc(namespace=namespace, result="coalesced")
+            return value
+
+        future = self._inflight[full_key] = loop.create_future()
+        try:
+            value = await self._load(namespace, full_key, compute, ttl, tags, local_ttl)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved, so it is not logged when no other caller waited on it
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(full_key) is future:
+                del self._inflight[full_key]
+
+    async def _load(
+        self,
+        namespace: str,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[int],
+        tags: Tuple[str, ...],
+        local_ttl: Optional[float],
+    ) -> Any:
+        generation = self.local.generation
+        try:
+            redis = get_redis(CACHE)
+            value, versions = await _read(redis, key, tags)
+        except Exception as e:
+            logger.warning(f"Cache unavailable, computing {key} directly: {e}")
+            metrics.cache_requests.inc(namespace=namespace, result="error")
+            return jsonable_encoder(await compute())
+        if value is not _MISSING:
+            metrics.cache_requests.inc(namespace=namespace, result="redis_hit")
+            self._keep_local(key, value, tags, ttl, local_ttl, generation)
+            return value
+
+        lock_key = f"{KEY_PREFIX}:lock:{key}"
+        token = uuid.uuid4().hex
+        acquired = False
+        try:
+            try:
+                acquired = await redis.set(lock_key, token, nx=True, ex=settings.CACHE_LOCK_TIMEOUT)
+                if not acquired:
+                    # Another process is computing this key; wait for its result
+                    deadline = asyncio.get_running_loop().time() + settings.CACHE_LOCK_TIMEOUT
+                    while asyncio.get_running_loop().time() < deadline:
+                        await asyncio.sleep(0.05)
+                        value, versions = await _read(redis, key, tags)
+                        if value is not _MISSING:
+                            metrics.cache_requests.inc(namespace=namespace, result="coalesced")
+                            self._keep_local(key, value, tags, ttl, local_ttl, generation)
+                            return value
+                        if not await redis.exists(lock_key):
+                            break
+                versions = await _initialise_versions(redis, tags, versions)
+            except Exception as e:
+                logger.warning(f"Cache unavailable, computing {key} directly: {e}")
+                metrics.cache_requests.inc(namespace=namespace, result="error")
+                return jsonable_encoder(await compute())
+
+            metrics.cache_requests.inc(namespace=namespace, result="miss")
+            value = jsonable_encoder(await compute())
+            try:
+                # Stored with the versions read before computing: if one of its tags
+                # was invalidated meanwhile, the entry is never served
+                await redis.set(_entry_key(key), json.dumps({"t": versions, "v": value}), ex=ttl)
+            except Exception as e:
+                logger.warning(f"Failed to cache {key}: {e}")
+            self._keep_local(key, value, tags, ttl, local_ttl, generation)
+            return value
+        finally:
+            if acquired:
+                await _release(redis, lock_key, token)
+
+    def _keep_local(
+        self,
+        key: str,
+        value: Any,
+        tags: Tuple[str, ...],
+        ttl: Optional[int],
+        local_ttl: Optional[float],
+        generation: int,
+    ) -> None:
+        # An invalidation seen since the value was read may have been for it
+        if not self.listening or self.local.generation != generation:
+            return
+        local_ttl = settings.CACHE_LOCAL_TTL if local_ttl is None else local_ttl
+        self.local.set(key, value, tags, min(local_ttl, ttl) if ttl else local_ttl)
+
+    async def invalidate(self, *tags: str) -> None:
+        """
+        Drop every entry carrying one of the tags (a namespace drops all its
+        entries) in Redis and in the local tier of every process
+        """
+        tags = sorted(set(tags))
+        if not tags:
+            return
+        self._drop_local(tags, "local")
+        try:
+            pipeline = get_redis(CACHE).pipeline(transaction=False)
+            for tag in tags:
+                pipeline.set(_tag_key(tag), _new_version())
+            pipeline.publish(settings.CACHE_CHANNEL, json.dumps({"origin": metrics.PROCESS_ID, "tags": tags}))
+            await pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cache tags {tags}: {e}")
+
+    def _drop_local(self, tags: List[str], origin: str) -> None:
+        self.local.invalidate(tags)
+        metrics.cache_invalidations.inc(len(tags), origin=origin)
+
+    async def listen(self) -> None:
+        """
+        Apply the invalidations published by other processes to the local
+        tier, until cancelled. The local tier is only used while subscribed,
+        and starts empty on every (re)subscription, as messages sent before
+        it were missed.
+        """
+        delay = 1.0
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis(CACHE).pubsub()
+                await pubsub.subscribe(settings.CACHE_CHANNEL)
+                self.local.clear()
+                self.listening = True
+                delay = 1.0
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        self._apply(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener disconnected, retrying in {delay:.0f}s: {e}")
+            finally:
+                self.listening = False
+                self.local.clear()
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def _apply(self, data: str) -> None:
+        try:
+            message = json.loads(data)
+        except ValueError:
+            logger.warning(f"Ignoring malformed cache invalidation: {data!r}")
+            return
+        # This process already dropped its own invalidations
+        if message.get("origin") != metrics.PROCESS_ID:
+            self._drop_local(message.get("tags", []), "remote")
+
+    def start_listener(self) -> None:
+        """Start listening for invalidations on the running loop (web app startup)"""
+        if self._listener is None:
+            self._listener = asyncio.get_running_loop().create_task(self.listen())
+
+    async def stop_listener(self) -> None:
+        """Stop the invalidation listener (web app shutdown)"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def record_metrics(self) -> None:
+        metrics.cache_local_entries.set(len(self.local))
+
+
+cache = Cache()
+
+_KEY_TYPES = (str, int, float, bool, type(None), date, datetime, Enum)
+
+
+def _key_part(value: Any) -> str:
+    if isinstance(value, Enum):
+        value = value.value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def cached(
+    namespace: str,
+    ttl: Optional[int] = None,
+    key: Optional[Callable[..., str]] = None,
+    tags: Union[Iterable[str], Callable[..., Iterable[str]]] = (),
+    local_ttl: Optional[float] = None,
+):
+    """
+    Cache an async function's result, e.g. an endpoint or a service read (see
+    Cache.get_or_compute for how values are returned and kept).
+
+    The key is built from the arguments of simple types (str, numbers, bool,
+    None, dates, enums) by name; others, such as sessions or requests, are
+    left out. Pass key (called with the arguments by name) when that does not
+    identify the result. tags are extra tags, or a function of the arguments
+    returning them.
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        signature = inspect.signature(func)
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+            if key is not None:
+                entry_key = f"{name}:{key(**arguments)}"
+            else:
+                entry_key = ":".join([name] + [
+                    f"{argument}={_key_part(value)}"
+                    for argument, value in arguments.items()
+                    if isinstance(value, _KEY_TYPES)
+                ])
+            entry_tags = tags(**arguments) if callable(tags) else tags
+            return await cache.get_or_compute(
+                namespace, entry_key, lambda: func(*args, **kwargs), ttl, entry_tags, local_ttl
+            )
+
+        return wrapper
+
+    return decorator
+
+
+def _reset_after_fork() -> None:
+    # A forked child (web worker, Celery prefork) starts with an empty local tier and no listener
+    cache.local = LocalCache(settings.CACHE_LOCAL_MAX_ENTRIES)
+    cache.listening = False
+    cache._inflight = {}
+    cache._listener = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+metrics.add_collector(cache.record_metrics)
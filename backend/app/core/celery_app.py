@@ -9,6 +9,8 @@ app = Celery(
     backend=settings.REDIS_URL_QUEUE,
     include=[
         "app.tasks.notification",
+        "app.tasks.reports",
+        "app.tasks.exports",
         # Add other task modules here as needed
     ]
 )
@@ -22,6 +24,15 @@ app.conf.update(
     enable_utc=True,
     beat_schedule=beat_schedule,
     task_routes=task_routes,
+    # Tasks are I/O-bound coroutines on the worker's shared event loop (see
+    # app.tasks.base); the thread pool lets many of them wait concurrently
+    worker_pool=settings.WORKER_POOL,
+    worker_concurrency=settings.WORKER_CONCURRENCY,
+    worker_prefetch_multiplier=settings.WORKER_PREFETCH_MULTIPLIER,
+    # Redeliver tasks whose worker died mid-run; the reminder tasks are safe to
+    # repeat thanks to the delivery ledger
+    task_acks_late=settings.TASK_ACKS_LATE,
+    task_reject_on_worker_lost=settings.TASK_ACKS_LATE,
 )
 
 # Optional: Configure task-specific settings
@@ -1,20 +1,72 @@
+from datetime import timedelta
+
 from celery.schedules import crontab
 
+from app.core.config import settings
+
 # Celery Beat schedule configuration
 beat_schedule = {
-    # Send notifications for installments due tomorrow - runs daily at 9:00 AM
-    'daily-tomorrow-due-notifications': {
+    # Queue reminders for installments due tomorrow at each customer's local send
+    # time - runs hourly, so new installments are picked up the same day
+    'hourly-tomorrow-due-notifications': {
         'task': 'check_tomorrow_due_installments',
-        'schedule': crontab(hour=9, minute=0),
+        'schedule': crontab(minute=0),
         'options': {
             'expires': 3600,  # Task expires after 1 hour
         },
     },
     
-    # Send notifications for installments due in 3 days - runs daily at 10:00 AM
-    'daily-upcoming-due-notifications': {
+    # Queue reminders for installments due in 3 days - runs hourly
+    'hourly-upcoming-due-notifications': {
         'task': 'check_upcoming_due_installments',
-        'schedule': crontab(hour=10, minute=0),
+        'schedule': crontab(minute=30),
+        'options': {
+            'expires': 3600,  # Task expires after 1 hour
+        },
+    },
+    
+    # Rebuild the Redis due index from Postgres to repair drift - runs hourly,
+    # ahead of the reminder planners
+    'hourly-due-index-reconcile': {
+        'task': 'reconcile_due_index',
+        'schedule': crontab(minute=50),
+        'options': {
+            'expires': 3600,  # Task expires after 1 hour
+        },
+    },
+    
+    # Send the queued reminders whose send time has come - runs every few minutes
+    'drain-due-reminders': {
+        'task': 'drain_due_reminders',
+        'schedule': timedelta(minutes=settings.REMINDER_DRAIN_INTERVAL_MINUTES),
+        'options': {
+            'expires': settings.REMINDER_DRAIN_INTERVAL_MINUTES * 60,  # Next run takes over
+        },
+    },
+    
+    # Snapshot the aging report for instant reads - runs daily just after midnight UTC
+    'daily-aging-snapshot': {
+        'task': 'refresh_aging_snapshot',
+        'schedule': crontab(hour=0, minute=5),
+        'options': {
+            'expires': 3600,  # Task expires after 1 hour
+        },
+    },
+    
+    # Delete export files past EXPORT_RETENTION_HOURS - runs hourly
+    'hourly-export-cleanup': {
+        'task': 'purge_expired_exports',
+        'schedule': crontab(minute=15),
+        'options': {
+            'expires': 3600,  # Task expires after 1 hour
+        },
+    },
+    
+    # Compare the report rollups with the raw tables and repair drift - runs daily at 2:00 AM
+    'daily-report-rollup-verification': {
+        'task': 'verify_report_rollups',
+        'schedule': crontab(hour=2, minute=0),
+        'kwargs': {'repair': True},
         'options': {
             'expires': 3600,  # Task expires after 1 hour
         },
@@ -23,8 +75,19 @@ beat_schedule = {
 
 # Task routing configuration
 task_routes = {
-    'app.tasks.notification.send_due_notification': {'queue': 'notifications'},
-    'app.tasks.notification.send_all_due_notifications': {'queue': 'notifications'},
-    'app.tasks.notification.check_tomorrow_due_installments': {'queue': 'notifications'},
-    'app.tasks.notification.check_upcoming_due_installments': {'queue': 'notifications'},
+    # Keys are the registered task names (the tasks use explicit name=...)
+    'send_due_notification': {'queue': 'notifications'},
+    'send_all_due_notifications': {'queue': 'notifications'},
+    'send_due_notification_chunk': {'queue': 'notifications'},
+    'summarize_due_notifications': {'queue': 'notifications'},
+    'check_tomorrow_due_installments': {'queue': 'notifications'},
+    'check_upcoming_due_installments': {'queue': 'notifications'},
+    'schedule_due_reminders': {'queue': 'notifications'},
+    'drain_due_reminders': {'queue': 'notifications'},
+    'reconcile_due_index': {'queue': 'notifications'},
+    'reconcile_report_rollups': {'queue': 'reports'},
+    'verify_report_rollups': {'queue': 'reports'},
+    'export_payments_report': {'queue': 'reports'},
+    'purge_expired_exports': {'queue': 'reports'},
+    'refresh_aging_snapshot': {'queue': 'reports'},
 }
@@ -1,29 +1,172 @@
-from typing import Optional
-from redis.asyncio import Redis
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.asyncio.client import Pipeline
+from app.core import metrics, tracing
+from app.core.config import settings
 
-# Create Redis client instance
-redis_client: Optional[Redis] = None
+logger = logging.getLogger(__name__)
 
-async def get_redis_client(url) -> Redis:
+
+class TracedPipeline(Pipeline):
+    """Pipeline whose round trip is timed per pool and recorded as one span inside a sampled trace"""
+
+    pool_name = "other"
+
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            with tracing.span("redis.pipeline", tracing.KIND_CLIENT, **{
+                "db.system": "redis", "db.redis.commands": len(self.command_stack),
+            }):
+                return await super().execute(raise_on_error)
+        finally:
+            metrics.redis_command_duration.observe(
+                time.perf_counter() - started, pool=self.pool_name, command="PIPELINE"
+            )
+
+
+class TracedRedis(Redis):
     """
-    Get or create Redis client instance.
-    Returns a singleton Redis client.
+    Redis client that times each command per pool and records it as a span
+    inside a sampled trace
     """
-    global redis_client
-    if redis_client is None:
-        redis_client = Redis.from_url(
-            url=url,
-            encoding="utf-8",
-            decode_responses=True
-        )
-    return redis_client
 
-async def close_redis_connection():
-    """Close Redis connection when application shuts down"""
-    global redis_client
-    if redis_client is not None:
-        await redis_client.close()
-        redis_client = None
+    # Set by RedisManager to the name of the client's pool
+    pool_name = "other"
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            with tracing.span(f"redis {args[0]}", tracing.KIND_CLIENT, **{"db.system": "redis"}):
+                return await super().execute_command(*args, **options)
+        finally:
+            metrics.redis_command_duration.observe(
+                time.perf_counter() - started, pool=self.pool_name, command=str(args[0]).upper()
+            )
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> TracedPipeline:
+        pipeline = TracedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipeline.pool_name = self.pool_name
+        return pipeline
+
+
+# Named connection pools. Every Redis caller in the web app and the Celery
+# workers gets its client here (the Celery broker connection is Celery's own):
+# - cache: OTPs, report cache, profiling toggles (REDIS_URL_CACHE)
+# - rate_limit: the rate limiter, on its own pool so a burst of traffic cannot
+#   starve the other cache callers (REDIS_URL_RATE_LIMIT, default the cache URL)
+# - queue: due index and reminder due-queue (REDIS_URL_QUEUE, does not evict keys)
+CACHE = "cache"
+RATE_LIMIT = "rate_limit"
+QUEUE = "queue"
+POOLS = (CACHE, RATE_LIMIT, QUEUE)
+
+
+def _pool_config(name: str) -> Tuple[str, int]:
+    """URL and connection limit of a named pool"""
+    if name == CACHE:
+        return settings.REDIS_URL_CACHE, settings.REDIS_CACHE_MAX_CONNECTIONS
+    if name == RATE_LIMIT:
+        return settings.REDIS_URL_RATE_LIMIT or settings.REDIS_URL_CACHE, settings.REDIS_RATE_LIMIT_MAX_CONNECTIONS
+    if name == QUEUE:
+        return settings.REDIS_URL_QUEUE, settings.REDIS_QUEUE_MAX_CONNECTIONS
+    raise ValueError(f"Unknown Redis pool: {name}")
+
+
+class RedisManager:
+    """
+    The process's named Redis pools, created for the running event loop
+    (their connections belong to it). Each pool is bounded: once it has
+    max connections, a caller waits up to REDIS_POOL_TIMEOUT for a free one.
+    """
+
+    def __init__(self):
+        self.clients: Dict[str, TracedRedis] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get(self, name: str) -> TracedRedis:
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # Pools of a previous, closed loop can be neither reused nor closed
+            self.clients = {}
+            self.loop = loop
+        client = self.clients.get(name)
+        if client is None:
+            url, max_connections = _pool_config(name)
+            pool = BlockingConnectionPool.from_url(
+                url,
+                max_connections=max_connections,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                # A connection idle for longer is PINGed before reuse, so dropped ones are replaced
+                health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+                encoding="utf-8",
+                decode_responses=True,
+            )
+            client = self.clients[name] = TracedRedis(connection_pool=pool)
+            client.pool_name = name
+        return client
+
+    def open(self) -> None:
+        """Create every pool (connections are opened on first use)"""
+        for name in POOLS:
+            self.get(name)
+
+    async def close(self) -> None:
+        """Disconnect every pool of the running loop"""
+        if self.loop is asyncio.get_running_loop():
+            for name, client in self.clients.items():
+                try:
+                    await client.connection_pool.disconnect()
+                except Exception as e:
+                    logger.warning(f"Failed to close Redis pool {name}: {e}")
+        self.clients = {}
+        self.loop = None
+
+    async def check_health(self, timeout: float = 1.0) -> Dict[str, Optional[float]]:
+        """PING round-trip time (seconds) of each pool, or None when it did not answer in time"""
+        health = {}
+        for name in POOLS:
+            try:
+                started = time.perf_counter()
+                await asyncio.wait_for(self.get(name).ping(), timeout)
+                health[name] = time.perf_counter() - started
+            except Exception:
+                health[name] = None
+        return health
+
+    def record_metrics(self) -> None:
+        """Publish each pool's connection counts as per-process gauges"""
+        for name, client in list(self.clients.items()):
+            pool = client.connection_pool
+            metrics.redis_pool_connections.set(pool.max_connections, pool=name, state="max")
+            metrics.redis_pool_connections.set(len(pool._in_use_connections), pool=name, state="in_use")
+            idle = sum(1 for connection in pool._available_connections if connection.is_connected)
+            metrics.redis_pool_connections.set(idle, pool=name, state="idle")
+
+
+redis_manager = RedisManager()
+
+
+def get_redis(name: str = CACHE) -> TracedRedis:
+    """The shared client of a named pool, for the running event loop"""
+    return redis_manager.get(name)
+
+
+async def close_redis_pools() -> None:
+    """Close every Redis pool (on app or worker shutdown)"""
+    await redis_manager.close()
 
 
+def _reset_after_fork() -> None:
+    # A forked child (web worker, Celery prefork) opens its own connections
+    redis_manager.clients = {}
+    redis_manager.loop = None
 
+os.register_at_fork(after_in_child=_reset_after_fork)
+metrics.add_collector(redis_manager.record_metrics)
@@ -1,11 +1,16 @@
-from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import sessionmaker
 from .config import settings
-from typing import Generator, AsyncGenerator
+from . import metrics, query_stats, tracing
+from typing import AsyncGenerator, Optional
+import asyncio
+import logging
+import os
 import re
 
+logger = logging.getLogger(__name__)
 
 
 # Convert synchronous PostgreSQL URL to async format
@@ -16,16 +21,19 @@ def get_async_database_url() -> str:
         return re.sub(r'^postgresql:\/\/', 'postgresql+asyncpg://', db_url)
     return db_url
 
-# Print the database URL for debugging
-print(f"Database URL: {settings.DATABASE_URL}")
-print(f"Async Database URL: {get_async_database_url()}")
+# Log the database URL for debugging (without the password)
+logger.debug(f"Database URL: {make_url(get_async_database_url()).render_as_string(hide_password=True)}")
 
 # Create async SQLAlchemy engine
 async_engine = create_async_engine(
     url=get_async_database_url(),
     echo=False,  # Set to True for SQL query logging
     future=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
 )
+query_stats.instrument_engine(async_engine)
+tracing.instrument_engine(async_engine)
 
 # Create async session factory
 AsyncSessionLocal = sessionmaker(
@@ -36,9 +44,21 @@ AsyncSessionLocal = sessionmaker(
     autoflush=False,
 )
 
-# Create synchronous SQLAlchemy engine for backward compatibility
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Bounds the extra connections fetch_concurrently holds across the process,
+# created on first use in the running loop
+_fanout_slots: Optional[asyncio.Semaphore] = None
+_fanout_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _reset_after_fork() -> None:
+    # A forked child (web worker, Celery prefork) opens its own connections and
+    # must not close the parent's sockets
+    global _fanout_slots, _fanout_loop
+    async_engine.sync_engine.dispose(close=False)
+    _fanout_slots = _fanout_loop = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 # Create base class for models
 Base = declarative_base()
@@ -55,17 +75,93 @@ async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
         finally:
             await session.close()
 
-# Synchronous dependency to get DB session (for backward compatibility)
-def get_db() -> Generator[Session, None, None]:
+def _get_fanout_slots() -> asyncio.Semaphore:
+    global _fanout_slots, _fanout_loop
+    loop = asyncio.get_running_loop()
+    if _fanout_slots is None or _fanout_loop is not loop:
+        _fanout_slots = asyncio.Semaphore(settings.DB_FANOUT_CONNECTIONS)
+        _fanout_loop = loop
+    return _fanout_slots
+
+# Run independent read statements concurrently
+async def fetch_concurrently(
+    *statements,
+    session: Optional[AsyncSession] = None,
+    timeout: Optional[float] = None,
+) -> list:
     """
-    Dependency function that yields a SQLAlchemy session
-    and ensures it's closed after use
+    Execute independent read-only statements concurrently and return their
+    buffered results in the same order. Works for both Core and ORM select
+    statements.
+    
+    Pass the request's session to run the first statement on the connection
+    it already holds. The others each take a session and pooled connection of
+    their own, at most settings.DB_FANOUT_CONNECTIONS across the process at
+    once; when none is free they run one after another on the given session
+    (or wait for a slot without one), so under load the fan-out degrades to
+    sequential queries instead of exhausting the pool.
+    
+    All statements share one deadline (settings.DB_FANOUT_TIMEOUT by default);
+    if it expires the outstanding queries are cancelled and asyncio.TimeoutError
+    is raised. The statements do not share a transaction, so only use this for
+    reads that do not need a consistent snapshot across each other.
     """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    slots = _get_fanout_slots()
+    
+    async def run_on(target: AsyncSession, statement):
+        result = await target.execute(statement)
+        # Buffer all rows (and ORM objects) so they outlive the session
+        return result.freeze()()
+    
+    async def run_on_own_session(statement):
+        async with AsyncSessionLocal() as own_session:
+            return await run_on(own_session, statement)
+    
+    async def run_in_slot(statement):
+        async with slots:
+            return await run_on_own_session(statement)
+    
+    async def run_in_turn(statements):
+        return [await run_on(session, statement) for statement in statements]
+    
+    async def fan_out() -> list:
+        if session is None:
+            return await asyncio.gather(*(run_in_slot(statement) for statement in statements))
+        # Take the free slots without yielding, so the count is still right
+        # when they are used; everything else runs on the given session
+        on_session, on_own = [], []
+        try:
+            for index, statement in enumerate(statements):
+                if index == 0 or slots.locked():
+                    on_session.append(index)
+                else:
+                    await slots.acquire()  # a slot is free, so this returns at once
+                    on_own.append(index)
+            gathered = await asyncio.gather(
+                run_in_turn([statements[index] for index in on_session]),
+                *(run_on_own_session(statements[index]) for index in on_own),
+            )
+        finally:
+            for _ in on_own:
+                slots.release()
+        results = [None] * len(statements)
+        for index, result in zip(on_session + on_own, gathered[0] + gathered[1:]):
+            results[index] = result
+        return results
+    
+    if timeout is None:
+        timeout = settings.DB_FANOUT_TIMEOUT
+    return await asyncio.wait_for(fan_out(), timeout=timeout)
+
+def record_pool_metrics(engine, pool_name: str) -> None:
+    """Publish an engine's connection pool state as per-process gauges"""
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return  # NullPool and friends keep no connections
+    metrics.db_pool_connections.set(pool.size(), pool=pool_name, state="size")
+    metrics.db_pool_connections.set(pool.checkedout(), pool=pool_name, state="checked_out")
+    metrics.db_pool_connections.set(max(pool.overflow(), 0), pool=pool_name, state="overflow")
+    metrics.db_pool_connections.set(pool.checkedin(), pool=pool_name, state="idle")
 
 # Async function to create all tables in the database
 async def create_tables_async() -> None:
@@ -78,9 +174,4 @@ async def create_tables_async() -> None:
         # Create all tables
         await conn.run_sync(Base.metadata.create_all)
         
-        print("All tables created successfully!")
-
-# Function to create all tables in the database (synchronous version)
-def create_tables() -> None:
-    """Create all tables defined in models"""
-    Base.metadata.create_all(bind=engine)
+        logger.info("All tables created successfully")
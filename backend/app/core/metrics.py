@@ -0,0 +1,377 @@
+import bisect
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Process-local metrics exported in the Prometheus text format.
+# Every process (each uvicorn worker and each Celery worker process) records
+# into its own registry and periodically writes a snapshot file to
+# METRICS_DIR. /metrics merges the snapshots of all processes: counters and
+# histograms are summed, gauges keep a per-process label and are dropped once
+# their process stops refreshing them. Snapshots of finished processes
+# (replaced web workers, Celery children) are folded into one retired-totals
+# file and deleted, so counters stay monotonic while the directory stays small.
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+# Identifies this process's snapshot file and its gauge series
+PROCESS_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_metrics: Dict[str, "_Metric"] = {}
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.series: Dict[LabelKey, object] = {}
+        _metrics[name] = self
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with _lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A per-process value; the process label is added when exported"""
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with _lock:
+            self.series[_label_key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            series = self.series.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, the last one being +Inf, then sum
+                series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+
+# Web
+http_requests = Counter("http_requests_total", "HTTP requests by route template, method and status")
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency by route template and method")
+http_request_db_queries = Histogram(
+    "http_request_db_queries", "SQL statements per HTTP request by route template and method",
+    (0, 1, 2, 3, 5, 8, 13, 20, 50, 100),
+)
+rate_limit_decisions = Counter("rate_limit_decisions_total", "Rate limiter decisions by rule and decision (allow/deny)")
+db_pool_connections = Gauge("db_pool_connections", "Database pool connections by state (size/checked_out/overflow/idle)")
+redis_pool_connections = Gauge("redis_pool_connections", "Redis pool connections by pool and state (max/in_use/idle)")
+redis_command_duration = Histogram(
+    "redis_command_duration_seconds",
+    "Redis command latency (including the wait for a pool connection) by pool and command",
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Cache (app.core.cache)
+cache_requests = Counter(
+    "cache_requests_total", "Cache lookups by namespace and result (local_hit/redis_hit/coalesced/miss/error)"
+)
+cache_invalidations = Counter("cache_invalidations_total", "Tags dropped from the local cache tier by origin (local/remote)")
+cache_local_entries = Gauge("cache_local_entries", "Entries in the process's local cache tier")
+
+# Celery
+celery_tasks = Counter("celery_tasks_total", "Finished Celery tasks by task name and state")
+celery_task_duration = Histogram("celery_task_duration_seconds", "Celery task run time by task name", TASK_BUCKETS)
+
+
+def _reset_after_fork() -> None:
+    # A forked child (Celery prefork, gunicorn --preload) starts its own series and file
+    global PROCESS_ID, _last_flush, _written
+    PROCESS_ID = f"{socket.gethostname()}-{os.getpid()}"
+    _last_flush = 0.0
+    _written = False
+    for metric in _metrics.values():
+        metric.series.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _snapshot() -> dict:
+    with _lock:
+        return {
+            "process": PROCESS_ID,
+            "metrics": {
+                name: {
+                    "type": metric.type,
+                    "buckets": getattr(metric, "buckets", None),
+                    "series": [[list(map(list, key)), value] for key, value in metric.series.items()],
+                }
+                for name, metric in _metrics.items()
+                if metric.series
+            },
+        }
+
+
+_last_flush = 0.0
+_written = False
+_flush_lock = threading.Lock()
+_collectors: List[Callable[[], None]] = []
+
+
+def add_collector(collector: Callable[[], None]) -> None:
+    """Register a callback that refreshes gauges right before each snapshot"""
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def flush() -> None:
+    """Write this process's snapshot file (atomically, via a temporary file)"""
+    if not settings.METRICS_DIR:
+        return
+    with _flush_lock:
+        _write_snapshot()
+
+
+def _collect() -> None:
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            logger.warning(f"Metrics collector failed: {e}")
+
+
+def _write_snapshot() -> None:
+    global _last_flush, _written
+    _collect()
+    try:
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = os.path.join(settings.METRICS_DIR, f"{PROCESS_ID}.json")
+        if _written and not os.path.exists(path):
+            # Idle past METRICS_RETENTION, our totals were folded into the retired
+            # ones; start counting again from zero
+            with _lock:
+                for metric in _metrics.values():
+                    if metric.type != "gauge":
+                        metric.series.clear()
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(_snapshot(), f)
+        os.replace(f"{path}.tmp", path)
+        _last_flush = time.monotonic()
+        _written = True
+    except OSError as e:
+        logger.warning(f"Failed to write metrics snapshot: {e}")
+
+
+def maybe_flush() -> None:
+    """Flush at most once per METRICS_FLUSH_INTERVAL seconds"""
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+# Counters and histograms of finished processes, and the processes whose files
+# are being deleted (so a file left by an interrupted retirement is not counted twice)
+RETIRED_FILE = "retired.json"
+
+
+def _is_finished(process_id: str, age: float) -> bool:
+    """Whether the process that wrote a snapshot has exited (or, on another host, went silent)"""
+    host, _, pid = process_id.rpartition("-")
+    if host == socket.gethostname() and pid.isdigit():
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+    return age > settings.METRICS_RETENTION
+
+
+def _fold(totals: dict, snapshot_metrics: dict) -> None:
+    """Add a snapshot's counters and histograms to the retired totals"""
+    for name, data in snapshot_metrics.items():
+        if data["type"] == "gauge":
+            continue
+        target = totals.setdefault(name, {"type": data["type"], "buckets": data["buckets"], "series": []})
+        series = {tuple(map(tuple, labels)): value for labels, value in target["series"]}
+        for labels, value in data["series"]:
+            key = tuple(map(tuple, labels))
+            current = series.get(key)
+            if current is None:
+                series[key] = value
+            elif data["type"] == "histogram":
+                series[key] = [a + b for a, b in zip(current, value)]
+            else:
+                series[key] = current + value
+        target["series"] = [[list(map(list, key)), value] for key, value in series.items()]
+
+
+def _retire_finished() -> None:
+    """
+    Fold the snapshots of finished processes into RETIRED_FILE and delete
+    them. Runs in one scraping process at a time; the others skip it.
+    """
+    directory = settings.METRICS_DIR
+    with open(os.path.join(directory, ".retire.lock"), "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        retired_path = os.path.join(directory, RETIRED_FILE)
+        try:
+            with open(retired_path) as f:
+                retired = json.load(f)
+        except (OSError, ValueError):
+            retired = {"process": "retired", "metrics": {}, "retired": []}
+        already_folded = set(retired["retired"])
+
+        now = time.time()
+        finished, present = [], set()
+        for filename in os.listdir(directory):
+            if not filename.endswith(".json") or filename == RETIRED_FILE:
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+                age = now - os.path.getmtime(path)
+            except (OSError, ValueError):
+                continue
+            process = snapshot["process"]
+            if process in already_folded:
+                finished.append(path)
+                present.add(process)
+            elif _is_finished(process, age):
+                _fold(retired["metrics"], snapshot["metrics"])
+                finished.append(path)
+                present.add(process)
+        if not finished:
+            return
+
+        # Record the folded processes before deleting their files; ids are
+        # dropped once their files are gone
+        retired["retired"] = sorted(present)
+        with open(f"{retired_path}.tmp", "w") as f:
+            json.dump(retired, f)
+        os.replace(f"{retired_path}.tmp", retired_path)
+        for path in finished:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _load_snapshots() -> List[Tuple[dict, float]]:
+    """Every process's snapshot with its file age in seconds (just this process without METRICS_DIR)"""
+    if not settings.METRICS_DIR:
+        _collect()
+        return [(_snapshot(), 0.0)]
+    flush()
+    try:
+        _retire_finished()
+    except OSError as e:
+        logger.warning(f"Failed to retire finished metrics snapshots: {e}")
+    snapshots = []
+    now = time.time()
+    for filename in os.listdir(settings.METRICS_DIR):
+        if not filename.endswith(".json"):
+            continue
+        path = os.path.join(settings.METRICS_DIR, filename)
+        try:
+            with open(path) as f:
+                snapshots.append((json.load(f), now - os.path.getmtime(path)))
+        except (OSError, ValueError):
+            continue  # Replaced or removed while reading
+    return snapshots
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(extra_gauges: Optional[Dict[str, Tuple[str, Dict[LabelKey, float]]]] = None) -> str:
+    """
+    Merge all process snapshots into the Prometheus text format. extra_gauges
+    are cluster-wide values measured at scrape time: {name: (help, {labels: value})}.
+    """
+    merged: Dict[str, dict] = {}
+    for snapshot, age in _load_snapshots():
+        for name, data in snapshot["metrics"].items():
+            if data["type"] == "gauge" and age > settings.METRICS_GAUGE_TTL:
+                continue  # The process is gone or idle; its gauges are stale
+            target = merged.setdefault(name, {"type": data["type"], "buckets": data["buckets"], "series": {}})
+            for labels, value in data["series"]:
+                key = tuple(map(tuple, labels))
+                if data["type"] == "gauge":
+                    target["series"][key + (("process", snapshot["process"]),)] = value
+                elif data["type"] == "histogram":
+                    current = target["series"].get(key)
+                    target["series"][key] = value if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    target["series"][key] = target["series"].get(key, 0) + value
+
+    lines = []
+    for name in sorted(merged):
+        data = merged[name]
+        metric = _metrics.get(name)
+        lines.append(f"# HELP {name} {metric.help if metric else name}")
+        lines.append(f"# TYPE {name} {data['type']}")
+        for key in sorted(data["series"]):
+            value = data["series"][key]
+            if data["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(data["buckets"]) + ["+Inf"], value[:-1]):
+                cumulative += count
+                le = bound if bound == "+Inf" else _format_value(bound)
+                lines.append(f"{name}_bucket{_format_labels(key + (('le', str(le)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(key)} {cumulative}")
+
+    for name, (help, series) in sorted((extra_gauges or {}).items()):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for key in sorted(series):
+            lines.append(f"{name}{_format_labels(key)} {_format_value(series[key])}")
+
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,11 @@
+import logging
 import random
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from app.models.schemas import OTPResponse
-from .client import get_redis_client
-from .config import settings
+from .client import CACHE, get_redis
+
+logger = logging.getLogger(__name__)
 
 
 def generate_otp(length: int = 6) -> str:
@@ -15,15 +17,15 @@ def generate_otp(length: int = 6) -> str:
 async def save_otp_to_redis(email: str, otp: str, expiry_time: int) -> None:
     """Save the OTP to Redis with an expiry time."""
     try:
-        redis_client = await get_redis_client(settings.REDIS_URL_CACHE)
+        redis_client = get_redis(CACHE)
         # Set the OTP with an expiry time in seconds
         key_otp = f'otp:{email}'
         existing_otp = await redis_client.get(key_otp)
         if existing_otp:
-            print(f"OTP already exists for {email}. Overwriting...")
+            logger.debug(f"OTP already exists for {email}. Overwriting...")
         await redis_client.set(key_otp, otp, ex=expiry_time * 60)  # expiry_time in minutes
     except Exception as e:
-        print(f"Error saving OTP to Redis: {e}")
+        logger.error(f"Error saving OTP to Redis: {e}")
         raise
 
 async def create_otp(email: str, expiry_time: int = 5) -> OTPResponse:
@@ -38,7 +40,7 @@ async def verify_otp(email: str, otp: str) -> bool:
     """Verify the OTP against the one stored in Redis."""
     try:
         key_otp = f'otp:{email}'
-        redis_client = await get_redis_client(settings.REDIS_URL_CACHE)
+        redis_client = get_redis(CACHE)
         stored_otp = await redis_client.get(key_otp)
         if stored_otp is None:
             return False
@@ -49,6 +51,6 @@ async def verify_otp(email: str, otp: str) -> bool:
             
         return stored_otp == otp
     except Exception as e:
-        print(f"Error verifying OTP from Redis. OTP Expired: {e}")
+        logger.error(f"Error verifying OTP from Redis: {e}")
         raise
 
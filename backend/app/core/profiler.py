@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# On-demand sampling profiler for single requests.
+# While a request is profiled, a sampler thread records the request task's
+# stack every PROFILE_INTERVAL_MS: the chain of coroutines it is awaiting
+# through, plus the synchronous frames currently executing on the event loop
+# when the task is running. Samples taken while the task waits (on the
+# database, Redis, another task...) end in a '(waiting)' frame, so the
+# profile shows wall-clock time, not just CPU time. Stacks are stored in the
+# collapsed format read by flamegraph.pl, speedscope and inferno.
+
+# Header carrying a profiling token issued by /admin/profiles/token
+PROFILE_HEADER = "X-Profile"
+
+# Redis hash of per-route sampling toggles: field = 'METHOD /route', value = JSON
+ROUTE_TOGGLES_KEY = "profiling:routes"
+
+WAITING_FRAME = "(waiting)"
+
+_PROFILE_ID_PATTERN = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+
+# Tokens
+
+def _token_signature(expires_at: int) -> str:
+    secret = (settings.PROFILE_SECRET or settings.JWT_SECRET).encode()
+    return hmac.new(secret, f"profile:{expires_at}".encode(), hashlib.sha256).hexdigest()
+
+
+def issue_token(ttl_seconds: int) -> Tuple[str, int]:
+    """A signed X-Profile header value valid for ttl_seconds, and its expiry (epoch seconds)"""
+    expires_at = int(time.time()) + ttl_seconds
+    return f"{expires_at}.{_token_signature(expires_at)}", expires_at
+
+
+def verify_token(token: Optional[str]) -> bool:
+    if not token or "." not in token:
+        return False
+    expires_at, signature = token.split(".", 1)
+    if not expires_at.isdigit() or int(expires_at) < time.time():
+        return False
+    return hmac.compare_digest(signature, _token_signature(int(expires_at)))
+
+
+# Overhead caps: profiles running at once and started per minute in this process
+
+_active = 0
+_recent_starts: List[float] = []
+_cap_lock = threading.Lock()
+
+
+def try_acquire() -> bool:
+    """Reserve a profiling slot, or refuse when a cap is reached"""
+    global _active
+    now = time.monotonic()
+    with _cap_lock:
+        _recent_starts[:] = [started for started in _recent_starts if now - started < 60]
+        if _active >= settings.PROFILE_MAX_CONCURRENT or len(_recent_starts) >= settings.PROFILE_MAX_PER_MINUTE:
+            return False
+        _active += 1
+        _recent_starts.append(now)
+        return True
+
+
+def release() -> None:
+    global _active
+    with _cap_lock:
+        _active -= 1
+
+
+# Sampling
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _task_stack(task: asyncio.Task, loop_thread_id: int) -> List[str]:
+    """Outermost-first stack of a task: its await chain plus any sync frames it is running"""
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break  # A future, or a finished coroutine
+        frames.append(frame)
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    if not frames:
+        return []
+
+    labels = [_frame_label(frame) for frame in frames]
+    innermost = frames[-1]
+    running = sys._current_frames().get(loop_thread_id)
+    called = []
+    while running is not None and running is not innermost:
+        called.append(_frame_label(running))
+        running = running.f_back
+    if running is innermost:
+        labels.extend(reversed(called))
+    else:
+        labels.append(WAITING_FRAME)
+    return labels
+
+
+class Profile:
+    """Samples one asyncio task from a background thread until stopped"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.loop_thread_id = threading.get_ident()
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> "Profile":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        interval = settings.PROFILE_INTERVAL_MS / 1000
+        deadline = self.started + settings.PROFILE_MAX_SECONDS
+        while not self._stop.wait(interval):
+            if time.perf_counter() > deadline:
+                break  # Duration cap: keep the request, stop sampling it
+            stack = _task_stack(self.task, self.loop_thread_id)
+            if stack:
+                self.samples[";".join(stack)] += 1
+                self.sample_count += 1
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+# Storage
+
+def _profile_path(profile_id: str, extension: str) -> str:
+    return os.path.join(settings.PROFILE_DIR, f"{profile_id}{extension}")
+
+
+def save(profile: Profile, method: str, path: str, route: Optional[str], status: int, trigger: str) -> Optional[str]:
+    """Write a profile (collapsed stacks plus a JSON sidecar) and enforce the storage caps"""
+    if not profile.samples:
+        return None
+    profile_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+    metadata = {
+        "id": profile_id,
+        "created_at": time.time(),
+        "method": method,
+        "path": path,
+        "route": route,
+        "status": status,
+        "trigger": trigger,
+        "duration_ms": round(profile.duration * 1000, 1),
+        "samples": profile.sample_count,
+        "interval_ms": settings.PROFILE_INTERVAL_MS,
+    }
+    try:
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        with open(_profile_path(profile_id, ".collapsed"), "w") as f:
+            f.write(profile.collapsed())
+        with open(_profile_path(profile_id, ".json"), "w") as f:
+            json.dump(metadata, f)
+        _enforce_storage_caps()
+    except OSError as e:
+        logger.warning(f"Failed to save profile of {method} {path}: {e}")
+        return None
+    logger.info(f"Saved profile {profile_id} of {method} {path} ({profile.sample_count} samples)")
+    return profile_id
+
+
+def _enforce_storage_caps() -> None:
+    """Delete the oldest profiles beyond PROFILE_MAX_FILES or PROFILE_MAX_MB"""
+    profiles = list_profiles()
+    total = sum(profile["size_bytes"] for profile in profiles)
+    limit = settings.PROFILE_MAX_MB * 1024 * 1024
+    # list_profiles() is newest first
+    while profiles and (len(profiles) > settings.PROFILE_MAX_FILES or total > limit):
+        oldest = profiles.pop()
+        total -= oldest["size_bytes"]
+        delete(oldest["id"])
+
+
+def list_profiles() -> List[dict]:
+    """Metadata of the stored profiles, newest first"""
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    profiles = []
+    for filename in os.listdir(settings.PROFILE_DIR):
+        if not filename.endswith(".json"):
+            continue
+        profile_id = filename[:-len(".json")]
+        try:
+            with open(_profile_path(profile_id, ".json")) as f:
+                metadata = json.load(f)
+            metadata["size_bytes"] = os.path.getsize(_profile_path(profile_id, ".collapsed"))
+        except (OSError, ValueError):
+            continue  # Removed or half-written
+        profiles.append(metadata)
+    return sorted(profiles, key=lambda profile: profile["created_at"], reverse=True)
+
+
+def profile_file(profile_id: str) -> Optional[str]:
+    """Path of a stored profile's collapsed stacks, or None"""
+    if not _PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = _profile_path(profile_id, ".collapsed")
+    return path if os.path.exists(path) else None
+
+
+def delete(profile_id: str) -> None:
+    for extension in (".collapsed", ".json"):
+        try:
+            os.remove(_profile_path(profile_id, extension))
+        except FileNotFoundError:
+            pass
+
+
+# Per-route toggles, shared by every web process through Redis
+
+def toggle_field(method: str, route: str) -> str:
+    return f"{method.upper()} {route}"
+
+
+async def set_route_toggle(redis, method: str, route: str, percent: float, ttl_seconds: int) -> dict:
+    toggle = {
+        "method": method.upper(),
+        "route": route,
+        "percent": percent,
+        "expires_at": int(time.time()) + ttl_seconds,
+    }
+    await redis.hset(ROUTE_TOGGLES_KEY, toggle_field(method, route), json.dumps(toggle))
+    return toggle
+
+
+async def delete_route_toggle(redis, method: str, route: str) -> bool:
+    return bool(await redis.hdel(ROUTE_TOGGLES_KEY, toggle_field(method, route)))
+
+
+async def route_toggles(redis) -> Dict[str, dict]:
+    """Unexpired toggles keyed by 'METHOD /route'"""
+    now = time.time()
+    toggles = {}
+    for field, value in (await redis.hgetall(ROUTE_TOGGLES_KEY)).items():
+        toggle = json.loads(value)
+        if toggle["expires_at"] > now:
+            toggles[field] = toggle
+    return toggles
@@ -0,0 +1,114 @@
+import json
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Per-request SQL statistics collected from engine events.
+# The middleware starts a QueryStats for each request in a context variable;
+# every statement executed in that context (including the greenlets SQLAlchemy
+# runs asyncpg calls in, and the tasks started by fetch_concurrently, which
+# copy the context) is counted against it. Statements outside a request are
+# only checked against the slow-query threshold.
+
+# Longest statement text kept in logs
+_MAX_STATEMENT_LENGTH = 500
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest_statement: Optional[str] = None
+    # Executions per statement text, to spot N+1 query patterns
+    statements: Dict[str, int] = field(default_factory=dict)
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+    def repeated(self) -> List[Tuple[str, int]]:
+        """Statements executed at least QUERY_REPEAT_THRESHOLD times, most frequent first"""
+        repeated = [
+            (statement, count) for statement, count in self.statements.items()
+            if count >= settings.QUERY_REPEAT_THRESHOLD
+        ]
+        return sorted(repeated, key=lambda item: item[1], reverse=True)
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def start() -> QueryStats:
+    """Start collecting statistics for the current context (one request)"""
+    stats = QueryStats()
+    _current.set(stats)
+    return stats
+
+
+def current() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def shorten(statement: Optional[str]) -> Optional[str]:
+    if statement is None:
+        return None
+    statement = " ".join(statement.split())
+    if len(statement) > _MAX_STATEMENT_LENGTH:
+        return statement[:_MAX_STATEMENT_LENGTH] + "..."
+    return statement
+
+
+def log_json(level: int, event_name: str, **fields) -> None:
+    """Log one structured record as a single JSON line"""
+    logger.log(level, json.dumps({"event": event_name, **fields}, default=str))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    seconds = time.perf_counter() - started
+
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, seconds)
+    if seconds >= settings.SLOW_QUERY_SECONDS:
+        log_json(
+            logging.WARNING, "slow_query",
+            duration_ms=round(seconds * 1000, 1),
+            executemany=executemany,
+            statement=shorten(statement),
+        )
+
+
+def _handle_error(exception_context):
+    # The statement failed, so after_cursor_execute never pops its start time
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine) -> None:
+    """Attach the statement timing hooks to an engine (sync or async)"""
+    sync_engine: Engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
@@ -6,6 +6,8 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from typing import Optional
+from .cache import cache, cached
 from .config import settings
 from app.core.database import get_async_db
 from app.models.db_models import Role, User
@@ -38,6 +40,25 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
 
+# Authenticated users are cached by email; the cached User is not attached to a session
+PRINCIPAL_CACHE_NAMESPACE = "principals"
+PRINCIPAL_FIELDS = ("id", "name", "email", "role", "is_verified", "timezone")
+
+def principal_tag(email: str) -> str:
+    return f"{PRINCIPAL_CACHE_NAMESPACE}:{email}"
+
+@cached(PRINCIPAL_CACHE_NAMESPACE, ttl=settings.PRINCIPAL_CACHE_TTL, tags=lambda email, **_: [principal_tag(email)])
+async def _load_principal(email: str, db: AsyncSession) -> Optional[dict]:
+    result = await db.execute(select(User).filter(User.email == email and User.is_verified))
+    user = result.scalar_one_or_none()
+    if not user:
+        return None
+    return {field: getattr(user, field) for field in PRINCIPAL_FIELDS}
+
+async def invalidate_principal(email: str) -> None:
+    """Drop a user's cached principal after their role or verification changed"""
+    await cache.invalidate(principal_tag(email))
+
 # Get current user from JWT
 async def get_current_user(
     token: str = Depends(oauth2_scheme), 
@@ -57,13 +78,10 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    # Use the async SQLAlchemy API
-    result = await db.execute(select(User).filter(User.email == email and User.is_verified))
-    user = result.scalar_one_or_none()
-    
-    if not user:
+    principal = await _load_principal(email, db)
+    if not principal:
         raise credentials_exception
-    return user
+    return User(**{**principal, "role": Role(principal["role"])})
 
 async def get_current_user_without_verification(
     token: str = Depends(oauth2_scheme), 
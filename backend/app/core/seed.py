@@ -1,9 +1,13 @@
 from pydantic import EmailStr
 from sqlalchemy import select
-from .database import AsyncSessionLocal, SessionLocal
+from .database import AsyncSessionLocal
 from app.models.db_models import User, Role, Product
-from .security import get_password_hash
+from .cache import cache
+from .security import get_password_hash, invalidate_principal
 from .config import settings
+import logging
+
+logger = logging.getLogger(__name__)
 
 async def create_admin(admin_email: EmailStr):
     async with AsyncSessionLocal() as db:
@@ -22,6 +26,7 @@ async def create_admin(admin_email: EmailStr):
         elif admin.role != Role.ADMIN:
             admin.role = Role.ADMIN
             await db.commit()
+            await invalidate_principal(admin_email)
 
 async def seed_products():
     async with AsyncSessionLocal() as db:
@@ -58,4 +63,6 @@ async def seed_products():
                 db.add(product)
             
             await db.commit()
-            print(f"Added {len(products)} products to database")
\ No newline at end of file
+            # Drop cached product reads (app.endpoints.products.CACHE_NAMESPACE)
+            await cache.invalidate("products")
+            logger.info(f"Added {len(products)} products to database")
\ No newline at end of file
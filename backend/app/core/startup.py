@@ -0,0 +1,49 @@
+import logging
+
+from sqlalchemy import text
+
+from .database import AsyncSessionLocal, async_engine, create_tables_async
+from .seed import create_admin, seed_products
+from app.services import report_cache, rollups
+
+logger = logging.getLogger(__name__)
+
+# Key of the PostgreSQL advisory lock held while the startup tasks run
+STARTUP_LOCK_KEY = 7461002
+
+
+async def run_startup_tasks() -> None:
+    """
+    Create the tables, the admin user and the sample products, and backfill
+    the report rollups if they are empty while the raw tables are not.
+    Processes starting together (web workers, replicas) take turns under a
+    PostgreSQL advisory lock, so the first one does the work and the others
+    find it already done.
+    """
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": STARTUP_LOCK_KEY})
+        try:
+            logger.info("Creating database tables...")
+            await create_tables_async()
+            await create_admin(
+                admin_email="admin@example.com",
+            )
+            await seed_products()
+            await backfill_rollups()
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": STARTUP_LOCK_KEY})
+
+
+async def backfill_rollups() -> None:
+    """
+    Rebuild the daily report rollups when they were never populated, so
+    reports on an existing database do not read zero totals until the
+    daily rollup verification
+    """
+    async with AsyncSessionLocal() as session:
+        if not await rollups.rollups_missing(session):
+            return
+        logger.info("Report rollups are empty; rebuilding them from the raw tables...")
+        result = await rollups.rebuild_rollups(session)
+        logger.info(f"Rollups rebuilt: {result}")
+    await report_cache.invalidate_all()
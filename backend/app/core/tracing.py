@@ -0,0 +1,305 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Lightweight distributed tracing.
+# A trace starts at an HTTP request or a Celery task and is sampled once, at
+# its root (TRACE_SAMPLE_RATE). A W3C 'traceparent' header continues the
+# caller's trace id; its sampled decision is followed for Celery tasks (our own
+# producers) and for HTTP callers only with TRACE_TRUST_INCOMING, so clients
+# cannot turn tracing on. Inside a sampled trace, span() records a child of the
+# current span; outside one it does nothing, so unsampled requests only pay
+# for a context variable lookup. Finished traces are appended to
+# TRACE_DIR/<process>.jsonl, one OTLP/JSON ExportTraceServiceRequest per line,
+# which the OpenTelemetry Collector's otlpjsonfile receiver can ship on. A file
+# over TRACE_FILE_MAX_MB is rolled over to <process>.<timestamp>.jsonl, and the
+# oldest rolled-over files are deleted while the directory exceeds TRACE_MAX_MB.
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+KIND_PRODUCER = 4
+KIND_CONSUMER = 5
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class _Trace:
+    """Spans of one trace finished in this process, written when its root span ends"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.root: Optional["Span"] = None
+        self.spans: List["Span"] = []
+        self.exported = False
+
+
+class Span:
+    def __init__(self, trace: _Trace, name: str, parent_id: Optional[str], kind: int, attributes: dict):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.status = 0
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        self.end_ns = time.time_ns()
+        self.trace.spans.append(self)
+        if self is self.trace.root or self.trace.exported:
+            # The root ended (or a straggler ended after it): write what is buffered
+            _export(self.trace)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status:
+            span["status"] = {"code": self.status, "message": self.status_message}
+        return span
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace id, parent span id, sampled) from a W3C traceparent header, or None"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3][:2], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_traceparent() -> Optional[str]:
+    """traceparent header for work started from the current span (None outside a sampled trace)"""
+    span = _current.get()
+    return span.traceparent if span is not None else None
+
+
+def _sample() -> bool:
+    return settings.TRACE_SAMPLE_RATE > 0 and random.random() < settings.TRACE_SAMPLE_RATE
+
+
+def start_trace(
+    name: str,
+    traceparent: Optional[str] = None,
+    kind: int = KIND_SERVER,
+    trust_parent: Optional[bool] = None,
+    **attributes,
+) -> Optional[Span]:
+    """
+    Start the local root span of a trace, continuing the caller's trace when a
+    traceparent is given, otherwise starting a new one. The caller's sampled
+    flag is followed when trust_parent (default TRACE_TRUST_INCOMING);
+    otherwise the trace is sampled by TRACE_SAMPLE_RATE. Returns None when not
+    sampled. The caller activates it with activate() and ends it.
+    """
+    if trust_parent is None:
+        trust_parent = settings.TRACE_TRUST_INCOMING
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+        if not trust_parent:
+            sampled = _sample()
+    else:
+        sampled = _sample()
+        trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+    if not sampled or not settings.TRACE_DIR:
+        return None
+    trace = _Trace(trace_id)
+    # With a remote parent this is still the local root, exported when it ends
+    trace.root = Span(trace, name, parent_id, kind, attributes)
+    return trace.root
+
+
+def activate(span: Optional[Span]):
+    """Make a span current; returns the token to pass to deactivate()"""
+    return _current.set(span)
+
+
+def deactivate(token) -> None:
+    _current.reset(token)
+
+
+def start_span(name: str, kind: int = KIND_INTERNAL, **attributes) -> Optional[Span]:
+    """Start a child of the current span without making it current (None outside a sampled trace)"""
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent.span_id, kind, attributes)
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes) -> Iterator[Optional[Span]]:
+    """Record the enclosed block as a child of the current span"""
+    child = start_span(name, kind, **attributes)
+    if child is None:
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.set_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+_export_lock = threading.Lock()
+
+# <process>.<timestamp>.jsonl; the file a process appends to has no timestamp
+_ROLLED_OVER = re.compile(r"\.\d+\.jsonl$")
+
+
+def _export(trace: _Trace) -> None:
+    spans, trace.spans = trace.spans, []
+    trace.exported = True
+    if not spans:
+        return
+    request = {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                _attribute("service.name", settings.TRACE_SERVICE_NAME),
+                _attribute("service.instance.id", metrics.PROCESS_ID),
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "app"},
+                "spans": [span.to_otlp() for span in spans],
+            }],
+        }]
+    }
+    line = json.dumps(request, separators=(",", ":")) + "\n"
+    try:
+        with _export_lock:
+            os.makedirs(settings.TRACE_DIR, exist_ok=True)
+            path = os.path.join(settings.TRACE_DIR, f"{metrics.PROCESS_ID}.jsonl")
+            with open(path, "a") as f:
+                f.write(line)
+                size = f.tell()
+            if size > settings.TRACE_FILE_MAX_MB * 1024 * 1024:
+                os.replace(path, os.path.join(settings.TRACE_DIR, f"{metrics.PROCESS_ID}.{time.time_ns()}.jsonl"))
+                _enforce_storage_cap()
+    except OSError as e:
+        logger.warning(f"Failed to export trace {trace.trace_id}: {e}")
+
+
+def _enforce_storage_cap() -> None:
+    """Delete the oldest rolled-over trace files while TRACE_DIR exceeds TRACE_MAX_MB"""
+    files = []
+    for filename in os.listdir(settings.TRACE_DIR):
+        path = os.path.join(settings.TRACE_DIR, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue  # Removed by another process
+        if filename.endswith(".jsonl"):
+            files.append((stat.st_mtime, stat.st_size, bool(_ROLLED_OVER.search(filename)), path))
+    total = sum(size for _, size, _, _ in files)
+    limit = settings.TRACE_MAX_MB * 1024 * 1024
+    # Rolled-over files, oldest first; the files processes are appending to are kept
+    for _, size, rolled_over, path in sorted(files):
+        if total <= limit:
+            break
+        if rolled_over:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+# SQL statements as client spans, from engine events
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    child = start_span(
+        "db.query", KIND_CLIENT,
+        **{"db.system": "postgresql", "db.statement": " ".join(statement.split())[:1000]},
+    )
+    conn.info.setdefault("trace_spans", []).append(child)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    child = conn.info["trace_spans"].pop()
+    if child is not None:
+        child.end()
+
+
+def _handle_error(exception_context):
+    stack = exception_context.connection.info.get("trace_spans") if exception_context.connection else None
+    if stack:
+        child = stack.pop()
+        if child is not None:
+            child.set_error(exception_context.original_exception)
+            child.end()
+
+
+def instrument_engine(engine) -> None:
+    """Record every statement an engine (sync or async) runs inside a sampled trace"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
@@ -1,22 +1,39 @@
 # admin.py
-from datetime import datetime, timedelta, date
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, func
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.database import get_async_db
-from app.models.db_models import User, Installment, Payment
-from app.models.schemas import UserResponse, ReportResponse, PaginatedReportResponse
+from app.core.database import get_async_db, fetch_concurrently
+from app.models.db_models import User
+from app.models.schemas import UserResponse, ReportResponse, PaginatedReportResponse, ExportCreate, ExportJobResponse, ExportFormat, TimeSeriesResponse, AgingSummaryResponse, AgingCustomerPage, ProfileTokenResponse, ProfileInfo, RouteProfilingCreate, RouteProfilingResponse
 from app.core.security import require_admin
+from app.core import profiler
+from app.core.cache import cached
+from app.core.client import CACHE, get_redis
+from app.core.config import settings
+from app.services import aging, exports, report_cache, reports, rollups
+import asyncio
 import enum
-import calendar
+import logging
+import os
+import uuid
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 # Enum for report types
 class ReportType(str, enum.Enum):
     weekly = "weekly"
     monthly = "monthly"
     all = "all"
 
+# Enum for time-series bucket granularity
+class TimeSeriesBucket(str, enum.Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
 admin_router = APIRouter(
     prefix="/admin",
     dependencies=[Depends(require_admin)],
@@ -31,7 +48,7 @@ async def generate_report(
     month: Optional[int] = None,
     page: int = 1,
     limit: int = 10,
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Generate payment reports (weekly/monthly/all) with pagination
@@ -50,227 +67,198 @@ async def generate_report(
     Returns total paid amount, total due amount, and paginated payment details
     """
     try:
-        today = date.today()
-        current_year = today.year
-        
-        # Set default year to current year if not provided
-        if year is None:
-            year = current_year
-            
         # Calculate date range based on report type
-        if report_type == ReportType.weekly:
-            if week is None:
-                # Use current week if not specified
-                current_week = today.isocalendar()[1]
-                week = current_week
-                
-            # Validate week number
-            if not 1 <= week <= 53:
-                raise HTTPException(status_code=400, detail="Week number must be between 1 and 53")
-                
-            # Get the first day of the specified ISO week
-            # ISO week starts on Monday
-            try:
-                first_day = datetime.strptime(f'{year}-W{week:02d}-1', '%Y-W%W-%w').date()
-            except ValueError:
-                # Handle potential strptime issues with ISO week format
-                # Alternative calculation for first day of week
-                first_day = datetime.fromisocalendar(year, week, 1).date()
-                
-            start_date = first_day
-            end_date = first_day + timedelta(days=6)  # Sunday
-            
-        elif report_type == ReportType.monthly:
-            if month is None:
-                # Use current month if not specified
-                month = today.month
-                
-            # Validate month number
-            if not 1 <= month <= 12:
-                raise HTTPException(status_code=400, detail="Month number must be between 1 and 12")
-                
-            # Get the first and last day of the specified month
-            start_date = date(year, month, 1)
-            last_day = calendar.monthrange(year, month)[1]
-            end_date = date(year, month, last_day)
-            
-        elif report_type == ReportType.all:
-            # For 'all' report type, we don't filter by date
-            # Set symbolic start/end dates for the response
-            start_date = date(1970, 1, 1)  # Unix epoch start
-            end_date = today
-            
-            # Calculate total paid amount (all time) - using actual DB column
-            paid_result = await db.execute(
-                select(func.sum(Payment.amount))
-            )
-            total_paid_cents = paid_result.scalar() or 0
-            total_paid = total_paid_cents / 100.0  # Convert cents to BDT
-            
-            # Calculate total due amount (all time) - using actual DB column
-            due_result = await db.execute(
-                select(func.sum(Installment.remaining_amount))
+        try:
+            year, period, start_date, end_date = reports.resolve_period(
+                report_type.value, year, week if report_type == ReportType.weekly else month
             )
-            total_due_cents = due_result.scalar() or 0
-            total_due = total_due_cents / 100.0  # Convert cents to BDT
-            
-            # Get paginated payment details
-            payment_query = select(
-                Payment.id,
-                Payment.amount,
-                Payment.payment_date,
-                Payment.installment_id,
-                User.name.label("user_name"),
-                User.email.label("user_email")
-            ).join(
-                Installment, Payment.installment_id == Installment.id
-            ).join(
-                User, Installment.user_id == User.id
-            ).order_by(
-                Payment.payment_date.desc()
-            ).offset(
-                (page - 1) * limit
-            ).limit(limit)
-            
-            payment_result = await db.execute(payment_query)
-            payments = payment_result.fetchall()
-            
-            # Get total count for pagination
-            count_query = select(func.count(Payment.id))
-            count_result = await db.execute(count_query)
-            total_count = count_result.scalar() or 0
-            
-            # Format payment details
-            payment_details = []
-            for payment in payments:
-                payment_details.append({
-                    "id": payment.id,
-                    "amount": payment.amount / 100.0,  # Convert cents to BDT
-                    "payment_date": payment.payment_date,
-                    "installment_id": payment.installment_id,
-                    "user_name": payment.user_name,
-                    "user_email": payment.user_email
-                })
-            
-            # Debug information
-            print("Report type: all (no date filtering)")
-            print(f"Total paid amount (all time): {total_paid}")
-            print(f"Total due amount (all time): {total_due}")
-            print(f"Total payment records: {total_count}")
-            print(f"Showing page {page} with {len(payment_details)} records")
-            
-            return {
-                "report_type": report_type,
-                "start_date": start_date,
-                "end_date": end_date,
-                "total_paid": total_paid,  # Convert cents to BDT
-                "total_due": total_due,    # Convert cents to BDT
-                "year": year,
-                "period": None,  # No specific period for 'all' report
-                "payments": payment_details,
-                "pagination": {
-                    "total": total_count,
-                    "page": page,
-                    "limit": limit,
-                    "pages": (total_count + limit - 1) // limit  # Ceiling division
-                }
-            }
-        else:
-            raise HTTPException(status_code=400, detail="Invalid report type. Use 'weekly' or 'monthly'")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        # Debug information
-        print(f"Date range: {start_date} to {end_date}")
-        
-        # Convert date objects to datetime for proper comparison with datetime fields
-        start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
-        
-        # Calculate total paid amount with proper date comparison - using actual DB column
-        paid_result = await db.execute(
-            select(func.sum(Payment.amount))
-            .where(Payment.payment_date >= start_datetime)
-            .where(Payment.payment_date <= end_datetime)
-        )
-        total_paid_cents = paid_result.scalar() or 0
-        total_paid = total_paid_cents / 100.0  # Convert cents to BDT
-        
-        # Calculate total due amount - using actual DB column
-        due_result = await db.execute(
-            select(func.sum(Installment.remaining_amount))
-            .where(Installment.due_date >= start_date)
-            .where(Installment.due_date <= end_date)
+        # Serve from the report cache; only a miss runs the queries
+        return await report_cache.get_or_compute(
+            report_type.value, year, period, page, limit, end_date,
+            lambda: _build_report(db, report_type, year, period, start_date, end_date, page, limit),
         )
-        total_due_cents = due_result.scalar() or 0
-        total_due = total_due_cents / 100.0  # Convert cents to BDT
-        
-        # Get paginated payment details for the date range
-        payment_query = select(
-            Payment.id,
-            Payment.amount,
-            Payment.payment_date,
-            Payment.installment_id,
-            User.name.label("user_name"),
-            User.email.label("user_email")
-        ).join(
-            Installment, Payment.installment_id == Installment.id
-        ).join(
-            User, Installment.user_id == User.id
-        ).where(
-            Payment.payment_date >= start_datetime
-        ).where(
-            Payment.payment_date <= end_datetime
-        ).order_by(
-            Payment.payment_date.desc()
-        ).offset(
-            (page - 1) * limit
-        ).limit(limit)
-        
-        payment_result = await db.execute(payment_query)
-        payments = payment_result.fetchall()
-        
-        # Get total count for pagination
-        count_query = select(func.count(Payment.id)).where(
-            Payment.payment_date >= start_datetime
-        ).where(
-            Payment.payment_date <= end_datetime
+
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Report queries timed out")
+    except Exception as e:
+        logger.exception(f"Error in generate_report: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _build_report(
+    db: AsyncSession,
+    report_type: ReportType,
+    year: int,
+    period: Optional[int],
+    start_date: date,
+    end_date: date,
+    page: int,
+    limit: int,
+) -> dict:
+    """Run the report queries for a resolved period and format the response"""
+    if report_type == ReportType.all:
+        logger.debug("Report type: all (no date filtering)")
+        # No date filtering for the all-time report
+        range_start = range_end = None
+    else:
+        logger.debug(f"Date range: {start_date} to {end_date}")
+        range_start, range_end = start_date, end_date
+    
+    # Paid and due totals come from the daily rollups (one row per day in range)
+    paid_query = rollups.paid_total_query(range_start, range_end)
+    due_query = rollups.due_total_query(range_start, range_end)
+    
+    # Get paginated payment details, joined with the paying user
+    payment_query = reports.payment_details_query(range_start, range_end).offset(
+        (page - 1) * limit
+    ).limit(limit)
+    count_query = reports.payment_count_query(range_start, range_end)
+    
+    # The four reads are independent, so run them concurrently (the first on the
+    # session the admin check already holds)
+    paid_result, due_result, payment_result, count_result = await fetch_concurrently(
+        paid_query, due_query, payment_query, count_query, session=db
+    )
+    total_paid = (paid_result.scalar() or 0) / 100.0  # Convert cents to BDT
+    total_due = (due_result.scalar() or 0) / 100.0    # Convert cents to BDT
+    payments = payment_result.fetchall()
+    total_count = count_result.scalar() or 0
+    
+    # Format payment details
+    payment_details = []
+    for payment in payments:
+        payment_details.append({
+            "id": payment.id,
+            "amount": payment.amount / 100.0,  # Convert cents to BDT
+            "payment_date": payment.payment_date,
+            "installment_id": payment.installment_id,
+            "user_name": payment.user_name,
+            "user_email": payment.user_email
+        })
+    
+    logger.debug(
+        f"Report {report_type.value} {start_date}..{end_date}: paid {total_paid}, due {total_due}, "
+        f"{total_count} payment records, page {page} with {len(payment_details)} records"
+    )
+
+    return {
+        "report_type": report_type,
+        "start_date": start_date,
+        "end_date": end_date,
+        "total_paid": total_paid,  # Convert cents to BDT
+        "total_due": total_due,    # Convert cents to BDT
+        "year": year,
+        "period": period,
+        "payments": payment_details,
+        "pagination": {
+            "total": total_count,
+            "page": page,
+            "limit": limit,
+            "pages": (total_count + limit - 1) // limit  # Ceiling division
+        }
+    }
+
+@admin_router.get("/reports/timeseries", response_model=TimeSeriesResponse)
+async def timeseries_report(
+    from_date: date = Query(..., alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    bucket: TimeSeriesBucket = TimeSeriesBucket.day,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Paid and due totals per day, week (ISO, starting Monday) or month
+    between two dates (inclusive; 'to' defaults to today)
+    
+    Totals come from one grouped query over the daily rollups; buckets
+    without any payments or dues are returned with zero totals.
+    """
+    if to_date is None:
+        to_date = date.today()
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    if reports.bucket_count(from_date, to_date, bucket.value) > settings.TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range too large: at most {settings.TIMESERIES_MAX_BUCKETS} buckets per request"
         )
-        count_result = await db.execute(count_query)
-        total_count = count_result.scalar() or 0
-        
-        # Format payment details
-        payment_details = []
-        for payment in payments:
-            payment_details.append({
-                "id": payment.id,
-                "amount": payment.amount / 100.0,  # Convert cents to BDT
-                "payment_date": payment.payment_date,
-                "installment_id": payment.installment_id,
-                "user_name": payment.user_name,
-                "user_email": payment.user_email
-            })
+    
+    try:
+        result = await db.execute(reports.timeseries_query(from_date, to_date, bucket.value))
+        points = reports.fill_buckets(result.fetchall(), from_date, to_date, bucket.value)
+    except Exception as e:
+        logger.exception(f"Error in timeseries_report: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return {
+        "bucket": bucket.value,
+        "from_date": from_date,
+        "to_date": to_date,
+        "points": points,
+    }
+
+@admin_router.get("/reports/aging", response_model=AgingSummaryResponse)
+async def aging_report(
+    live: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Open installments by days past due (current, 1-30, 31-60, 61-90, 90+),
+    with count and remaining amount per bucket
+    
+    Reads the nightly snapshot; pass live=true (or before the first
+    snapshot exists) to compute it from the installments table.
+    """
+    try:
+        if not live:
+            report = await _aging_snapshot_report(db)
+            if report is not None:
+                return report
         
-        print(f"Total payment records in range: {total_count}")
-        print(f"Showing page {page} with {len(payment_details)} records")
+        return {"as_of": date.today(), "source": "live", "buckets": await aging.live_summary(db)}
+    except Exception as e:
+        logger.exception(f"Error in aging_report: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return {
-            "report_type": report_type,
-            "start_date": start_date,
-            "end_date": end_date,
-            "total_paid": total_paid,  # Convert cents to BDT
-            "total_due": total_due,    # Convert cents to BDT
-            "year": year,
-            "period": week if report_type == ReportType.weekly else month,
-            "payments": payment_details,
-            "pagination": {
-                "total": total_count,
-                "page": page,
-                "limit": limit,
-                "pages": (total_count + limit - 1) // limit  # Ceiling division
-            }
-        }
+@cached(aging.CACHE_NAMESPACE, ttl=settings.AGING_CACHE_TTL)
+async def _aging_snapshot_report(db: AsyncSession) -> Optional[dict]:
+    """The aging report from the latest snapshot, or None before the first one"""
+    snapshot = await aging.snapshot_summary(db)
+    if snapshot is None:
+        return None
+    as_of, buckets = snapshot
+    return {"as_of": as_of, "source": "snapshot", "buckets": buckets}
 
+@admin_router.get("/reports/aging/customers", response_model=AgingCustomerPage)
+async def aging_customers(
+    bucket: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    live: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Customers with open balances, most overdue first, or largest amount in
+    one bucket first when bucket is given ('current', '1-30', '31-60',
+    '61-90', '90+')
+    
+    Pass the returned next_cursor to get the following page.
+    """
+    try:
+        as_of = date.today() if live else await aging.snapshot_as_of(db)
+        if as_of is None:
+            # No snapshot yet; fall back to computing it live
+            live, as_of = True, date.today()
+        
+        items, next_cursor = await aging.customer_page(db, bucket, cursor, limit, live)
+        return {"as_of": as_of, "source": "live" if live else "snapshot", "items": items, "next_cursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Error in generate_report: {str(e)}")
+        logger.exception(f"Error in aging_customers: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @admin_router.get("/customers", response_model=list[UserResponse])
@@ -301,3 +289,157 @@ async def list_customers(
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@admin_router.post("/exports", response_model=ExportJobResponse, status_code=202)
+def create_export(export: ExportCreate):
+    """
+    Start a background export of every payment row in a report period.
+    Poll /admin/exports/{job_id} for progress, then download the file.
+    """
+    try:
+        reports.resolve_period(export.report_type, export.year, export.period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if export.format == ExportFormat.PARQUET and not exports.parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet exports are not available on this server")
+    
+    # Celery is imported on first use, keeping it off the web process's startup
+    from app.tasks.exports import export_payments_report
+
+    job_id = str(uuid.uuid4())
+    # Recorded before publishing, so it never overwrites a state the worker already set
+    export_payments_report.backend.store_result(job_id, None, exports.QUEUED)
+    export_payments_report.apply_async(kwargs={
+        "report_type": export.report_type,
+        "year": export.year,
+        "period": export.period,
+        "fmt": export.format.value,
+    }, task_id=job_id)
+    return ExportJobResponse(job_id=job_id, status="PENDING")
+
+def _export_result(job_id: str):
+    from celery.result import AsyncResult
+    from app.core.celery_app import app as celery
+
+    return AsyncResult(job_id, app=celery)
+
+@admin_router.get("/exports/{job_id}", response_model=ExportJobResponse)
+def get_export_status(job_id: str):
+    """
+    Get the status and progress of an export job
+    """
+    result = _export_result(job_id)
+    if result.state == "PENDING":
+        # Never created, or its result expired
+        raise HTTPException(status_code=404, detail="Export job not found")
+    response = ExportJobResponse(job_id=job_id, status="PENDING" if result.state == exports.QUEUED else result.state)
+    
+    if result.state == "PROGRESS" and isinstance(result.info, dict):
+        response.rows_written = result.info.get("rows_written", 0)
+        response.total_rows = result.info.get("total_rows")
+    elif result.state == "SUCCESS":
+        response.rows_written = result.result["rows_written"]
+        response.total_rows = result.result["total_rows"]
+        response.download_url = f"/admin/exports/{job_id}/download"
+    elif result.state == "FAILURE":
+        response.error = str(result.info)
+    
+    if response.total_rows:
+        response.progress = round(response.rows_written / response.total_rows, 4)
+    elif result.state == "SUCCESS":
+        response.progress = 1.0
+    return response
+
+@admin_router.get("/exports/{job_id}/download")
+def download_export(job_id: str):
+    """
+    Download the file produced by a finished export job
+    """
+    result = _export_result(job_id)
+    if result.state == "PENDING":
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if result.state != "SUCCESS":
+        raise HTTPException(status_code=409, detail=f"Export is not ready (status: {result.state})")
+    
+    fmt = result.result["format"]
+    path = os.path.join(settings.EXPORT_DIR, os.path.basename(result.result["file"]))
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Export file no longer exists")
+    if exports.is_expired(path):
+        # Past EXPORT_RETENTION_HOURS; the hourly cleanup has not reached it yet
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise HTTPException(status_code=404, detail="Export file no longer exists")
+    
+    extension, media_type = exports.EXPORT_FORMATS[fmt]
+    return FileResponse(path, media_type=media_type, filename=f"payments-{job_id}{extension}")
+
+@admin_router.post("/profiles/token", response_model=ProfileTokenResponse)
+async def create_profile_token(ttl_seconds: int = Query(600, gt=0)):
+    """
+    Issue a signed token; requests sent with it in the X-Profile header are
+    profiled (subject to the per-process profiling caps) until it expires
+    """
+    if ttl_seconds > settings.PROFILE_TOKEN_MAX_TTL:
+        raise HTTPException(status_code=400, detail=f"ttl_seconds may be at most {settings.PROFILE_TOKEN_MAX_TTL}")
+    token, expires_at = profiler.issue_token(ttl_seconds)
+    return {"header": profiler.PROFILE_HEADER, "token": token, "expires_at": expires_at}
+
+@admin_router.get("/profiles/routes", response_model=list[RouteProfilingResponse])
+async def list_route_profiling():
+    """
+    Routes currently sampled for profiling
+    """
+    redis = get_redis(CACHE)
+    return list((await profiler.route_toggles(redis)).values())
+
+@admin_router.put("/profiles/routes", response_model=RouteProfilingResponse)
+async def enable_route_profiling(toggle: RouteProfilingCreate, request: Request):
+    """
+    Profile a percentage of one route's requests for a limited time
+    (picked up by every web process within PROFILE_TOGGLE_REFRESH seconds)
+    """
+    if toggle.percent > settings.PROFILE_MAX_PERCENT:
+        raise HTTPException(status_code=400, detail=f"percent may be at most {settings.PROFILE_MAX_PERCENT}")
+    if toggle.ttl_seconds > settings.PROFILE_TOKEN_MAX_TTL:
+        raise HTTPException(status_code=400, detail=f"ttl_seconds may be at most {settings.PROFILE_TOKEN_MAX_TTL}")
+    method = toggle.method.upper()
+    if not any(
+        getattr(route, "path", None) == toggle.route and method in (getattr(route, "methods", None) or ())
+        for route in request.app.routes
+    ):
+        raise HTTPException(status_code=404, detail=f"No route {method} {toggle.route}")
+    
+    redis = get_redis(CACHE)
+    return await profiler.set_route_toggle(redis, method, toggle.route, toggle.percent, toggle.ttl_seconds)
+
+@admin_router.delete("/profiles/routes", status_code=204)
+async def disable_route_profiling(method: str, route: str):
+    """
+    Stop sampling a route for profiling
+    """
+    redis = get_redis(CACHE)
+    if not await profiler.delete_route_toggle(redis, method, route):
+        raise HTTPException(status_code=404, detail="Route is not being profiled")
+
+@admin_router.get("/profiles", response_model=list[ProfileInfo])
+async def list_profiles(limit: int = Query(50, ge=1, le=500)):
+    """
+    Captured request profiles, newest first
+    """
+    profiles = await asyncio.to_thread(profiler.list_profiles)
+    return profiles[:limit]
+
+@admin_router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str):
+    """
+    Download a profile as collapsed stacks (one 'frame;frame;... count' line
+    per stack), ready for flamegraph.pl, speedscope or inferno
+    """
+    path = profiler.profile_file(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"profile-{profile_id}.collapsed")
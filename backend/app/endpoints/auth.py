@@ -4,7 +4,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import EmailStr
 from app.core.database import get_async_db
-from app.core.security import create_access_token, verify_password, get_password_hash, get_current_user_without_verification, get_current_user
+from app.core.security import create_access_token, verify_password, get_password_hash, get_current_user_without_verification, get_current_user, invalidate_principal
 from app.core.otp import create_otp, verify_otp
 from app.models.schemas import OTPResponse, OTPVerify, UserRegister, UserResponse, Token
 from app.models.db_models import User
@@ -26,15 +26,17 @@ async def register(user: UserRegister, db: AsyncSession = Depends(get_async_db))
         name=user.name if user.name else "",
         email=user.email,
         hashed_password=hashed_password,
-        is_verified=False
+        is_verified=False,
+        timezone=user.timezone
     )
     db.add(new_user)
     await db.commit()
     await db.refresh(new_user)
+    await invalidate_principal(new_user.email)
 
     # Generate OTP and send it to the user
     response = await create_otp(new_user.email)
-    send_otp_email(
+    await send_otp_email(
         to_email=new_user.email,
         otp=response.otp
     )
@@ -65,7 +67,7 @@ async def resend_otp_endpoint(
     response = await create_otp(current_user.email)
     
     # Send the OTP via email
-    email_response = send_otp_email(
+    email_response = await send_otp_email(
         to_email=current_user.email,
         otp=response.otp
     )
@@ -104,6 +106,7 @@ async def verify_otp_endpoint(otp_data: OTPVerify, db: AsyncSession = Depends(ge
     existing_user.is_verified = True
     await db.commit()
     await db.refresh(existing_user)
+    await invalidate_principal(existing_user.email)
 
     return existing_user
 
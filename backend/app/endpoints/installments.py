@@ -2,9 +2,10 @@ from datetime import datetime, timezone, date
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.database import get_async_db
+from app.core.database import get_async_db, fetch_concurrently
 from app.core.security import get_current_user
 from app.models.db_models import Installment, Payment, Product, User
+from app.services import due_index, report_cache, rollups
 from app.models.schemas import InstallmentCreate, InstallmentResponse, PaginatedInstallmentResponse
 
 installment_router = APIRouter(tags=["Installments"])
@@ -34,10 +35,9 @@ async def create_installment(
             created_at=datetime.now(timezone.utc)  # Explicitly set timezone-aware datetime
         )
         
-        # Add and commit the installment first to get an ID
+        # Add and flush the installment first to get an ID
         db.add(new_installment)
-        await db.commit()
-        await db.refresh(new_installment)
+        await db.flush()
         
         # Handle initial payment if provided
         if installment.initial_payment and installment.initial_payment > 0.0:
@@ -48,10 +48,10 @@ async def create_installment(
                 payment_date=datetime.now(timezone.utc)  # Explicitly set timezone-aware datetime
             )
             
-            # Add and commit the payment
+            # Add the payment and its report rollup
             db.add(init_payment)
-            await db.commit()
-            await db.refresh(init_payment)
+            await db.flush()
+            await rollups.add_payment(db, init_payment.payment_date, init_payment.amount)
             
             # Update the remaining amount based on the payment
             new_installment.remaining_amount_in_bdt -= init_payment.amount_in_bdt
@@ -66,10 +66,22 @@ async def create_installment(
         if due_date.month == date.today().month:
             new_installment.due_date = new_installment.next_due_date
         
-        # Commit the updated installment
+        await rollups.move_due(
+            db,
+            None, 0,
+            new_installment.due_date, new_installment.remaining_amount,
+        )
+        
+        # Commit the installment, initial payment and rollups together
         await db.commit()
         await db.refresh(new_installment)
         
+        # Drop cached reports for the periods this installment changed
+        await report_cache.invalidate_days([date.today(), new_installment.due_date])
+        
+        # Index the installment under its due date for the reminder sweeps
+        await due_index.update(new_installment.id, new_installment.due_date, new_installment.remaining_amount)
+        
         # Return the created installment
         return new_installment
     except Exception as e:
@@ -92,21 +104,19 @@ async def get_user_installments(
         # Calculate offset based on page and limit
         offset = (page - 1) * limit
         
-        # Get installments for the current user with pagination
-        result = await db.execute(
+        # Get installments for the current user with pagination, and the
+        # total count, concurrently (the page on this request's session)
+        result, count_result = await fetch_concurrently(
             select(Installment)
             .where(Installment.user_id == current_user.id)
             .order_by(Installment.due_date)
             .offset(offset)
-            .limit(limit)
-        )
-        installments = result.scalars().all()
-        
-        # Get total count for pagination
-        count_result = await db.execute(
+            .limit(limit),
             select(func.count(Installment.id))
-            .where(Installment.user_id == current_user.id)
+            .where(Installment.user_id == current_user.id),
+            session=db,
         )
+        installments = result.scalars().all()
         total_count = count_result.scalar() or 0
         
         # Calculate total pages
@@ -0,0 +1,69 @@
+import asyncio
+
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from typing import List, Optional
+
+from app.core import metrics
+from app.core.client import QUEUE, get_redis, redis_manager
+from app.core.config import settings
+from app.services import due_index, reminder_schedule
+
+metrics_router = APIRouter(tags=["Metrics"])
+
+
+def _celery_queues() -> List[str]:
+    """Celery queues whose backlog is reported (the Redis broker keeps each queue in a list)"""
+    # Imports celery, so only once /metrics is scraped rather than at startup
+    from app.core.celery_config import task_routes
+
+    return sorted({route["queue"] for route in task_routes.values()} | {"default"})
+
+
+# Seconds each scrape-time Redis probe may take
+PROBE_TIMEOUT = 1.0
+
+
+async def _redis_gauges() -> dict:
+    """
+    Whether each Redis pool is reachable and backlog sizes, measured once per
+    scrape (command latency is the redis_command_duration_seconds histogram)
+    """
+    up, depth = {}, {}
+    for pool, seconds in (await redis_manager.check_health(PROBE_TIMEOUT)).items():
+        up[(("pool", pool),)] = 0 if seconds is None else 1
+
+    try:
+        queues = _celery_queues()
+        redis = get_redis(QUEUE)
+        pipeline = redis.pipeline()
+        for queue in queues:
+            pipeline.llen(queue)
+        pipeline.zcard(reminder_schedule.DUE_QUEUE_KEY)
+        pipeline.zcard(due_index.DUE_INDEX_KEY)
+        *queue_lengths, reminders, indexed = await asyncio.wait_for(pipeline.execute(), PROBE_TIMEOUT)
+        for queue, length in zip(queues, queue_lengths):
+            depth[(("queue", queue),)] = length
+    except Exception:
+        reminders = indexed = None
+
+    gauges = {
+        "redis_up": ("Whether each Redis pool answered a PING", up),
+        "celery_queue_depth": ("Messages waiting in each Celery queue", depth),
+    }
+    if reminders is not None:
+        gauges["reminder_queue_depth"] = ("Reminders waiting for their send time", {(): reminders})
+        gauges["due_index_size"] = ("Open installments in the Redis due index", {(): indexed})
+    return gauges
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(authorization: Optional[str] = Header(default=None)):
+    """Prometheus metrics merged across all web and Celery worker processes"""
+    if settings.METRICS_TOKEN and authorization != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+
+    gauges = await _redis_gauges()
+    # Reading every process's snapshot file is blocking I/O
+    body = await asyncio.to_thread(metrics.render, gauges)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
@@ -6,8 +6,9 @@ from sqlalchemy import func
 from datetime import datetime, timezone, date
 from app.models.db_models import Payment, Installment, User
 from app.models.schemas import PaymentCreate, PaymentResponse, PaginatedPaymentResponse
-from app.core.database import get_async_db
+from app.core.database import get_async_db, fetch_concurrently
 from app.core.security import get_current_user
+from app.services import due_index, report_cache, rollups
 
 payment_router = APIRouter(prefix="/payments", tags=["Payments"])
 
@@ -26,23 +27,21 @@ async def get_payments(
         # Calculate offset based on page and limit
         offset = (page - 1) * limit
         
-        # Get payments for the current user with pagination
-        result = await db.execute(
+        # Get payments for the current user with pagination, and the total
+        # count, concurrently (the page on this request's session)
+        result, count_result = await fetch_concurrently(
             select(Payment)
             .join(Installment, Payment.installment_id == Installment.id)
             .where(Installment.user_id == current_user.id)
             .order_by(Payment.payment_date.desc())  # Most recent payments first
             .offset(offset)
-            .limit(limit)
-        )
-        payments = result.scalars().all()
-        
-        # Get total count for pagination
-        count_result = await db.execute(
+            .limit(limit),
             select(func.count(Payment.id))
             .join(Installment, Payment.installment_id == Installment.id)
-            .where(Installment.user_id == current_user.id)
+            .where(Installment.user_id == current_user.id),
+            session=db,
         )
+        payments = result.scalars().all()
         total_count = count_result.scalar() or 0
         
         # Calculate total pages
@@ -78,10 +77,11 @@ async def create_payment(
     if payment.amount_in_bdt <= 0:
         raise HTTPException(status_code=400, detail="Payment amount must be greater than 0")
     try:
-        # Get the installment
+        # Get the installment, locking the row so concurrent payments serialize
         result = await db.execute(
             select(Installment)
             .where(Installment.id == installment_id, Installment.user_id == current_user.id)
+            .with_for_update()
         )
         installment = result.scalars().first()
         
@@ -120,25 +120,37 @@ async def create_payment(
         
         # Add payment to database
         db.add(new_payment)
-        await db.commit()
-        await db.refresh(new_payment)
+        await db.flush()
         
-        # Get updated list of all payments including the new one
-        payments_result = await db.execute(
-            select(Payment).where(Payment.installment_id == installment_id)
-        )
-        all_payments = payments_result.scalars().all()
+        old_due_date = installment.due_date
+        old_remaining = installment.remaining_amount or 0
         
         # Update remaining amount on installment using the calculation method
-        installment.remaining_amount = installment.calculate_remaining_amount(all_payments)
+        installment.remaining_amount = installment.calculate_remaining_amount([*existing_payments, new_payment])
         
         # If this was the final payment (remaining amount is 0), no need to update due date
         if installment.remaining_amount > 0:
             installment.due_date = installment.next_due_date
         
-        # Commit the changes
+        # Keep the report rollups in step with the payment, in the same transaction
+        await rollups.add_payment(db, new_payment.payment_date, new_payment.amount)
+        await rollups.move_due(
+            db,
+            old_due_date, old_remaining,
+            installment.due_date, installment.remaining_amount,
+        )
+        
+        # Commit the payment, the installment update and the rollups together
         await db.commit()
-        await db.refresh(installment)
+        await db.refresh(new_payment)
+        
+        # Drop cached reports for every period whose totals this payment changed
+        await report_cache.invalidate_days([
+            rollups.payment_day(new_payment.payment_date), old_due_date, installment.due_date
+        ])
+        
+        # Move the installment in the due index (or drop it once fully paid)
+        await due_index.update(installment.id, installment.due_date, installment.remaining_amount)
         
         return new_payment
     except HTTPException:
@@ -3,6 +3,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
 
+from app.core.cache import cached
+from app.core.config import settings
 from app.core.database import get_async_db
 from app.models.schemas import ProductResponse
 from app.models.db_models import Product
@@ -12,7 +14,11 @@ product_router = APIRouter(
     tags=["Products"]
 )
 
+# Product reads are cached; products only change through app.core.seed, which drops them
+CACHE_NAMESPACE = "products"
+
 @product_router.get("/", response_model=List[ProductResponse])
+@cached(CACHE_NAMESPACE, ttl=settings.PRODUCT_CACHE_TTL)
 async def get_products(
     db: AsyncSession = Depends(get_async_db), 
     skip: int = 0, 
@@ -25,9 +31,10 @@ async def get_products(
     result = await db.execute(query)
     products = result.scalars().all()
     
-    return products  # Return empty list if no products, don't raise 404
+    return [ProductResponse.model_validate(product) for product in products]  # Empty list if no products, don't raise 404
 
 @product_router.get("/{product_id}", response_model=ProductResponse)
+@cached(CACHE_NAMESPACE, ttl=settings.PRODUCT_CACHE_TTL)
 async def get_product(
     product_id: int,
     db: AsyncSession = Depends(get_async_db)
@@ -44,4 +51,4 @@ async def get_product(
             detail=f"Product with ID {product_id} not found"
         )
     
-    return product  # Pydantic will handle the conversion automatically
+    return ProductResponse.model_validate(product)
@@ -7,18 +7,36 @@ from pydantic import EmailStr
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from contextlib import asynccontextmanager
+import logging
 
 # Use absolute imports
 
-from app.core.database import get_async_db, Base, create_tables_async
-from app.core.seed import create_admin, seed_products
+from app.core.database import get_async_db, Base
+from app.core.startup import run_startup_tasks
+from app.core.cache import cache
+from app.core.client import close_redis_pools, redis_manager
 from app.endpoints.auth import auth_router
 from app.endpoints.installments import installment_router
 from app.endpoints.admin import admin_router
 from app.endpoints.products import product_router
 from app.endpoints.payments import payment_router
-from app.services.email import send_email, send_otp_email
+from app.endpoints.metrics import metrics_router
+from app.services.email_transport import close_email_transport
 from app.middleware.rate_limiter import SlidingWindowRateLimiter
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.query_stats import QueryStatsMiddleware
+from app.middleware.tracing import TracingMiddleware
+from app.middleware.profiling import ProfilingMiddleware
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import async_engine, record_pool_metrics
+
+# Application loggers (uvicorn configures its own)
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
 
 # Import other routers as needed
 # from .endpoints.users import user_router
@@ -28,18 +46,21 @@ from app.middleware.rate_limiter import SlidingWindowRateLimiter
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Setup code here (runs before application startup)
-    print("Creating database tables...")
-    await create_tables_async()
-    await create_admin(
-        admin_email="admin@example.com",
-    )
-    await seed_products()
+    # Setup code here (runs before application startup, in every worker process)
+    if settings.RUN_STARTUP_TASKS:
+        await run_startup_tasks()
+    redis_manager.open()
+    # Invalidations from other processes drop this worker's local cache entries
+    cache.start_listener()
     
     yield  # This line yields control back to FastAPI
     
     # Teardown code here (runs when application is shutting down)
-    print("Application shutting down...")
+    logger.info("Application shutting down...")
+    await close_email_transport()
+    await cache.stop_listener()
+    await close_redis_pools()
+    metrics.flush()
 
 app = FastAPI(
     lifespan=lifespan,
@@ -57,6 +78,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# On-demand request profiling; added early so it sits right above the routes
+app.add_middleware(ProfilingMiddleware)
+
 # Configure Sliding Window Rate Limiter
 # Define endpoint-specific rate limits (requests per window, window size in seconds)
 endpoint_limits = {
@@ -88,14 +112,26 @@ app.add_middleware(
     default_window=60,  # Default window: 60 seconds
     endpoint_limits=endpoint_limits,
     whitelist_ips=["127.0.0.1"],  # Optional: whitelist local development
+    whitelist_paths=["/docs", "/redoc", "/openapi.json", "/metrics", "/health"],
 )
 
+# Per-request SQL statistics and slow-request log
+app.add_middleware(QueryStatsMiddleware)
+
+# Request metrics; added after the rate limiter so it wraps it and sees its 429s
+app.add_middleware(MetricsMiddleware)
+
+# Request tracing; added last so the trace covers every other middleware
+app.add_middleware(TracingMiddleware)
+metrics.add_collector(lambda: record_pool_metrics(async_engine, "web"))
+
 # Mount API routers
 app.include_router(auth_router)
 app.include_router(installment_router)
 app.include_router(admin_router)
 app.include_router(product_router)
 app.include_router(payment_router)
+app.include_router(metrics_router)
 # app.include_router(user_router, prefix="/api/v1", tags=["Users"])
 # app.include_router(product_router, prefix="/api/v1", tags=["Products"])
 # app.include_router(installment_router, prefix="/api/v1", tags=["Installments"])
@@ -110,6 +146,15 @@ async def root():
     # Implement your email sending logic here
     # return {"message": f"Email sent to {email}"}
 
+@app.get("/health")
+async def health():
+    """Liveness plus the state of each Redis pool (the app stays up, degraded, without Redis)"""
+    redis = await redis_manager.check_health()
+    return {
+        "status": "ok" if all(seconds is not None for seconds in redis.values()) else "degraded",
+        "redis": {pool: seconds is not None for pool, seconds in redis.items()},
+    }
+
 @app.get("/test-db")
 async def test_db(db: AsyncSession = Depends(get_async_db)):
     try:
@@ -0,0 +1,30 @@
+import time
+
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core import metrics
+
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """
+    Records request count and latency per route template (e.g. /payments/{installment_id}),
+    so path parameters do not create a series per value.
+    Add it last so it is the outermost middleware and also sees rate-limited requests.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            metrics.http_request_duration.observe(
+                time.perf_counter() - started, route=path, method=request.method
+            )
+            metrics.http_requests.inc(route=path, method=request.method, status=status)
+            metrics.maybe_flush()
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, Optional
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core import profiler
+from app.core.client import CACHE, get_redis
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when it carries a valid signed X-Profile header, or by
+    chance when an administrator enabled sampling for its route. A plain ASGI
+    middleware, so the handler runs in the same task the profiler samples.
+    Add it before the other middleware so it sits closest to the routes.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.toggles: Dict[str, dict] = {}
+        self.toggles_loaded = 0.0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.PROFILE_DIR:
+            return await self.app(scope, receive, send)
+
+        trigger = await self._trigger(scope)
+        if trigger is None:
+            return await self.app(scope, receive, send)
+        if not profiler.try_acquire():
+            logger.info(f"Profiling cap reached; not profiling {scope['method']} {scope['path']}")
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_and_record_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profile = profiler.Profile(asyncio.current_task()).start()
+        try:
+            await self.app(scope, receive, send_and_record_status)
+        finally:
+            profile.stop()
+            profiler.release()
+            route = getattr(scope.get("route"), "path", None)
+            await asyncio.to_thread(profiler.save, profile, scope["method"], scope["path"], route, status, trigger)
+
+    async def _trigger(self, scope: Scope) -> Optional[str]:
+        """'header' or 'route' when this request should be profiled, otherwise None"""
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                return "header" if profiler.verify_token(value.decode("latin-1")) else None
+
+        toggles = await self._route_toggles()
+        if not toggles:
+            return None
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                toggle = toggles.get(profiler.toggle_field(scope["method"], route.path))
+                if toggle and random.random() * 100 < toggle["percent"]:
+                    return "route"
+                return None
+        return None
+
+    async def _route_toggles(self) -> Dict[str, dict]:
+        """Route toggles, re-read from Redis at most every PROFILE_TOGGLE_REFRESH seconds"""
+        now = time.monotonic()
+        if now - self.toggles_loaded >= settings.PROFILE_TOGGLE_REFRESH:
+            self.toggles_loaded = now
+            try:
+                redis = get_redis(CACHE)
+                self.toggles = await profiler.route_toggles(redis)
+            except Exception as e:
+                logger.warning(f"Failed to load profiling toggles: {e}")
+        expired = [field for field, toggle in self.toggles.items() if toggle["expires_at"] <= time.time()]
+        for field in expired:
+            del self.toggles[field]
+        return self.toggles
@@ -0,0 +1,53 @@
+import logging
+import time
+
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core import metrics, query_stats
+from app.core.config import settings
+
+
+class QueryStatsMiddleware(BaseHTTPMiddleware):
+    """
+    Counts the SQL statements each request runs and their total and slowest
+    time. Requests over SLOW_REQUEST_SECONDS or SLOW_REQUEST_QUERIES are logged
+    as one JSON line, together with statements repeated often enough to look
+    like an N+1 pattern. Optionally reports the DB time in a Server-Timing header.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        # Set before call_next, whose task copies this context
+        stats = query_stats.start()
+        started = time.perf_counter()
+        response = await call_next(request)
+        elapsed = time.perf_counter() - started
+
+        route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+        metrics.http_request_db_queries.observe(stats.count, route=route, method=request.method)
+
+        if settings.SERVER_TIMING:
+            response.headers["Server-Timing"] = (
+                f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries", '
+                f"app;dur={elapsed * 1000:.1f}"
+            )
+
+        repeated = stats.repeated()
+        if elapsed >= settings.SLOW_REQUEST_SECONDS or stats.count > settings.SLOW_REQUEST_QUERIES or repeated:
+            query_stats.log_json(
+                logging.WARNING, "slow_request",
+                method=request.method,
+                route=route,
+                path=request.url.path,
+                status=response.status_code,
+                duration_ms=round(elapsed * 1000, 1),
+                db_queries=stats.count,
+                db_time_ms=round(stats.seconds * 1000, 1),
+                slowest_query_ms=round(stats.slowest_seconds * 1000, 1),
+                slowest_statement=query_stats.shorten(stats.slowest_statement),
+                repeated_statements=[
+                    {"statement": query_stats.shorten(statement), "count": count}
+                    for statement, count in repeated
+                ],
+            )
+        return response
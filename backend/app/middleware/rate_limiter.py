@@ -2,7 +2,8 @@ import time
 from typing import Dict, Optional, Tuple, Callable, List
 from fastapi import Request, Response
 import redis.asyncio as redis
-from app.core.config import settings
+from app.core import metrics
+from app.core.client import RATE_LIMIT, get_redis
 import hashlib
 import json
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -21,7 +22,7 @@ class SlidingWindowRateLimiter(BaseHTTPMiddleware):
     def __init__(
         self, 
         app: ASGIApp, 
-        redis_url: str = settings.REDIS_URL_CACHE,
+        redis_pool: str = RATE_LIMIT,  # Named pool (app.core.client)
         default_rate: int = 60,  # requests per minute
         default_window: int = 60,  # window size in seconds
         endpoint_limits: Dict[str, Tuple[int, int]] = None,  # {endpoint: (rate, window_size)}
@@ -30,8 +31,7 @@ class SlidingWindowRateLimiter(BaseHTTPMiddleware):
         key_func: Callable = None
     ):
         super().__init__(app)
-        self.redis_url = redis_url
-        self.redis_pool = None
+        self.redis_pool = redis_pool
         self.default_rate = default_rate
         self.default_window = default_window
         self.endpoint_limits = endpoint_limits or {}
@@ -40,10 +40,8 @@ class SlidingWindowRateLimiter(BaseHTTPMiddleware):
         self.key_func = key_func or self._default_key_func
     
     async def get_redis(self) -> redis.Redis:
-        """Get or create Redis connection pool"""
-        if self.redis_pool is None:
-            self.redis_pool = redis.ConnectionPool.from_url(self.redis_url)
-        return redis.Redis(connection_pool=self.redis_pool)
+        """The shared client of the limiter's Redis pool (closed with the app)"""
+        return get_redis(self.redis_pool)
     
     def _default_key_func(self, request: Request) -> str:
         """Generate a unique key for the rate limit based on IP and path"""
@@ -58,21 +56,26 @@ class SlidingWindowRateLimiter(BaseHTTPMiddleware):
     
     def _get_limits(self, request: Request) -> Tuple[int, int]:
         """Get rate and window size for the current endpoint"""
+        _, rate, window_size = self._get_rule(request)
+        return rate, window_size
+    
+    def _get_rule(self, request: Request) -> Tuple[str, int, int]:
+        """Get the matching endpoint_limits key ('default' if none), rate and window size"""
         path = request.url.path
         method = request.method
         
         # Check for exact path match
         if f"{path}:{method}" in self.endpoint_limits:
-            return self.endpoint_limits[f"{path}:{method}"]
+            return (f"{path}:{method}", *self.endpoint_limits[f"{path}:{method}"])
         
         # Check for path prefix matches
         for endpoint, limits in self.endpoint_limits.items():
             if ":" in endpoint:
                 endpoint_path, endpoint_method = endpoint.split(":")
                 if path.startswith(endpoint_path) and method == endpoint_method:
-                    return limits
+                    return (endpoint, *limits)
         
-        return self.default_rate, self.default_window
+        return "default", self.default_rate, self.default_window
     
     async def _check_rate_limit(self, key: str, rate: int, window_size: int) -> Tuple[bool, int, float]:
         """
@@ -140,13 +143,14 @@ class SlidingWindowRateLimiter(BaseHTTPMiddleware):
             return await call_next(request)
         
         # Get rate limits for this endpoint
-        rate, window_size = self._get_limits(request)
+        rule, rate, window_size = self._get_rule(request)
         
         # Generate key for this request
         key = self.key_func(request)
         
         # Check rate limit
         allowed, remaining, reset_time = await self._check_rate_limit(key, rate, window_size)
+        metrics.rate_limit_decisions.inc(rule=rule, decision="allow" if allowed else "deny")
         
         # If rate limit exceeded, return 429 Too Many Requests
         if not allowed:
@@ -0,0 +1,44 @@
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core import tracing
+
+
+class TracingMiddleware(BaseHTTPMiddleware):
+    """
+    Starts a trace per request (sampled, or continuing the caller's traceparent
+    header) whose root span covers the whole request, so middleware Redis calls,
+    SQL statements, template rendering, email sends and Celery publishes become
+    its children. Add it last so it is the outermost middleware.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        root = tracing.start_trace(
+            f"{request.method} {request.url.path}",
+            request.headers.get("traceparent"),
+            tracing.KIND_SERVER,
+            **{"http.method": request.method, "http.target": request.url.path},
+        )
+        if root is None:
+            return await call_next(request)
+
+        # Set before call_next, whose task copies this context
+        token = tracing.activate(root)
+        try:
+            response = await call_next(request)
+        except BaseException as e:
+            root.set_error(e)
+            raise
+        else:
+            root.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                root.status = tracing.STATUS_ERROR
+            response.headers["traceparent"] = root.traceparent
+            return response
+        finally:
+            route = getattr(request.scope.get("route"), "path", None)
+            if route:
+                root.name = f"{request.method} {route}"
+                root.set_attribute("http.route", route)
+            tracing.deactivate(token)
+            root.end()
@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta, timezone, date
 import math
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import Boolean, Enum, Integer, String, Column, DateTime, Date, ForeignKey
+from sqlalchemy import BigInteger, Boolean, Enum, Integer, String, Column, DateTime, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 import enum
@@ -18,6 +18,7 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     role = Column(Enum(Role), default=Role.CUSTOMER)
     is_verified = Column(Boolean, default=False)
+    timezone = Column(String(64), nullable=True) # IANA name, e.g. 'Asia/Dhaka'; used for reminder send times
 
     # Relationships (if customers have installments)
     installments = relationship("Installment", back_populates="user")
@@ -127,3 +128,62 @@ class Payment(Base):
     @amount_in_bdt.setter
     def amount_in_bdt(self, value):
         self.amount = int(value * 100)  # Store amount in cents
+
+
+# Daily rollups used by the admin reports so that period totals read one row
+# per day instead of scanning the raw payments/installments tables.
+class PaymentDaily(Base):
+    __tablename__ = "payments_daily"
+    day = Column(Date, primary_key=True) # UTC date of payment_date
+    total_amount = Column(BigInteger, nullable=False, default=0) # Sum of payments.amount in cents
+    payment_count = Column(Integer, nullable=False, default=0)
+
+
+class DueDaily(Base):
+    __tablename__ = "dues_daily"
+    day = Column(Date, primary_key=True) # installments.due_date
+    total_remaining = Column(BigInteger, nullable=False, default=0) # Sum of installments.remaining_amount in cents
+    installment_count = Column(Integer, nullable=False, default=0)
+
+
+# Nightly snapshot of the aging (delinquency) report over open installments.
+# Amounts are remaining_amount in cents, bucketed by days past due_date.
+class AgingCustomerSnapshot(Base):
+    __tablename__ = "aging_customer_snapshots"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    as_of = Column(Date, nullable=False)
+    current_amount = Column(BigInteger, nullable=False, default=0)
+    current_count = Column(Integer, nullable=False, default=0)
+    days_1_30_amount = Column(BigInteger, nullable=False, default=0)
+    days_1_30_count = Column(Integer, nullable=False, default=0)
+    days_31_60_amount = Column(BigInteger, nullable=False, default=0)
+    days_31_60_count = Column(Integer, nullable=False, default=0)
+    days_61_90_amount = Column(BigInteger, nullable=False, default=0)
+    days_61_90_count = Column(Integer, nullable=False, default=0)
+    days_90_plus_amount = Column(BigInteger, nullable=False, default=0)
+    days_90_plus_count = Column(Integer, nullable=False, default=0)
+    total_overdue = Column(BigInteger, nullable=False, default=0)
+    max_days_overdue = Column(Integer, nullable=False, default=0)
+
+    # Keyset pagination of the drill-down, most overdue first
+    __table_args__ = (
+        Index("ix_aging_customer_snapshots_total_overdue_user", total_overdue.desc(), user_id),
+    )
+
+
+class AgingBucketSnapshot(Base):
+    __tablename__ = "aging_bucket_snapshots"
+    bucket = Column(String(16), primary_key=True) # 'current', '1-30', '31-60', '61-90', '90+'
+    as_of = Column(Date, nullable=False)
+    installment_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(BigInteger, nullable=False, default=0)
+
+
+# One row per reminder that went out, so overlapping or retried reminder jobs
+# send each kind of reminder at most once per due cycle (installment due date).
+class NotificationDelivery(Base):
+    __tablename__ = "notification_deliveries"
+    installment_id = Column(Integer, ForeignKey("installments.id", ondelete="CASCADE"), primary_key=True)
+    due_date = Column(Date, primary_key=True) # installments.due_date the reminder was about
+    kind = Column(String(32), primary_key=True) # e.g. 'due_in_3_days', 'due_in_1_days'
+    sent_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field, EmailStr, field_validator, validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone, date
 from enum import Enum
+from app.utils.time_utils import is_valid_timezone
 
 # auth schemas
 class UserRole(str, Enum):
@@ -12,6 +13,14 @@ class UserRegister(BaseModel):
     email: EmailStr
     name: Optional[str] = None
     password: str
+    timezone: Optional[str] = Field(default=None, description="IANA timezone, e.g. 'Asia/Dhaka'")
+
+    @field_validator('timezone')
+    @classmethod
+    def validate_timezone(cls, v):
+        if v is not None and not is_valid_timezone(v):
+            raise ValueError(f"Unknown timezone: {v}")
+        return v
 
 class OTPResponse(BaseModel):
     email: EmailStr
@@ -32,6 +41,7 @@ class UserResponse(BaseModel):
     name: Optional[str] = None
     role: UserRole
     is_verified: bool
+    timezone: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -118,6 +128,45 @@ class PaginatedReportResponse(ReportResponse):
     payments: List[Dict[str, Any]]
     pagination: PaginationInfo
 
+# Schemas for the time-series report
+class TimeSeriesPoint(BaseModel):
+    start_date: date
+    end_date: date
+    total_paid: float
+    total_due: float
+
+class TimeSeriesResponse(BaseModel):
+    bucket: str
+    from_date: date
+    to_date: date
+    points: List[TimeSeriesPoint]
+
+# Schemas for the aging (delinquency) report
+class AgingBucket(BaseModel):
+    bucket: str
+    installment_count: int
+    total_amount: float
+
+class AgingSummaryResponse(BaseModel):
+    as_of: date
+    source: str  # 'snapshot' or 'live'
+    buckets: List[AgingBucket]
+
+class AgingCustomer(BaseModel):
+    user_id: int
+    name: Optional[str] = None
+    email: str
+    amounts: Dict[str, float]
+    counts: Dict[str, int]
+    total_overdue: float
+    max_days_overdue: int
+
+class AgingCustomerPage(BaseModel):
+    as_of: date
+    source: str  # 'snapshot' or 'live'
+    items: List[AgingCustomer]
+    next_cursor: Optional[str] = None
+
 # Schema for paginated payment response
 class PaginatedPaymentResponse(BaseModel):
     items: List[PaymentResponse]
@@ -132,4 +181,55 @@ class PaginatedInstallmentResponse(BaseModel):
     pagination: PaginationInfo
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Schemas for report export jobs
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    PARQUET = "parquet"
+
+class ExportCreate(BaseModel):
+    report_type: str = Field(description="'weekly', 'monthly' or 'all'")
+    year: Optional[int] = None
+    period: Optional[int] = Field(default=None, description="Week number for weekly, month for monthly reports")
+    format: ExportFormat = ExportFormat.CSV
+
+class ExportJobResponse(BaseModel):
+    job_id: str
+    status: str
+    rows_written: int = 0
+    total_rows: Optional[int] = None
+    progress: Optional[float] = None
+    download_url: Optional[str] = None
+    error: Optional[str] = None
+
+# Schemas for on-demand request profiling
+class ProfileTokenResponse(BaseModel):
+    header: str
+    token: str
+    expires_at: datetime
+
+class ProfileInfo(BaseModel):
+    id: str
+    created_at: datetime
+    method: str
+    path: str
+    route: Optional[str] = None
+    status: int
+    trigger: str  # 'header' or 'route'
+    duration_ms: float
+    samples: int
+    interval_ms: float
+    size_bytes: int
+
+class RouteProfilingCreate(BaseModel):
+    method: str
+    route: str = Field(description="Route template, e.g. /payments/")
+    percent: float = Field(gt=0, le=100, description="Share of the route's requests to profile")
+    ttl_seconds: int = Field(default=600, gt=0, description="How long sampling stays enabled")
+
+class RouteProfilingResponse(BaseModel):
+    method: str
+    route: str
+    percent: float
+    expires_at: datetime
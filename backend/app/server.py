@@ -0,0 +1,160 @@
+"""
+Production web server: a master process and WEB_WORKERS uvicorn worker
+processes sharing one listening socket, so requests use every core.
+
+The master creates the tables and seed data once (under the startup lock),
+imports the app when preloading so the forked workers share its memory,
+binds the socket and supervises the workers: a worker that dies is
+replaced, and SIGTERM or SIGINT shuts them all down gracefully (a second
+signal kills them). Each worker opens its own database, Redis and HTTP
+connections after the fork. Usage:
+
+    python -m app.server --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+import uvicorn
+
+from app.core.config import settings
+from app.core.database import async_engine
+from app.core.startup import run_startup_tasks
+
+logger = logging.getLogger("app.server")
+
+# Exit code of a worker whose app failed to start (the same as uvicorn's)
+STARTUP_FAILURE = 3
+
+# A worker that exits sooner than this after starting is replaced after a pause
+MIN_WORKER_LIFETIME = 1.0
+
+
+async def _prepare() -> None:
+    await run_startup_tasks()
+    # Leave no pooled connections behind for the workers to inherit
+    await async_engine.dispose()
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """Forks the workers and keeps that many running until told to stop"""
+
+    def __init__(self, config: uvicorn.Config, sock: socket.socket, workers: int):
+        self.config = config
+        self.sock = sock
+        self.workers = workers
+        self.children: Dict[int, float] = {}  # pid -> start time
+        self.stopping = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = STARTUP_FAILURE
+            try:
+                # Its own process group, so a terminal's Ctrl-C reaches only the
+                # master, which forwards it once
+                os.setpgid(0, 0)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                server = uvicorn.Server(self.config)
+                server.run(sockets=[self.sock])
+                if server.started:
+                    code = 0
+            except BaseException:
+                logger.exception(f"Worker {os.getpid()} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        logger.info(f"Started worker {pid}")
+
+    def _signal_all(self, signum: int) -> None:
+        for pid in self.children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def stop(self, signum=None, frame=None) -> None:
+        if self.stopping:
+            logger.warning("Killing workers")
+            self._signal_all(signal.SIGKILL)
+            return
+        self.stopping = True
+        logger.info("Shutting down workers...")
+        self._signal_all(signal.SIGTERM)
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+
+        exit_code = 0
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code == STARTUP_FAILURE:
+                logger.error(f"Worker {pid} failed to start the app; shutting down")
+                exit_code = code
+                self.stop()
+                continue
+            logger.warning(f"Worker {pid} exited with code {code}; starting a replacement")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            if not self.stopping:
+                self.spawn()
+        return exit_code
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=settings.WEB_WORKERS, help="Worker processes (0 = one per CPU)")
+    parser.add_argument("--preload", action=argparse.BooleanOptionalAction, default=settings.WEB_PRELOAD,
+                        help="Import the app once in the master before forking the workers")
+    parser.add_argument("--host", default=settings.WEB_HOST)
+    parser.add_argument("--port", type=int, default=settings.WEB_PORT)
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=settings.LOG_LEVEL,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    workers = args.workers or os.cpu_count() or 1
+
+    if settings.RUN_STARTUP_TASKS:
+        asyncio.run(_prepare())
+        # Done once for all of them: the workers' lifespans skip it
+        settings.RUN_STARTUP_TASKS = False
+
+    app = "app.main:app"
+    if args.preload:
+        from app.main import app
+    config = uvicorn.Config(app, host=args.host, port=args.port, log_level=settings.LOG_LEVEL.lower())
+    sock = _bind(args.host, args.port)
+    logger.info(f"Listening on {args.host}:{args.port} with {workers} workers (preload: {args.preload})")
+    sys.exit(Supervisor(config, sock, workers).run())
+
+
+if __name__ == "__main__":
+    main()
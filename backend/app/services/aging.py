@@ -0,0 +1,199 @@
+from datetime import date
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Namespace of cached snapshot reads (app.core.cache), dropped when the snapshot is rebuilt
+CACHE_NAMESPACE = "aging"
+
+# Aging buckets by days past due, and the snapshot column prefix for each
+AGING_BUCKETS = {
+    "current": "current",
+    "1-30": "days_1_30",
+    "31-60": "days_31_60",
+    "61-90": "days_61_90",
+    "90+": "days_90_plus",
+}
+
+# Open installments with their days past due as of :today (<= 0 means not yet due)
+_OPEN_INSTALLMENTS_SQL = """
+    SELECT user_id,
+           remaining_amount,
+           (CAST(:today AS DATE) - due_date::date) AS days_overdue
+    FROM installments
+    WHERE remaining_amount > 0
+      AND due_date IS NOT NULL
+"""
+
+_BUCKET_CASE_SQL = """
+    CASE
+        WHEN days_overdue <= 0 THEN 'current'
+        WHEN days_overdue <= 30 THEN '1-30'
+        WHEN days_overdue <= 60 THEN '31-60'
+        WHEN days_overdue <= 90 THEN '61-90'
+        ELSE '90+'
+    END
+"""
+
+_BUCKET_FILTERS = {
+    "current": "days_overdue <= 0",
+    "1-30": "days_overdue BETWEEN 1 AND 30",
+    "31-60": "days_overdue BETWEEN 31 AND 60",
+    "61-90": "days_overdue BETWEEN 61 AND 90",
+    "90+": "days_overdue > 90",
+}
+
+# Per-customer aggregates; the column list matches aging_customer_snapshots
+_CUSTOMER_COLUMNS = ["user_id"] + [
+    f"{prefix}_{kind}" for prefix in AGING_BUCKETS.values() for kind in ("amount", "count")
+] + ["total_overdue", "max_days_overdue"]
+
+_CUSTOMERS_SQL = "SELECT user_id, " + ", ".join(
+    f"COALESCE(SUM(remaining_amount) FILTER (WHERE {_BUCKET_FILTERS[bucket]}), 0) AS {prefix}_amount, "
+    f"COUNT(*) FILTER (WHERE {_BUCKET_FILTERS[bucket]}) AS {prefix}_count"
+    for bucket, prefix in AGING_BUCKETS.items()
+) + f""",
+           COALESCE(SUM(remaining_amount) FILTER (WHERE days_overdue > 0), 0) AS total_overdue,
+           GREATEST(MAX(days_overdue), 0) AS max_days_overdue
+    FROM ({_OPEN_INSTALLMENTS_SQL}) open_installments
+    WHERE user_id IS NOT NULL
+    GROUP BY user_id
+"""
+
+
+def _format_buckets(rows) -> List[dict]:
+    totals = {row.bucket: row for row in rows}
+    return [
+        {
+            "bucket": bucket,
+            "installment_count": totals[bucket].installment_count if bucket in totals else 0,
+            "total_amount": (totals[bucket].total_amount if bucket in totals else 0) / 100.0,  # Convert cents to BDT
+        }
+        for bucket in AGING_BUCKETS
+    ]
+
+
+async def live_summary(db: AsyncSession, today: Optional[date] = None) -> List[dict]:
+    """Count and amount per aging bucket, computed with one set-based query"""
+    result = await db.execute(text(f"""
+        SELECT {_BUCKET_CASE_SQL} AS bucket,
+               COUNT(*) AS installment_count,
+               SUM(remaining_amount) AS total_amount
+        FROM ({_OPEN_INSTALLMENTS_SQL}) open_installments
+        GROUP BY 1
+    """), {"today": today or date.today()})
+    return _format_buckets(result.fetchall())
+
+
+async def snapshot_summary(db: AsyncSession) -> Optional[Tuple[date, List[dict]]]:
+    """Bucket totals from the latest snapshot, or None if no snapshot was taken yet"""
+    result = await db.execute(text(
+        "SELECT bucket, as_of, installment_count, total_amount FROM aging_bucket_snapshots"
+    ))
+    rows = result.fetchall()
+    if not rows:
+        return None
+    return rows[0].as_of, _format_buckets(rows)
+
+
+async def snapshot_as_of(db: AsyncSession) -> Optional[date]:
+    """Date of the latest snapshot, or None if no snapshot was taken yet"""
+    result = await db.execute(text("SELECT MAX(as_of) FROM aging_bucket_snapshots"))
+    return result.scalar()
+
+
+def encode_cursor(amount: int, user_id: int) -> str:
+    return f"{amount}:{user_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Raises ValueError for a malformed cursor"""
+    amount, user_id = cursor.split(":")
+    return int(amount), int(user_id)
+
+
+async def customer_page(
+    db: AsyncSession,
+    bucket: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    live: bool = False,
+    today: Optional[date] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    One page of customers with open balances, most overdue first (or largest
+    amount in the given bucket first), using keyset pagination on
+    (amount, user_id). Reads the snapshot unless live is True.
+    Returns the rows and the cursor of the next page (None on the last page).
+    """
+    if bucket is not None and bucket not in AGING_BUCKETS:
+        raise ValueError(f"Invalid bucket. Use one of: {', '.join(AGING_BUCKETS)}")
+    sort_column = f"{AGING_BUCKETS[bucket]}_amount" if bucket else "total_overdue"
+
+    if live:
+        source = f"({_CUSTOMERS_SQL})"
+        params = {"today": today or date.today()}
+    else:
+        source = "aging_customer_snapshots"
+        params = {}
+
+    conditions = [f"c.{sort_column} > 0"]
+    if cursor:
+        cursor_amount, cursor_user = decode_cursor(cursor)
+        conditions.append(
+            f"(c.{sort_column} < :cursor_amount OR (c.{sort_column} = :cursor_amount AND c.user_id > :cursor_user))"
+        )
+        params.update(cursor_amount=cursor_amount, cursor_user=cursor_user)
+    params["limit"] = limit + 1  # One extra row tells us whether there is a next page
+
+    result = await db.execute(text(f"""
+        SELECT c.*, u.name, u.email
+        FROM {source} c
+        JOIN users u ON u.id = c.user_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY c.{sort_column} DESC, c.user_id
+        LIMIT :limit
+    """), params)
+    rows = result.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column), last.user_id)
+
+    items = [
+        {
+            "user_id": row.user_id,
+            "name": row.name,
+            "email": row.email,
+            "amounts": {bucket: getattr(row, f"{prefix}_amount") / 100.0 for bucket, prefix in AGING_BUCKETS.items()},
+            "counts": {bucket: getattr(row, f"{prefix}_count") for bucket, prefix in AGING_BUCKETS.items()},
+            "total_overdue": row.total_overdue / 100.0,  # Convert cents to BDT
+            "max_days_overdue": row.max_days_overdue,
+        }
+        for row in rows
+    ]
+    return items, next_cursor
+
+
+async def rebuild_snapshot(db: AsyncSession, today: Optional[date] = None) -> dict:
+    """Replace both aging snapshot tables with the state as of today and commit"""
+    today = today or date.today()
+    params = {"today": today}
+    await db.execute(text("DELETE FROM aging_customer_snapshots"))
+    await db.execute(text("DELETE FROM aging_bucket_snapshots"))
+    columns = ", ".join(_CUSTOMER_COLUMNS)
+    customers = await db.execute(text(f"""
+        INSERT INTO aging_customer_snapshots (as_of, {columns})
+        SELECT CAST(:today AS DATE), {columns} FROM ({_CUSTOMERS_SQL}) customers
+    """), params)
+    buckets = await db.execute(text(f"""
+        INSERT INTO aging_bucket_snapshots (bucket, as_of, installment_count, total_amount)
+        SELECT {_BUCKET_CASE_SQL}, CAST(:today AS DATE), COUNT(*), SUM(remaining_amount)
+        FROM ({_OPEN_INSTALLMENTS_SQL}) open_installments
+        GROUP BY 1
+    """), params)
+    await db.commit()
+    return {"as_of": today.isoformat(), "customers": customers.rowcount, "buckets": buckets.rowcount}
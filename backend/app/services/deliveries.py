@@ -0,0 +1,60 @@
+from typing import List, Set
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.db_models import Installment, NotificationDelivery
+
+logger = logging.getLogger(__name__)
+
+
+def reminder_kind(days_ahead: int) -> str:
+    """Ledger kind of the reminder sent by the job looking days_ahead days out"""
+    return f"due_in_{days_ahead}_days"
+
+
+def reminder_days_ahead(kind: str) -> int:
+    """Inverse of reminder_kind; raises ValueError for other kinds"""
+    prefix, suffix = "due_in_", "_days"
+    if not (kind.startswith(prefix) and kind.endswith(suffix)):
+        raise ValueError(f"Unknown reminder kind: {kind}")
+    return int(kind[len(prefix):-len(suffix)])
+
+
+async def delivered_installment_ids(db: AsyncSession, installments: List[Installment], kind: str) -> Set[int]:
+    """
+    Ids of the installments that already got this kind of reminder for their
+    current due date, checked with one query for the whole list. Rows with
+    id and due_date columns work as well as Installment objects.
+    """
+    if not installments:
+        return set()
+    result = await db.execute(
+        select(NotificationDelivery.installment_id, NotificationDelivery.due_date).where(
+            NotificationDelivery.kind == kind,
+            NotificationDelivery.installment_id.in_([installment.id for installment in installments]),
+        )
+    )
+    delivered = set(result.all())
+    return {installment.id for installment in installments if (installment.id, installment.due_date) in delivered}
+
+
+async def record_deliveries(db: AsyncSession, installments: List[Installment], kind: str) -> int:
+    """
+    Record that the installments got this kind of reminder for their current
+    due date, with one multi-row insert, and commit.
+    Returns the number of ledger rows written (existing rows are left alone).
+    """
+    if not installments:
+        return 0
+    stmt = insert(NotificationDelivery).values([
+        {"installment_id": installment.id, "due_date": installment.due_date, "kind": kind}
+        for installment in installments
+    ]).on_conflict_do_nothing(
+        index_elements=[NotificationDelivery.installment_id, NotificationDelivery.due_date, NotificationDelivery.kind]
+    )
+    result = await db.execute(stmt)
+    await db.commit()
+    return result.rowcount
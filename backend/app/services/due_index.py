@@ -0,0 +1,75 @@
+from datetime import date
+from typing import List, Optional
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.client import QUEUE, get_redis
+from app.models.db_models import Installment
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of open installments: member = installment id, score = due date (proleptic ordinal)
+DUE_INDEX_KEY = "installments:due"
+
+# Installments written per pipeline while rebuilding
+_REBUILD_BATCH = 5000
+
+
+def due_score(day: date) -> int:
+    return day.toordinal()
+
+
+async def update(installment_id: int, due_date: Optional[date], remaining_amount: int, redis=None) -> None:
+    """
+    Index an installment under its due date, or drop it once it has nothing left to pay.
+    Called after the change is committed; a failure only leaves drift for the
+    reconciler to repair. Callers outside the web app pass their own client.
+    """
+    try:
+        if redis is None:
+            redis = get_redis(QUEUE)
+        if remaining_amount > 0 and due_date is not None:
+            await redis.zadd(DUE_INDEX_KEY, {str(installment_id): due_score(due_date)})
+        else:
+            await redis.zrem(DUE_INDEX_KEY, str(installment_id))
+    except Exception as e:
+        logger.warning(f"Failed to update due index for installment {installment_id}: {e}")
+
+
+async def ids_due_between(redis, start: date, end: date) -> List[int]:
+    """Ids of the indexed installments due between two days (inclusive), in O(log n + k)"""
+    members = await redis.zrangebyscore(DUE_INDEX_KEY, due_score(start), due_score(end))
+    return [int(member) for member in members]
+
+
+async def index_size(redis) -> int:
+    return await redis.zcard(DUE_INDEX_KEY)
+
+
+async def rebuild(db: AsyncSession, redis) -> int:
+    """
+    Rebuild the index from the installments table. The new index is written
+    under a temporary key and swapped in with RENAME, so sweeps never see a
+    partial index. Updates that race a rebuild may be lost until the next one.
+    Returns the number of indexed installments.
+    """
+    temp_key = f"{DUE_INDEX_KEY}:rebuild"
+    await redis.delete(temp_key)
+    indexed = 0
+
+    query = select(Installment.id, Installment.due_date).where(
+        Installment.remaining_amount > 0,
+        Installment.due_date.isnot(None),
+    ).execution_options(yield_per=_REBUILD_BATCH)
+    result = await db.stream(query)
+    async for batch in result.partitions():
+        await redis.zadd(temp_key, {str(row.id): due_score(row.due_date) for row in batch})
+        indexed += len(batch)
+
+    if indexed:
+        await redis.rename(temp_key, DUE_INDEX_KEY)
+    else:
+        await redis.delete(DUE_INDEX_KEY)
+    return indexed
@@ -1,51 +1,39 @@
+import asyncio
+import logging
 from datetime import datetime
+from typing import List, Tuple
 from pydantic import EmailStr
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, From, To, Content
 from app.core.config import settings
-import os
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from app.services import templates
+from app.services.email_transport import BatchRecipient, EmailBatch, EmailMessage, get_email_transport
 
-# Set up Jinja2 environment for email templates
-template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-env = Environment(
-    loader=FileSystemLoader(template_dir),
-    autoescape=select_autoescape(['html', 'xml'])
-)
+logger = logging.getLogger(__name__)
 
-def send_email(to_email: EmailStr, subject: str, content: str):
+async def send_email(to_email: EmailStr, subject: str, content: str):
     """
-    Send a generic email with HTML content
+    Send a generic email with HTML content through the pooled async transport.
+    Returns the EmailResult, or None if the email could not be delivered.
     """
-    message = Mail(
-        from_email=From(settings.EMAIL_SENDER, "Installment Manager"),
-        to_emails=To(to_email),
-        subject=subject,
-        html_content=Content("text/html", content),
-    )
     try:
-        sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
-        response = sg.send(message)
-        return response
+        result = await get_email_transport().send(
+            EmailMessage(to_email=to_email, subject=subject, html_content=content)
+        )
     except Exception as e:
-        print(f"Error sending email: {e}")
-        if hasattr(e, 'body'):
-            print(e.body)
-
+        logger.error(f"Error sending email: {e}")
         return None
+    
+    return result if result.ok else None
 
-def send_otp_email(to_email: EmailStr, otp: str, expiry_minutes: int = 5):
+async def send_otp_email(to_email: EmailStr, otp: str, expiry_minutes: int = 5):
     """
     Send an OTP verification email using the template
     """
-    # Get the template
-    template = env.get_template("otp_email.html")
-    
     # Create verification URL (optional, can be used if you have a frontend page)
     # verification_url = f"{settings.FRONTEND_URL}/verify?email={to_email}"
     
-    # Render the template with the OTP and expiry time
-    html_content = template.render(
+    # Render the precompiled template with the OTP and expiry time
+    html_content = templates.render(
+        "otp_email.html",
         otp=otp,
         expiry_minutes=expiry_minutes,
         # verification_url=verification_url
@@ -53,21 +41,66 @@ def send_otp_email(to_email: EmailStr, otp: str, expiry_minutes: int = 5):
     
     # Send the email
     subject = "Your Verification Code - Installment Manager"
-    return send_email(to_email, subject, html_content)
+    return await send_email(to_email, subject, html_content)
+
+DUE_EMAIL_SUBJECT = "Reminder: Installment Due - Installment Manager"
+
+# Per-recipient fields of due_email.html
+DUE_EMAIL_FIELDS = ("product_name", "due_date")
 
 async def send_due_email(to_email: EmailStr, product_name: str, due_date: datetime):
     """
     Send a due date reminder email using the template
     """
-    # Get the template
-    template = env.get_template("due_email.html")
-    
-    # Render the template with the product name and due date
-    html_content = template.render(
+    # Render the precompiled template with the product name and due date
+    html_content = templates.render(
+        "due_email.html",
         product_name=product_name,
         due_date=due_date
     )
 
     # Send the email
-    subject = "Reminder: Installment Due - Installment Manager"
-    return send_email(to_email, subject, html_content)
\ No newline at end of file
+    return await send_email(to_email, DUE_EMAIL_SUBJECT, html_content)
+
+async def send_due_emails(reminders: List[Tuple[str, str, datetime]]) -> List[bool]:
+    """
+    Send due reminders, given as (to_email, product_name, due_date), in provider
+    batches of up to EMAIL_BATCH_SIZE recipients: one request per batch, with
+    each recipient's product name and due date filled in by the provider.
+    If a batch is rejected, its recipients are retried one by one so a single
+    bad address does not fail the others.
+    Returns whether each reminder was delivered, in input order.
+    """
+    # The static shell is rendered once; the provider fills in the tagged fields
+    shell = templates.get_shell("due_email.html", DUE_EMAIL_FIELDS)
+    html_content = shell.tagged()
+    recipients = [
+        BatchRecipient(
+            to_email=to_email,
+            substitutions=shell.substitutions({"product_name": product_name, "due_date": due_date}),
+        )
+        for to_email, product_name, due_date in reminders
+    ]
+    batches = [
+        EmailBatch(DUE_EMAIL_SUBJECT, html_content, recipients[start:start + settings.EMAIL_BATCH_SIZE])
+        for start in range(0, len(recipients), settings.EMAIL_BATCH_SIZE)
+    ]
+    outcomes = await asyncio.gather(*(_send_batch_or_individually(batch) for batch in batches))
+    return [delivered for batch_outcome in outcomes for delivered in batch_outcome]
+
+async def _send_batch_or_individually(batch: EmailBatch) -> List[bool]:
+    transport = get_email_transport()
+    try:
+        result = await transport.send_batch(batch)
+        if result.ok:
+            return [True] * len(batch.recipients)
+        logger.warning(f"Batch of {len(batch.recipients)} reminders rejected ({result.status_code}), "
+                       f"retrying recipients individually")
+    except Exception as e:
+        logger.error(f"Error sending batch of {len(batch.recipients)} reminders: {e}")
+    
+    async def send_one(recipient):
+        message = batch.render(recipient)
+        return await send_email(message.to_email, message.subject, message.html_content) is not None
+    
+    return list(await asyncio.gather(*(send_one(recipient) for recipient in batch.recipients)))
@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.core import tracing
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: provider throttling and transient server errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Default send rate (requests/second, burst) per provider when EMAIL_RATE_PER_SECOND is unset
+PROVIDER_RATE_LIMITS = {
+    "sendgrid": (10.0, 20),
+    "fake": (0.0, 0),  # Unlimited
+}
+
+
+@dataclass
+class EmailMessage:
+    to_email: str
+    subject: str
+    html_content: str
+
+
+@dataclass
+class BatchRecipient:
+    to_email: str
+    substitutions: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class EmailBatch:
+    """One shared subject/body sent to many recipients, each with its own substitutions"""
+    subject: str
+    html_content: str
+    recipients: List[BatchRecipient]
+
+    def render(self, recipient: BatchRecipient) -> EmailMessage:
+        """The single message this batch amounts to for one recipient"""
+        subject, html_content = self.subject, self.html_content
+        for tag, value in recipient.substitutions.items():
+            subject = subject.replace(tag, value)
+            html_content = html_content.replace(tag, value)
+        return EmailMessage(to_email=recipient.to_email, subject=subject, html_content=html_content)
+
+
+@dataclass
+class EmailResult:
+    status_code: int
+    ok: bool
+    error: Optional[str] = None
+    retry_after: Optional[float] = None
+    attempts: int = 1
+
+
+class SendGridBackend:
+    """SendGrid v3 mail/send over one persistent, pooled HTTP client"""
+
+    name = "sendgrid"
+
+    def __init__(self):
+        import httpx  # Only this backend needs it; keeps it off the web process's startup
+
+        self._client = httpx.AsyncClient(
+            base_url="https://api.sendgrid.com",
+            headers={"Authorization": f"Bearer {settings.SENDGRID_API_KEY}"},
+            timeout=settings.EMAIL_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.EMAIL_MAX_CONCURRENCY,
+                max_keepalive_connections=settings.EMAIL_MAX_CONCURRENCY,
+            ),
+        )
+
+    @staticmethod
+    def build_payload(message: EmailMessage) -> dict:
+        return {
+            "personalizations": [{"to": [{"email": message.to_email}]}],
+            "from": {"email": settings.EMAIL_SENDER, "name": "Installment Manager"},
+            "subject": message.subject,
+            "content": [{"type": "text/html", "value": message.html_content}],
+        }
+
+    @staticmethod
+    def build_batch_payload(batch: EmailBatch) -> dict:
+        # One personalization per recipient, so nobody sees the other addresses
+        return {
+            "personalizations": [
+                {"to": [{"email": recipient.to_email}], "substitutions": recipient.substitutions}
+                for recipient in batch.recipients
+            ],
+            "from": {"email": settings.EMAIL_SENDER, "name": "Installment Manager"},
+            "subject": batch.subject,
+            "content": [{"type": "text/html", "value": batch.html_content}],
+        }
+
+    async def send(self, message: EmailMessage) -> EmailResult:
+        return await self._post(self.build_payload(message))
+
+    async def send_batch(self, batch: EmailBatch) -> EmailResult:
+        return await self._post(self.build_batch_payload(batch))
+
+    async def _post(self, payload: dict) -> EmailResult:
+        import httpx
+
+        try:
+            response = await self._client.post("/v3/mail/send", json=payload)
+        except httpx.HTTPError as e:
+            # Network errors are treated like a transient server error
+            return EmailResult(status_code=503, ok=False, error=str(e))
+
+        retry_after = response.headers.get("Retry-After")
+        return EmailResult(
+            status_code=response.status_code,
+            ok=response.status_code < 400,
+            error=None if response.status_code < 400 else response.text[:500],
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+        )
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class FakeBackend:
+    """
+    Local stand-in for the provider, used for development and offline benchmarks.
+    Simulates latency and optional throttling/failures, and keeps the most
+    recent messages in memory.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency_ms: Optional[float] = None,
+        failure_rate: Optional[float] = None,
+        keep: int = 1000,
+    ):
+        self.latency = (settings.EMAIL_FAKE_LATENCY_MS if latency_ms is None else latency_ms) / 1000.0
+        self.failure_rate = settings.EMAIL_FAKE_FAILURE_RATE if failure_rate is None else failure_rate
+        self.keep = keep
+        self.sent: List[EmailMessage] = []
+        self.request_count = 0
+
+    async def send(self, message: EmailMessage) -> EmailResult:
+        return await self._accept([message])
+
+    async def send_batch(self, batch: EmailBatch) -> EmailResult:
+        return await self._accept([batch.render(recipient) for recipient in batch.recipients])
+
+    async def _accept(self, messages: List[EmailMessage]) -> EmailResult:
+        self.request_count += 1
+        await asyncio.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            return EmailResult(status_code=429, ok=False, error="Simulated throttling", retry_after=0.1)
+        self.sent.extend(messages)
+        del self.sent[:-self.keep]
+        return EmailResult(status_code=202, ok=True)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class TokenBucket:
+    """Async token bucket; rate <= 0 means unlimited"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Hold every sender back, e.g. after the provider answered 429 with Retry-After"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    return
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class EmailTransport:
+    """
+    Sends through a backend with bounded concurrency, a provider-aware rate
+    limit, and retries with exponential backoff on 429 and 5xx responses.
+    """
+
+    def __init__(self, backend, max_concurrency: Optional[int] = None, rate: Optional[float] = None, burst: Optional[int] = None):
+        default_rate, default_burst = PROVIDER_RATE_LIMITS.get(backend.name, (0.0, 0))
+        if rate is None:
+            rate = settings.EMAIL_RATE_PER_SECOND if settings.EMAIL_RATE_PER_SECOND is not None else default_rate
+        self.backend = backend
+        self.semaphore = asyncio.Semaphore(max_concurrency or settings.EMAIL_MAX_CONCURRENCY)
+        self.bucket = TokenBucket(rate, burst if burst is not None else max(default_burst, int(rate)))
+        self.max_retries = settings.EMAIL_MAX_RETRIES
+
+    async def send(self, message: EmailMessage) -> EmailResult:
+        return await self._deliver(lambda: self.backend.send(message), f"Email to {message.to_email}")
+
+    async def send_batch(self, batch: EmailBatch) -> EmailResult:
+        """
+        Send a batch as one provider request. The provider accepts or rejects
+        the request as a whole, so the result applies to every recipient.
+        """
+        return await self._deliver(
+            lambda: self.backend.send_batch(batch),
+            f"Batch email to {len(batch.recipients)} recipients",
+        )
+
+    async def _deliver(self, send, description: str) -> EmailResult:
+        with tracing.span("email.send", tracing.KIND_CLIENT, **{
+            "email.backend": type(self.backend).__name__, "email.description": description,
+        }) as span:
+            result = await self._deliver_with_retries(send, description)
+            if span is not None:
+                span.set_attribute("email.status_code", result.status_code)
+                span.set_attribute("email.attempts", result.attempts)
+                if not result.ok:
+                    span.status = tracing.STATUS_ERROR
+            return result
+
+    async def _deliver_with_retries(self, send, description: str) -> EmailResult:
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.bucket.acquire()
+            async with self.semaphore:
+                result = await send()
+            result.attempts = attempt
+
+            if result.ok or result.status_code not in RETRYABLE_STATUS or attempt > self.max_retries:
+                if not result.ok:
+                    logger.error(f"{description} failed after {attempt} attempt(s): "
+                                 f"{result.status_code} {result.error}")
+                return result
+
+            # Exponential backoff with jitter, or the provider's Retry-After when given
+            delay = result.retry_after or min(30.0, 0.5 * 2 ** (attempt - 1)) * (0.5 + random.random())
+            if result.status_code == 429:
+                self.bucket.pause(delay)
+            logger.warning(f"{description} got {result.status_code}, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self.backend.aclose()
+
+
+def create_backend(name: Optional[str] = None):
+    """Instantiate the configured email backend ('sendgrid' or 'fake')"""
+    name = name or settings.EMAIL_BACKEND
+    if name == "fake":
+        return FakeBackend()
+    if name == "sendgrid":
+        return SendGridBackend()
+    raise ValueError(f"Unknown email backend: {name}")
+
+
+# One transport per event loop: its HTTP connections belong to the loop that opened them
+_transport: Optional[EmailTransport] = None
+_transport_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_email_transport() -> EmailTransport:
+    """Get or create the transport for the running event loop"""
+    global _transport, _transport_loop
+    loop = asyncio.get_running_loop()
+    if _transport is None or _transport_loop is not loop:
+        if _transport is not None:
+            # Its connections belong to the other loop and can no longer be closed from here
+            logger.warning("Dropping an email transport left open on another event loop")
+        _transport = EmailTransport(create_backend())
+        _transport_loop = loop
+    return _transport
+
+
+async def close_email_transport() -> None:
+    """Close the transport's connections (on app or worker shutdown)"""
+    global _transport, _transport_loop
+    if _transport is not None and _transport_loop is asyncio.get_running_loop():
+        await _transport.aclose()
+    _transport = None
+    _transport_loop = None
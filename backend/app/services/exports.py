@@ -0,0 +1,115 @@
+import csv
+import gzip
+import importlib.util
+import os
+import time
+from typing import Iterable, Optional
+
+from app.core.config import settings
+
+# File extension and download media type per export format
+EXPORT_FORMATS = {
+    "csv": (".csv.gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+COLUMNS = ["id", "amount", "payment_date", "installment_id", "user_name", "user_email"]
+
+# State stored for a job when it is created: Celery reports ids it has never
+# seen as PENDING too, so this tells queued jobs apart from unknown ones
+QUEUED = "QUEUED"
+
+
+def parquet_available() -> bool:
+    """Parquet exports need the optional pyarrow package"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def export_path(job_id: str, fmt: str) -> str:
+    """Final location of an export file; the job id is the Celery task id"""
+    extension, _ = EXPORT_FORMATS[fmt]
+    return os.path.join(settings.EXPORT_DIR, f"{os.path.basename(job_id)}{extension}")
+
+
+def is_expired(path: str, now: Optional[float] = None) -> bool:
+    """Whether an export file is older than EXPORT_RETENTION_HOURS"""
+    return (now or time.time()) - os.path.getmtime(path) > settings.EXPORT_RETENTION_HOURS * 3600
+
+
+def delete_expired() -> int:
+    """Delete export files, and partial files of abandoned jobs, older than EXPORT_RETENTION_HOURS"""
+    if not os.path.isdir(settings.EXPORT_DIR):
+        return 0
+    deleted = 0
+    now = time.time()
+    for filename in os.listdir(settings.EXPORT_DIR):
+        path = os.path.join(settings.EXPORT_DIR, filename)
+        try:
+            # A running job's partial file is modified with every batch
+            if os.path.isfile(path) and is_expired(path, now):
+                os.remove(path)
+                deleted += 1
+        except OSError:
+            continue  # Removed meanwhile
+    return deleted
+
+
+def format_row(row) -> dict:
+    """Convert a payment_details_query row to export values"""
+    return {
+        "id": row.id,
+        "amount": row.amount / 100.0,  # Convert cents to BDT
+        "payment_date": row.payment_date,
+        "installment_id": row.installment_id,
+        "user_name": row.user_name,
+        "user_email": row.user_email,
+    }
+
+
+class CsvExportWriter:
+    """Writes rows batch by batch to a gzip-compressed CSV file"""
+
+    def __init__(self, path: str):
+        self._file = gzip.open(path, "wt", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=COLUMNS)
+        self._writer.writeheader()
+
+    def write_batch(self, rows: Iterable[dict]) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetExportWriter:
+    """Writes each batch as a row group of a zstd-compressed Parquet file"""
+
+    def __init__(self, path: str):
+        # Optional dependency, only imported when a Parquet export runs
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ("id", pa.int64()),
+            ("amount", pa.float64()),
+            ("payment_date", pa.timestamp("us", tz="UTC")),
+            ("installment_id", pa.int64()),
+            ("user_name", pa.string()),
+            ("user_email", pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write_batch(self, rows: Iterable[dict]) -> None:
+        table = self._pa.Table.from_pylist(list(rows), schema=self._schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def open_writer(path: str, fmt: str):
+    """Create the batch writer for an export format"""
+    if fmt == "parquet":
+        return ParquetExportWriter(path)
+    return CsvExportWriter(path)
@@ -0,0 +1,134 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+import logging
+import zlib
+
+from redis.asyncio import Redis
+
+from app.core.config import settings
+from app.utils.time_utils import is_valid_timezone
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of queued reminders: member = '<kind>:<installment id>:<due date>',
+# score = send time (epoch seconds)
+DUE_QUEUE_KEY = "reminders:due"
+
+# Pop reminders whose send time has passed and remove them in one atomic step
+_POP_DUE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #items > 0 then
+    redis.call('ZREM', KEYS[1], unpack(items))
+end
+return items
+"""
+
+# Members popped per script call (keeps unpack() well below Lua's stack limit)
+_POP_BATCH = 1000
+
+
+def _parse_time(value: str) -> time:
+    hours, minutes = value.split(":")
+    return time(int(hours), int(minutes))
+
+
+def delivery_window() -> Tuple[time, int]:
+    """Start of the local delivery window and its length in minutes"""
+    start = _parse_time(settings.REMINDER_WINDOW_START)
+    end = _parse_time(settings.REMINDER_WINDOW_END)
+    minutes = (end.hour * 60 + end.minute) - (start.hour * 60 + start.minute)
+    if minutes <= 0:
+        raise ValueError("REMINDER_WINDOW_END must be after REMINDER_WINDOW_START")
+    return start, minutes
+
+
+def user_zone(tz_name: Optional[str]) -> ZoneInfo:
+    """The customer's timezone, or the default one when unset or unknown"""
+    if tz_name and is_valid_timezone(tz_name):
+        return ZoneInfo(tz_name)
+    return ZoneInfo(settings.REMINDER_DEFAULT_TIMEZONE)
+
+
+def slot_offset(user_id: int, window_minutes: int) -> int:
+    """
+    Minute within the delivery window assigned to a customer. A stable hash
+    (not hash(), which is salted per process) keeps it the same every day and
+    spreads customers evenly over the window.
+    """
+    return zlib.crc32(str(user_id).encode()) % window_minutes
+
+
+def next_send_time(
+    user_id: int,
+    tz_name: Optional[str],
+    now: Optional[datetime] = None,
+    due_date: Optional[date] = None,
+) -> datetime:
+    """
+    The next time (UTC, not before now) at which the customer's local clock
+    shows their slot in the delivery window. When that slot falls after the
+    due date, the reminder is due now rather than late.
+    """
+    now = now or datetime.now(timezone.utc)
+    start, window_minutes = delivery_window()
+    zone = user_zone(tz_name)
+    local_now = now.astimezone(zone)
+    slot = timedelta(hours=start.hour, minutes=start.minute + slot_offset(user_id, window_minutes))
+
+    send_at = datetime.combine(local_now.date(), time(), tzinfo=zone) + slot
+    if send_at < local_now:
+        send_at = datetime.combine(local_now.date() + timedelta(days=1), time(), tzinfo=zone) + slot
+    if due_date is not None and send_at.date() > due_date:
+        return now
+    return send_at.astimezone(timezone.utc)
+
+
+def queue_member(kind: str, installment_id: int, due_date: date) -> str:
+    return f"{kind}:{installment_id}:{due_date.isoformat()}"
+
+
+def parse_member(member: str) -> Tuple[str, int, Optional[date]]:
+    """Kind, installment id and due date of a queued reminder (None for members queued without one)"""
+    parts = member.split(":")
+    if len(parts) == 2:  # queued before members carried the due date
+        return parts[0], int(parts[1]), None
+    kind, installment_id, due = parts
+    return kind, int(installment_id), date.fromisoformat(due)
+
+
+async def enqueue(redis: Redis, reminders: List[Tuple[str, int, date, datetime]]) -> int:
+    """
+    Queue (kind, installment_id, due_date, send_at) reminders. Reminders
+    already queued keep their original send time. Returns how many were
+    newly queued.
+    """
+    if not reminders:
+        return 0
+    mapping = {
+        queue_member(kind, installment_id, due_date): send_at.timestamp()
+        for kind, installment_id, due_date, send_at in reminders
+    }
+    return await redis.zadd(DUE_QUEUE_KEY, mapping, nx=True)
+
+
+async def pop_due(redis: Redis, now: Optional[datetime] = None) -> Dict[str, List[Tuple[int, Optional[date]]]]:
+    """
+    Remove every reminder whose send time has passed, returned as
+    (installment id, due date it was queued for) pairs per kind
+    """
+    now = now or datetime.now(timezone.utc)
+    pop = redis.register_script(_POP_DUE_SCRIPT)
+    due: Dict[str, List[Tuple[int, Optional[date]]]] = {}
+    while True:
+        members = await pop(keys=[DUE_QUEUE_KEY], args=[now.timestamp(), _POP_BATCH])
+        for member in members:
+            kind, installment_id, due_date = parse_member(member)
+            due.setdefault(kind, []).append((installment_id, due_date))
+        if len(members) < _POP_BATCH:
+            return due
+
+
+async def queue_depth(redis: Redis) -> int:
+    """Number of reminders waiting for their send time"""
+    return await redis.zcard(DUE_QUEUE_KEY)
@@ -0,0 +1,66 @@
+from datetime import date
+from typing import Awaitable, Callable, Iterable, Optional
+
+from app.core.cache import cache
+from app.core.config import settings
+from app.utils.time_utils import week_of
+
+# Report pages live in the two-tier cache (app.core.cache), tagged with their period
+NAMESPACE = "report"
+
+
+def period_tag(report_type: str, year: Optional[int] = None, period: Optional[int] = None) -> str:
+    """Tag of every cached page of one report period"""
+    if report_type == "all":
+        return f"{NAMESPACE}:all"
+    return f"{NAMESPACE}:{report_type}:{year}:{period}"
+
+
+def tags_for_day(day: date) -> set:
+    """Tags of every report period whose totals include the given day"""
+    week_year, week = week_of(day)
+    return {
+        period_tag("weekly", week_year, week),
+        period_tag("monthly", day.year, day.month),
+        period_tag("all"),
+    }
+
+
+async def get_or_compute(
+    report_type: str,
+    year: int,
+    period: Optional[int],
+    page: int,
+    limit: int,
+    end_date: date,
+    compute: Callable[[], Awaitable[dict]],
+) -> dict:
+    """
+    Return a cached report page, computing and caching it on a miss.
+
+    Closed periods (ending before today) are cached without expiry and only
+    dropped by invalidation; the current period and the all-time report use
+    REPORT_CACHE_TTL. Concurrent misses for the same page are computed once.
+    """
+    is_closed = report_type != "all" and end_date < date.today()
+    return await cache.get_or_compute(
+        NAMESPACE,
+        f"{report_type}:{year}:{period}:{page}:{limit}",
+        compute,
+        ttl=None if is_closed else settings.REPORT_CACHE_TTL,
+        tags=[period_tag(report_type, year, period)],
+    )
+
+
+async def invalidate_days(days: Iterable[Optional[date]]) -> None:
+    """Drop every cached report page whose period contains one of the given days"""
+    tags = set()
+    for day in days:
+        if day is not None:
+            tags |= tags_for_day(day)
+    await cache.invalidate(*tags)
+
+
+async def invalidate_all() -> None:
+    """Drop every cached report page, e.g. after the rollups are rebuilt"""
+    await cache.invalidate(NAMESPACE)
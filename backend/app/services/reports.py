@@ -0,0 +1,169 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import Date, cast, func, literal_column, select, union_all
+
+from app.models.db_models import DueDaily, Installment, Payment, PaymentDaily, User
+from app.utils.time_utils import month_bounds, week_bounds, week_of
+
+
+def resolve_period(
+    report_type: str,
+    year: Optional[int] = None,
+    period: Optional[int] = None,
+) -> Tuple[int, Optional[int], date, date]:
+    """
+    Resolve a report request to (year, period, start_date, end_date).
+    The period is a week number for weekly reports, a month for monthly
+    reports and None for all-time reports; missing values default to today.
+    Raises ValueError for an unknown type or an out-of-range period.
+    """
+    today = date.today()
+
+    if report_type == "weekly" and period is None:
+        # Use the current ISO week (and its ISO year) if not specified
+        iso_year, period = week_of(today)
+        if year is None:
+            year = iso_year
+
+    # Set default year to current year if not provided
+    if year is None:
+        year = today.year
+
+    if report_type == "weekly":
+        if not 1 <= period <= 53:
+            raise ValueError("Week number must be between 1 and 53")
+        start_date, end_date = week_bounds(year, period)
+    elif report_type == "monthly":
+        if period is None:
+            # Use current month if not specified
+            period = today.month
+        if not 1 <= period <= 12:
+            raise ValueError("Month number must be between 1 and 12")
+        start_date, end_date = month_bounds(year, period)
+    elif report_type == "all":
+        # Symbolic range for the response; 'all' is not filtered by date
+        period = None
+        start_date = date(1970, 1, 1)  # Unix epoch start
+        end_date = today
+    else:
+        raise ValueError("Invalid report type. Use 'weekly', 'monthly' or 'all'")
+
+    return year, period, start_date, end_date
+
+
+def _payment_date_range(query, start_date: Optional[date], end_date: Optional[date]):
+    # Convert date objects to datetime for proper comparison with datetime fields
+    if start_date is not None:
+        query = query.where(Payment.payment_date >= datetime.combine(start_date, datetime.min.time()))
+    if end_date is not None:
+        query = query.where(Payment.payment_date <= datetime.combine(end_date, datetime.max.time()))
+    return query
+
+
+def payment_details_query(start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """Payments joined with the paying user, newest first, optionally limited to a date range"""
+    query = select(
+        Payment.id,
+        Payment.amount,
+        Payment.payment_date,
+        Payment.installment_id,
+        User.name.label("user_name"),
+        User.email.label("user_email")
+    ).join(
+        Installment, Payment.installment_id == Installment.id
+    ).join(
+        User, Installment.user_id == User.id
+    )
+    return _payment_date_range(query, start_date, end_date).order_by(Payment.payment_date.desc())
+
+
+def payment_count_query(start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """Number of payments, optionally limited to a date range"""
+    return _payment_date_range(select(func.count(Payment.id)), start_date, end_date)
+
+
+# Bucket granularities supported by the time-series report
+TIMESERIES_BUCKETS = ("day", "week", "month")
+
+
+def bucket_start(day: date, bucket: str) -> date:
+    """First day of the bucket containing a day (weeks start on Monday, like date_trunc)"""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start: date, bucket: str) -> date:
+    """First day of the bucket after the one starting at start"""
+    if bucket == "week":
+        return start + timedelta(weeks=1)
+    if bucket == "month":
+        return start + relativedelta(months=1)
+    return start + timedelta(days=1)
+
+
+def timeseries_query(start_date: date, end_date: date, bucket: str):
+    """
+    Paid and due totals in cents per bucket, from one grouped date_trunc query
+    over the daily rollups. Only buckets that have data are returned.
+    """
+    daily = union_all(
+        select(
+            PaymentDaily.day.label("day"),
+            PaymentDaily.total_amount.label("paid"),
+            literal_column("0").label("due"),
+        ).where(PaymentDaily.day.between(start_date, end_date)),
+        select(
+            DueDaily.day.label("day"),
+            literal_column("0").label("paid"),
+            DueDaily.total_remaining.label("due"),
+        ).where(DueDaily.day.between(start_date, end_date)),
+    ).subquery()
+
+    if bucket not in TIMESERIES_BUCKETS:
+        raise ValueError(f"Invalid bucket. Use one of: {', '.join(TIMESERIES_BUCKETS)}")
+    # Inline the (validated) unit so SELECT and GROUP BY render the identical expression
+    unit = literal_column(f"'{bucket}'")
+    bucket_column = cast(func.date_trunc(unit, daily.c.day), Date).label("bucket")
+    return select(
+        bucket_column,
+        func.sum(daily.c.paid).label("paid"),
+        func.sum(daily.c.due).label("due"),
+    ).group_by(bucket_column).order_by(bucket_column)
+
+
+def fill_buckets(rows, start_date: date, end_date: date, bucket: str) -> List[dict]:
+    """
+    Turn timeseries_query rows into one point per bucket between two days,
+    with zero totals for buckets that had no rows. Bucket ranges are clipped
+    to [start_date, end_date], matching the days the totals cover.
+    """
+    totals = {row.bucket: row for row in rows}
+    points = []
+    current = bucket_start(start_date, bucket)
+    while current <= end_date:
+        following = next_bucket(current, bucket)
+        row = totals.get(current)
+        points.append({
+            "start_date": max(current, start_date),
+            "end_date": min(following - timedelta(days=1), end_date),
+            "total_paid": (row.paid if row else 0) / 100.0,  # Convert cents to BDT
+            "total_due": (row.due if row else 0) / 100.0,    # Convert cents to BDT
+        })
+        current = following
+    return points
+
+
+def bucket_count(start_date: date, end_date: date, bucket: str) -> int:
+    """Number of buckets a time series between two days will contain"""
+    first = bucket_start(start_date, bucket)
+    last = bucket_start(end_date, bucket)
+    if bucket == "week":
+        return (last - first).days // 7 + 1
+    if bucket == "month":
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last - first).days + 1
@@ -0,0 +1,197 @@
+from datetime import date, datetime, timezone
+from typing import Optional
+import logging
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.db_models import DueDaily, PaymentDaily
+
+logger = logging.getLogger(__name__)
+
+
+def payment_day(payment_date: datetime) -> date:
+    """Return the UTC calendar day a payment is rolled up under"""
+    if payment_date.tzinfo is not None:
+        payment_date = payment_date.astimezone(timezone.utc)
+    return payment_date.date()
+
+
+async def add_payment(db: AsyncSession, payment_date: datetime, amount: int) -> None:
+    """
+    Add a posted payment (amount in cents) to payments_daily.
+    Must be called in the same transaction that inserts the payment.
+    """
+    stmt = insert(PaymentDaily).values(
+        day=payment_day(payment_date),
+        total_amount=amount,
+        payment_count=1,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PaymentDaily.day],
+        set_={
+            "total_amount": PaymentDaily.total_amount + stmt.excluded.total_amount,
+            "payment_count": PaymentDaily.payment_count + stmt.excluded.payment_count,
+        },
+    )
+    await db.execute(stmt)
+
+
+async def _add_due(db: AsyncSession, day: date, remaining: int, count: int) -> None:
+    stmt = insert(DueDaily).values(
+        day=day,
+        total_remaining=remaining,
+        installment_count=count,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DueDaily.day],
+        set_={
+            "total_remaining": DueDaily.total_remaining + stmt.excluded.total_remaining,
+            "installment_count": DueDaily.installment_count + stmt.excluded.installment_count,
+        },
+    )
+    await db.execute(stmt)
+
+
+async def move_due(
+    db: AsyncSession,
+    old_day: Optional[date],
+    old_remaining: int,
+    new_day: Optional[date],
+    new_remaining: int,
+) -> None:
+    """
+    Move an installment's contribution in dues_daily from (old_day, old_remaining)
+    to (new_day, new_remaining). Pass old_day=None for a new installment.
+    Must be called in the same transaction that updates the installment.
+    """
+    if old_day == new_day:
+        if old_day is not None and old_remaining != new_remaining:
+            await _add_due(db, old_day, new_remaining - old_remaining, 0)
+        return
+
+    if old_day is not None:
+        await _add_due(db, old_day, -old_remaining, -1)
+    if new_day is not None:
+        await _add_due(db, new_day, new_remaining, 1)
+
+
+def paid_total_query(start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """Statement for the total paid in cents between two days (inclusive), or all time"""
+    query = select(func.coalesce(func.sum(PaymentDaily.total_amount), 0))
+    if start_date is not None:
+        query = query.where(PaymentDaily.day >= start_date)
+    if end_date is not None:
+        query = query.where(PaymentDaily.day <= end_date)
+    return query
+
+
+def due_total_query(start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """Statement for the total remaining in cents for installments due between two days (inclusive), or all time"""
+    query = select(func.coalesce(func.sum(DueDaily.total_remaining), 0))
+    if start_date is not None:
+        query = query.where(DueDaily.day >= start_date)
+    if end_date is not None:
+        query = query.where(DueDaily.day <= end_date)
+    return query
+
+
+async def sum_paid(db: AsyncSession, start_date: Optional[date] = None, end_date: Optional[date] = None) -> int:
+    """Total paid in cents between two days (inclusive), or all time"""
+    result = await db.execute(paid_total_query(start_date, end_date))
+    return result.scalar() or 0
+
+
+async def sum_due(db: AsyncSession, start_date: Optional[date] = None, end_date: Optional[date] = None) -> int:
+    """Total remaining in cents for installments due between two days (inclusive), or all time"""
+    result = await db.execute(due_total_query(start_date, end_date))
+    return result.scalar() or 0
+
+
+# Aggregates over the raw tables, shared by the rebuild and verification jobs
+RAW_PAYMENTS_DAILY_SQL = """
+    SELECT (payment_date AT TIME ZONE 'UTC')::date AS day,
+           SUM(amount) AS total_amount,
+           COUNT(*) AS payment_count
+    FROM payments
+    WHERE payment_date IS NOT NULL
+    GROUP BY 1
+"""
+
+RAW_DUES_DAILY_SQL = """
+    SELECT due_date AS day,
+           SUM(COALESCE(remaining_amount, 0)) AS total_remaining,
+           COUNT(*) AS installment_count
+    FROM installments
+    WHERE due_date IS NOT NULL
+    GROUP BY 1
+"""
+
+
+async def rebuild_rollups(db: AsyncSession) -> dict:
+    """
+    Recompute both rollup tables from the raw tables and commit.
+    The exclusive lock makes concurrent payment postings wait until the
+    rebuild commits, so no increment is lost between the delete and insert.
+    """
+    await db.execute(text("LOCK TABLE payments_daily, dues_daily IN EXCLUSIVE MODE"))
+    await db.execute(text("DELETE FROM payments_daily"))
+    await db.execute(text("DELETE FROM dues_daily"))
+    paid = await db.execute(text(
+        f"INSERT INTO payments_daily (day, total_amount, payment_count) {RAW_PAYMENTS_DAILY_SQL}"
+    ))
+    due = await db.execute(text(
+        f"INSERT INTO dues_daily (day, total_remaining, installment_count) {RAW_DUES_DAILY_SQL}"
+    ))
+    await db.commit()
+    return {"payments_daily_rows": paid.rowcount, "dues_daily_rows": due.rowcount}
+
+
+async def rollups_missing(db: AsyncSession) -> bool:
+    """
+    True when both rollup tables are empty but the raw tables are not, e.g.
+    on a database created before the rollups existed (create_all adds the
+    tables without backfilling them)
+    """
+    result = await db.execute(text("""
+        SELECT NOT EXISTS (SELECT 1 FROM payments_daily)
+           AND NOT EXISTS (SELECT 1 FROM dues_daily)
+           AND (EXISTS (SELECT 1 FROM payments) OR EXISTS (SELECT 1 FROM installments))
+    """))
+    return bool(result.scalar())
+
+
+async def verify_rollups(db: AsyncSession) -> dict:
+    """
+    Compare the rollup tables against the raw tables day by day.
+    Returns the mismatching days for each rollup (empty lists when consistent).
+    """
+    payments_mismatches = await db.execute(text(f"""
+        SELECT COALESCE(r.day, raw.day) AS day,
+               COALESCE(r.total_amount, 0) AS rollup_amount,
+               COALESCE(raw.total_amount, 0) AS raw_amount,
+               COALESCE(r.payment_count, 0) AS rollup_count,
+               COALESCE(raw.payment_count, 0) AS raw_count
+        FROM payments_daily r
+        FULL OUTER JOIN ({RAW_PAYMENTS_DAILY_SQL}) raw ON raw.day = r.day
+        WHERE COALESCE(r.total_amount, 0) <> COALESCE(raw.total_amount, 0)
+           OR COALESCE(r.payment_count, 0) <> COALESCE(raw.payment_count, 0)
+        ORDER BY 1
+    """))
+    dues_mismatches = await db.execute(text(f"""
+        SELECT COALESCE(r.day, raw.day) AS day,
+               COALESCE(r.total_remaining, 0) AS rollup_amount,
+               COALESCE(raw.total_remaining, 0) AS raw_amount,
+               COALESCE(r.installment_count, 0) AS rollup_count,
+               COALESCE(raw.installment_count, 0) AS raw_count
+        FROM dues_daily r
+        FULL OUTER JOIN ({RAW_DUES_DAILY_SQL}) raw ON raw.day = r.day
+        WHERE COALESCE(r.total_remaining, 0) <> COALESCE(raw.total_remaining, 0)
+           OR COALESCE(r.installment_count, 0) <> COALESCE(raw.installment_count, 0)
+        ORDER BY 1
+    """))
+    return {
+        "payments_daily": [dict(row._mapping) for row in payments_mismatches],
+        "dues_daily": [dict(row._mapping) for row in dues_mismatches],
+    }
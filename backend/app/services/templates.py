@@ -0,0 +1,169 @@
+import logging
+import os
+import re
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from markupsafe import escape
+
+from app.core import tracing
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    from jinja2 import Environment, FileSystemBytecodeCache, Template
+
+logger = logging.getLogger(__name__)
+
+template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+
+# Templates compiled at startup
+EMAIL_TEMPLATES = ("otp_email.html", "due_email.html")
+
+
+def _bytecode_cache() -> "FileSystemBytecodeCache":
+    from jinja2 import FileSystemBytecodeCache
+
+    # Compiled templates survive restarts and are shared by every process on the host
+    if settings.EMAIL_TEMPLATE_CACHE_DIR:
+        os.makedirs(settings.EMAIL_TEMPLATE_CACHE_DIR, exist_ok=True)
+        return FileSystemBytecodeCache(settings.EMAIL_TEMPLATE_CACHE_DIR)
+    return FileSystemBytecodeCache()  # System temp directory
+
+
+_env: Optional["Environment"] = None
+
+
+def get_environment() -> "Environment":
+    """The Jinja2 environment, created (and jinja2 imported) on first use"""
+    global _env
+    if _env is None:
+        from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+        _env = Environment(
+            loader=FileSystemLoader(template_dir),
+            autoescape=select_autoescape(['html', 'xml']),
+            bytecode_cache=_bytecode_cache(),
+            # Skip the per-render mtime check unless templates are being edited
+            auto_reload=settings.EMAIL_TEMPLATE_AUTO_RELOAD,
+        )
+    return _env
+
+
+_templates: Dict[str, "Template"] = {}
+
+
+def load_templates(names: Iterable[str] = EMAIL_TEMPLATES) -> None:
+    """Compile the email templates once (at worker startup)"""
+    for name in names:
+        _templates[name] = get_environment().get_template(name)
+    logger.info(f"Loaded email templates: {', '.join(sorted(_templates))}")
+
+
+def get_template(name: str) -> "Template":
+    """A compiled template, loaded on first use if it was not preloaded"""
+    template = _templates.get(name)
+    if template is None:
+        template = _templates[name] = get_environment().get_template(name)
+    return template
+
+
+def render(name: str, **context) -> str:
+    """Render one template for one recipient"""
+    with tracing.span("template.render", **{"template.name": name}):
+        return get_template(name).render(**context)
+
+
+# Marks a per-recipient field in a shell; only characters autoescape leaves alone
+_FIELD_MARKER = "@@field:{}:{}@@"
+_FIELD_PATTERN = re.compile(r"@@field:(\w+):([^@]*)@@")
+
+
+class _Field(str):
+    """Stands in for a per-recipient value while rendering a shell"""
+
+    def __new__(cls, name: str):
+        field = super().__new__(cls, _FIELD_MARKER.format(name, ""))
+        field.name = name
+        return field
+
+    def strftime(self, fmt: str) -> str:
+        # Dates are formatted per recipient, so keep the format in the marker
+        return _FIELD_MARKER.format(self.name, fmt)
+
+
+class TemplateShell:
+    """
+    A template rendered once with markers in place of the per-recipient
+    fields, split into static parts. Filling it only escapes and joins the
+    per-recipient values.
+
+    Fields may be interpolated directly or through .strftime(); templates
+    that branch on or filter a field must be rendered per recipient instead.
+    """
+
+    def __init__(self, name: str, fields: Iterable[str], **static_context):
+        context = dict(static_context)
+        context.update({field: _Field(field) for field in fields})
+        pieces = _FIELD_PATTERN.split(render(name, **context))
+        # pieces alternates: static text, field name, format, static text, ...
+        self.parts: List[str] = pieces[0::3]
+        self.fields: List[Tuple[str, str]] = list(zip(pieces[1::3], pieces[2::3]))
+
+    @staticmethod
+    def _value(value, fmt: str) -> str:
+        if fmt:
+            value = value.strftime(fmt)
+        return str(escape(value))
+
+    def fill(self, context: dict) -> str:
+        """The shell with one recipient's values, identical to render(name, **context)"""
+        out = [self.parts[0]]
+        for (field, fmt), part in zip(self.fields, self.parts[1:]):
+            out.append(self._value(context[field], fmt))
+            out.append(part)
+        return "".join(out)
+
+    def tags(self) -> Dict[Tuple[str, str], str]:
+        """A provider substitution tag, such as '-product_name-', for each distinct field/format"""
+        tags = {}
+        for field, fmt in self.fields:
+            if (field, fmt) not in tags:
+                used = sum(1 for name, _ in tags if name == field)
+                tags[(field, fmt)] = f"-{field}-" if not used else f"-{field}_{used}-"
+        return tags
+
+    def tagged(self) -> str:
+        """The shell with substitution tags in place of the fields, for provider-side batch rendering"""
+        tags = self.tags()
+        out = [self.parts[0]]
+        for field, part in zip(self.fields, self.parts[1:]):
+            out.append(tags[field])
+            out.append(part)
+        return "".join(out)
+
+    def substitutions(self, context: dict) -> Dict[str, str]:
+        """One recipient's values keyed by the tags used in tagged()"""
+        return {tag: self._value(context[field], fmt) for (field, fmt), tag in self.tags().items()}
+
+
+_shells: Dict[Tuple[str, Tuple[str, ...]], TemplateShell] = {}
+
+
+def get_shell(name: str, fields: Iterable[str]) -> TemplateShell:
+    """The cached shell of a template for a set of per-recipient fields"""
+    key = (name, tuple(sorted(fields)))
+    shell = _shells.get(key)
+    if shell is None:
+        shell = _shells[key] = TemplateShell(name, key[1])
+    return shell
+
+
+def render_batch(name: str, contexts: List[dict], fields: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Render a template for many recipients, reusing the static shell and only
+    substituting the per-recipient fields (by default the keys of the first context).
+    """
+    if not contexts:
+        return []
+    with tracing.span("template.render_batch", **{"template.name": name, "template.recipients": len(contexts)}):
+        shell = get_shell(name, fields if fields is not None else contexts[0].keys())
+        return [shell.fill(context) for context in contexts]
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from celery.concurrency import get_implementation
+from celery.concurrency.prefork import TaskPool as PreforkTaskPool
+from celery.signals import (
+    after_task_publish, before_task_publish, task_postrun, task_prerun,
+    worker_init, worker_process_init, worker_process_shutdown, worker_shutdown,
+)
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core import metrics, query_stats, tracing
+from app.core.client import close_redis_pools
+from app.core.config import settings
+from app.core.database import get_async_database_url, record_pool_metrics
+from app.services import templates
+from app.services.email_transport import close_email_transport
+
+logger = logging.getLogger(__name__)
+
+# One event loop, engine and connection pool per worker process, shared by every task.
+# The loop runs forever in its own thread; task threads (--pool=threads) submit
+# coroutines to it, so many I/O-bound tasks interleave on the one loop.
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+_worker_thread: Optional[threading.Thread] = None
+_worker_engine: Optional[AsyncEngine] = None
+_worker_sessionmaker: Optional[sessionmaker] = None
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def init_worker_resources() -> None:
+    """
+    Start the worker's event loop thread, create its database engine and
+    compile the email templates (idempotent)
+    """
+    global _worker_loop, _worker_thread, _worker_engine, _worker_sessionmaker
+    if _worker_loop is not None:
+        return
+
+    _worker_loop = asyncio.new_event_loop()
+    _worker_thread = threading.Thread(target=_run_loop, args=(_worker_loop,), name="worker-event-loop", daemon=True)
+    _worker_thread.start()
+    _worker_engine = create_async_engine(
+        get_async_database_url(),
+        echo=False,
+        pool_size=settings.WORKER_DB_POOL_SIZE,
+        max_overflow=settings.WORKER_DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+    )
+    # Log slow statements from tasks too, and trace them
+    query_stats.instrument_engine(_worker_engine)
+    tracing.instrument_engine(_worker_engine)
+    _worker_sessionmaker = sessionmaker(_worker_engine, expire_on_commit=False, class_=AsyncSession)
+    templates.load_templates()
+    logger.info("Worker event loop and database engine initialized")
+
+
+async def _close_worker_clients() -> None:
+    await close_email_transport()
+    await close_redis_pools()
+    if _worker_engine is not None:
+        await _worker_engine.dispose()
+
+
+def shutdown_worker_resources() -> None:
+    """Close the email transport, dispose the worker's engine and stop its event loop"""
+    global _worker_loop, _worker_thread, _worker_engine, _worker_sessionmaker
+    if _worker_loop is None:
+        return
+
+    try:
+        asyncio.run_coroutine_threadsafe(_close_worker_clients(), _worker_loop).result(timeout=30)
+    except Exception as e:
+        logger.warning(f"Error closing worker resources: {e}")
+    finally:
+        _worker_loop.call_soon_threadsafe(_worker_loop.stop)
+        _worker_thread.join(timeout=10)
+        if not _worker_loop.is_running():
+            _worker_loop.close()
+        _worker_loop = _worker_thread = _worker_engine = _worker_sessionmaker = None
+        metrics.flush()
+        logger.info("Worker event loop and database engine disposed")
+
+
+def _uses_child_processes(worker) -> bool:
+    """Whether a worker runs its tasks in forked children (the prefork pool)"""
+    pool_cls = getattr(worker, "pool_cls", None) or settings.WORKER_POOL
+    if isinstance(pool_cls, str):
+        pool_cls = get_implementation(pool_cls)
+    return issubclass(pool_cls, PreforkTaskPool)
+
+# The solo and thread pools run tasks in the main worker process (worker_init);
+# prefork runs them in child processes (worker_process_init), and its parent,
+# which only supervises them, gets none. Both paths end up with exactly one
+# set of resources per process that executes tasks.
+@worker_init.connect
+def _on_worker_init(sender=None, **kwargs):
+    if sender is not None and _uses_child_processes(sender):
+        return
+    init_worker_resources()
+
+@worker_process_init.connect
+def _on_worker_process_init(**kwargs):
+    # A forked child must not reuse the parent's loop or pooled connections,
+    # and the parent's loop thread does not exist in the child
+    global _worker_loop, _worker_thread, _worker_engine, _worker_sessionmaker
+    _worker_loop = _worker_thread = _worker_engine = _worker_sessionmaker = None
+    init_worker_resources()
+
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(**kwargs):
+    shutdown_worker_resources()
+
+@worker_shutdown.connect
+def _on_worker_shutdown(**kwargs):
+    shutdown_worker_resources()
+
+
+# Task run times for the metrics endpoint, keyed by task id between prerun and postrun
+_task_started = {}
+
+@task_prerun.connect
+def _on_task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def _on_task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    name = getattr(task, "name", "unknown")
+    if started is not None:
+        metrics.celery_task_duration.observe(time.perf_counter() - started, task=name)
+    metrics.celery_tasks.inc(task=name, state=state or "UNKNOWN")
+    metrics.maybe_flush()
+
+# Trace context travels in a 'traceparent' message header. Publishing inside a
+# sampled trace records a producer span and passes it on as the task's parent;
+# the task's root span stays current in its thread, and run_async copies that
+# context into the coroutine it submits to the worker loop.
+_publish_spans = {}
+_task_traces = {}
+
+@before_task_publish.connect
+def _on_before_task_publish(sender=None, headers=None, **kwargs):
+    span = tracing.start_span(f"celery.publish {sender}", tracing.KIND_PRODUCER, **{"celery.task_name": sender})
+    if span is not None and headers is not None:
+        headers["traceparent"] = span.traceparent
+        _publish_spans[headers.get("id")] = span
+
+@after_task_publish.connect
+def _on_after_task_publish(headers=None, **kwargs):
+    span = _publish_spans.pop((headers or {}).get("id"), None)
+    if span is not None:
+        span.end()
+
+@task_prerun.connect
+def _start_task_trace(task_id=None, task=None, **kwargs):
+    # The header comes from our own publishers, so its sampled decision is followed
+    root = tracing.start_trace(
+        f"celery.task {task.name}", task.request.get("traceparent"), tracing.KIND_CONSUMER,
+        trust_parent=True, **{"celery.task_id": task_id, "celery.task_name": task.name},
+    )
+    _task_traces[task_id] = (root, tracing.activate(root))
+
+@task_postrun.connect
+def _end_task_trace(task_id=None, state=None, **kwargs):
+    root, token = _task_traces.pop(task_id, (None, None))
+    if token is not None:
+        tracing.deactivate(token)
+    if root is not None:
+        root.set_attribute("celery.state", state or "UNKNOWN")
+        if state == "FAILURE":
+            root.status = tracing.STATUS_ERROR
+        root.end()
+
+def _collect_pool_metrics():
+    if _worker_engine is not None:
+        record_pool_metrics(_worker_engine, "worker")
+
+metrics.add_collector(_collect_pool_metrics)
+
+
+def run_async(coro):
+    """
+    Run a coroutine from a synchronous task and return its result.
+    Inside a worker the coroutine runs on the process-wide loop thread, so
+    tasks executing in parallel threads share the loop and its connection
+    pools; elsewhere (e.g. eager execution or scripts) it falls back to a
+    temporary loop.
+    """
+    if _worker_loop is not None:
+        return asyncio.run_coroutine_threadsafe(coro, _worker_loop).result()
+
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coro)
+    finally:
+        # Clients opened on this temporary loop cannot outlive it
+        loop.run_until_complete(close_email_transport())
+        loop.run_until_complete(close_redis_pools())
+        loop.close()
+        asyncio.set_event_loop(None)
+
+@asynccontextmanager
+async def get_session():
+    """
+    Context manager yielding a session for a task.
+    Uses the worker's pooled engine when it exists, otherwise a throwaway engine
+    bound to the current event loop.
+    """
+    if _worker_sessionmaker is not None:
+        async with _worker_sessionmaker() as session:
+            yield session
+        return
+
+    engine = create_async_engine(get_async_database_url(), echo=False)
+    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+    session = async_session()
+    try:
+        yield session
+    finally:
+        await session.close()
+        await engine.dispose()
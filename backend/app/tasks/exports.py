@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import os
+
+from app.core.celery_app import app as celery
+from app.core.config import settings
+from app.services import exports, reports
+from app.tasks.base import run_async, get_session
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+@celery.task(name="export_payments_report", bind=True)
+def export_payments_report(self, report_type, year=None, period=None, fmt="csv"):
+    """
+    Task to export every payment row of a report period to a compressed file.
+    Progress is published through the task state so the API can report it.
+    """
+    logger.info(f"Starting {fmt} export {self.request.id} for {report_type} report {year}/{period}")
+    # task.request is thread-local, so hand the id to the coroutine running on the worker loop
+    return run_async(_export_payments(self, self.request.id, report_type, year, period, fmt))
+
+async def _export_payments(task, task_id, report_type, year, period, fmt):
+    """Async function to stream the report rows into the export file"""
+    year, period, start_date, end_date = reports.resolve_period(report_type, year, period)
+    if report_type == "all":
+        start_date = end_date = None
+
+    os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+    final_path = exports.export_path(task_id, fmt)
+    partial_path = f"{final_path}.part"
+    rows_written = 0
+
+    async with get_session() as session:
+        total_rows = (await session.execute(reports.payment_count_query(start_date, end_date))).scalar() or 0
+        # update_state is a blocking result-backend call; keep it off the shared loop
+        await asyncio.to_thread(
+            task.update_state, task_id=task_id, state="PROGRESS", meta={"rows_written": 0, "total_rows": total_rows}
+        )
+
+        writer = exports.open_writer(partial_path, fmt)
+        try:
+            # Server-side cursor: only one batch of rows is held in memory at a time
+            query = reports.payment_details_query(start_date, end_date).execution_options(
+                yield_per=settings.EXPORT_BATCH_SIZE
+            )
+            result = await session.stream(query)
+            async for batch in result.partitions():
+                # Compression is CPU-bound, so it runs in a thread too
+                await asyncio.to_thread(writer.write_batch, [exports.format_row(row) for row in batch])
+                rows_written += len(batch)
+                await asyncio.to_thread(
+                    task.update_state,
+                    task_id=task_id,
+                    state="PROGRESS",
+                    meta={"rows_written": rows_written, "total_rows": total_rows},
+                )
+        except Exception:
+            writer.close()
+            os.remove(partial_path)
+            raise
+        writer.close()
+
+    # Only expose the file under its final name once it is complete
+    os.replace(partial_path, final_path)
+    logger.info(f"Export {task_id} finished: {rows_written} rows written to {final_path}")
+    return {
+        "rows_written": rows_written,
+        "total_rows": max(total_rows, rows_written),
+        "format": fmt,
+        "file": os.path.basename(final_path),
+    }
+
+@celery.task(name="purge_expired_exports")
+def purge_expired_exports():
+    """Task to delete export files older than EXPORT_RETENTION_HOURS"""
+    deleted = exports.delete_expired()
+    logger.info(f"Deleted {deleted} expired export files")
+    return {"deleted": deleted}
@@ -1,48 +1,25 @@
 
-import asyncio
 import logging
+import time
 from datetime import datetime, timedelta, timezone
-from contextlib import asynccontextmanager
 
+from celery import chord, group
+from redis.asyncio import Redis
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
 
-from app.core.database import AsyncSessionLocal
-from app.models.db_models import Installment
-from app.services.email import send_due_email
-from app.core.config import settings
+from app.models.db_models import Installment, User
+from app.services import due_index, reminder_schedule
+from app.services.deliveries import delivered_installment_ids, record_deliveries, reminder_days_ahead, reminder_kind
+from app.services.email import send_due_email, send_due_emails
 from app.core.celery_app import app as celery
+from app.core.client import QUEUE, get_redis
+from app.core.config import settings
+from app.tasks.base import run_async, get_session
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-def run_async(coro):
-    """Utility function to run async code in a synchronous context"""
-    loop = asyncio.new_event_loop()
-    try:
-        asyncio.set_event_loop(loop)
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
-        asyncio.set_event_loop(None)
-
-@asynccontextmanager
-async def get_session():
-    """Context manager to get a fresh session for each task"""
-    # Create a new engine and session for each task
-    # This ensures clean event loop isolation
-    engine = create_async_engine(settings.DATABASE_URL, echo=False)
-    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
-    
-    session = async_session()
-    try:
-        yield session
-    finally:
-        await session.close()
-        await engine.dispose()
-
 @celery.task(name="send_due_notification")
 def send_due_notification(installment_id):
     """Task to send notification for a specific installment"""
@@ -89,89 +66,340 @@ async def _send_notification(installment_id):
         
         result = await session.execute(query)
         installment = result.scalars().first()
-        
-        error = validate_installment(installment, installment_id)
-        if error:
-            return f"Failed to send notification: {error}"
-        # All checks passed, send the email
-        try:
-            logger.info(f"Sending email to {installment.user.email} for installment {installment_id}")
-            await send_due_email(
-                to_email=installment.user.email,
-                product_name=installment.product.name,
-                due_date=installment.due_date
-            )
-            logger.info(f"Email sent successfully to {installment.user.email} for installment {installment_id}")
-            return f"Notification sent for installment {installment_id} to {installment.user.email}"
-        except Exception as e:
-            logger.error(f"Error sending email for installment {installment_id}: {str(e)}")
-            return f"Failed to send notification: Error sending email for installment {installment_id}: {str(e)}"
+    
+    # The session (and its pooled connection) is released before the provider
+    # call, so tasks waiting on email do not hold the worker's connections
+    error = validate_installment(installment, installment_id)
+    if error:
+        return f"Failed to send notification: {error}"
+    # All checks passed, send the email
+    try:
+        logger.info(f"Sending email to {installment.user.email} for installment {installment_id}")
+        await send_due_email(
+            to_email=installment.user.email,
+            product_name=installment.product.name,
+            due_date=installment.due_date
+        )
+        logger.info(f"Email sent successfully to {installment.user.email} for installment {installment_id}")
+        return f"Notification sent for installment {installment_id} to {installment.user.email}"
+    except Exception as e:
+        logger.error(f"Error sending email for installment {installment_id}: {str(e)}")
+        return f"Failed to send notification: Error sending email for installment {installment_id}: {str(e)}"
+
+def due_window(days_ahead):
+    """First and last due date (inclusive) covered by a reminder sweep"""
+    today = datetime.now(timezone.utc).date()
+    return today, today + timedelta(days=days_ahead)
+
+def due_installment_filters(days_ahead):
+    """Conditions selecting open installments due between today and days_ahead from now"""
+    today, notification_window = due_window(days_ahead)
+    return (
+        Installment.due_date <= notification_window,
+        Installment.due_date >= today,
+        Installment.remaining_amount > 0,
+    )
+
+def _queue_redis() -> Redis:
+    """Redis holding the due index and reminder due-queue (the queue instance, which does not evict keys)"""
+    return get_redis(QUEUE)
+
+async def _due_installment_ids(session, redis, days_ahead):
+    """
+    Ids of the installments due in the sweep window, read from the Redis due
+    index instead of scanning installments. An empty index (first run, or
+    Redis lost its data) is rebuilt first.
+    """
+    if not await due_index.index_size(redis):
+        indexed = await due_index.rebuild(session, redis)
+        logger.warning(f"Due index was empty, rebuilt it with {indexed} installments")
+    start, end = due_window(days_ahead)
+    return sorted(await due_index.ids_due_between(redis, start, end))
 
 @celery.task(name="send_all_due_notifications")
 def send_all_due_notifications(days_ahead=3):
-    """Task to process all due notifications"""
+    """
+    Task to dispatch notifications for all installments due in the next days_ahead days.
+    Matching installments are split into fixed-size chunks sent by a group of chunk tasks.
+    Each job sends its own kind of reminder, at most once per installment due date.
+    """
     logger.info(f"Starting notifications for installments due in {days_ahead} days")
-    return run_async(_send_all_notifications(days_ahead))
-
-async def _send_all_notifications(days_ahead):
-    """Async function to handle all notifications logic"""
-    today = datetime.now(timezone.utc).date()
-    notification_window = today + timedelta(days=days_ahead)
+    chunks = run_async(_collect_due_chunks(days_ahead))
+    
+    if not chunks:
+        logger.info(f"No installments due in the next {days_ahead} days")
+        return {"days_ahead": days_ahead, "installments": 0, "chunks": 0}
+    
+    # Fan the chunks out as a group; the summary runs once every chunk has finished
+    started_at = time.time()
+    kind = reminder_kind(days_ahead)
+    header = group(send_due_notification_chunk.s(chunk, index, kind) for index, chunk in enumerate(chunks))
+    result = chord(header)(summarize_due_notifications.s(days_ahead=days_ahead, started_at=started_at))
     
-    logger.info(f"Finding installments due between {today} and {notification_window}")
+    installment_count = sum(len(chunk) for chunk in chunks)
+    logger.info(f"Dispatched {installment_count} installments in {len(chunks)} chunks")
+    return {
+        "days_ahead": days_ahead,
+        "installments": installment_count,
+        "chunks": len(chunks),
+        "summary_task_id": result.id,
+    }
+
+async def _collect_due_chunks(days_ahead):
+    """Split the installment ids due in the window into fixed-size chunks"""
+    chunk_size = settings.NOTIFICATION_CHUNK_SIZE
+    redis = _queue_redis()
+    async with get_session() as session:
+        ids = await _due_installment_ids(session, redis, days_ahead)
+    # The chunk tasks re-check each installment against the database
+    return [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+
+@celery.task(name="send_due_notification_chunk")
+def send_due_notification_chunk(installment_ids, chunk_index=0, kind=None, due_dates=None):
+    """
+    Task to send notifications for one chunk of installments.
+    due_dates (ISO dates, parallel to installment_ids) are the due dates the
+    reminders were queued for, when they come from the reminder due-queue.
+    """
+    logger.info(f"Sending chunk {chunk_index} with {len(installment_ids)} installments")
+    return run_async(_send_notification_chunk(installment_ids, chunk_index, kind or reminder_kind(3), due_dates))
+
+async def _send_notification_chunk(installment_ids, chunk_index, kind, due_dates=None):
+    """
+    Async function to load a chunk in bulk and send its emails as batched requests.
+    Installments already in the delivery ledger for this kind and due date are
+    skipped, and the ones that were sent are recorded afterwards.
+    """
+    started = time.perf_counter()
     
-    notification_count = 0
+    # Re-check, the installment may have been paid or moved to a later due date
+    # since it was queued. Queued reminders are checked against the due date they
+    # were queued for: the sweep window has moved on by their send slot.
+    if due_dates is None:
+        filters = due_installment_filters(reminder_days_ahead(kind))
+    else:
+        filters = (Installment.remaining_amount > 0,)
     
     async with get_session() as session:
+        # selectinload fetches the chunk's users and products with one IN query each
         query = select(Installment).options(
             selectinload(Installment.user),
             selectinload(Installment.product)
         ).where(
-            Installment.due_date <= notification_window,
-            Installment.due_date >= today,
-            Installment.remaining_amount > 0
-        ).limit(100)  # Batch size
-        
+            Installment.id.in_(installment_ids),
+            *filters
+        )
         result = await session.execute(query)
-        upcoming_installments = result.scalars().all()
+        installments = result.scalars().all()
+        if due_dates is not None:
+            queued_for = dict(zip(installment_ids, due_dates))
+            installments = [
+                installment for installment in installments
+                if queued_for.get(installment.id) in (None, installment.due_date.isoformat())
+            ]
         
-        logger.info(f"Found {len(upcoming_installments)} installments due in the next {days_ahead} days")
-        
-        for installment in upcoming_installments:
+        # One ledger lookup for the whole chunk
+        already_sent = await delivered_installment_ids(session, installments, kind)
+    
+    valid = []
+    skipped = len(installment_ids) - len(installments)
+    for installment in installments:
+        if installment.id in already_sent:
+            continue
+        error = validate_installment(installment)
+        if error:
+            logger.warning(f"Skipping installment {installment.id}: {error}")
+            skipped += 1
+        else:
+            valid.append(installment)
+    
+    # One batched provider request per EMAIL_BATCH_SIZE recipients, with per-recipient outcomes
+    try:
+        outcomes = await send_due_emails([
+            (installment.user.email, installment.product.name, installment.due_date)
+            for installment in valid
+        ])
+    except Exception as e:
+        logger.error(f"Failed to send reminders for chunk {chunk_index}: {str(e)}")
+        outcomes = [False] * len(valid)
+    
+    failed_ids = [installment.id for installment, delivered in zip(valid, outcomes) if not delivered]
+    for installment_id in failed_ids:
+        logger.error(f"Failed to notify for installment {installment_id}: provider rejected the email")
+    sent = len(valid) - len(failed_ids)
+    
+    # Record what went out, so overlapping runs and retries do not send it again
+    delivered = [installment for installment, ok in zip(valid, outcomes) if ok]
+    ledger_writes = 0
+    if delivered:
+        async with get_session() as session:
+            ledger_writes = await record_deliveries(session, delivered, kind)
+    
+    summary = {
+        "chunk": chunk_index,
+        "kind": kind,
+        "size": len(installment_ids),
+        "sent": sent,
+        "already_sent": len(already_sent),
+        "failed": len(failed_ids),
+        "failed_installment_ids": failed_ids,
+        "skipped": skipped,
+        "ledger_writes": ledger_writes,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(f"Chunk {chunk_index} done: {summary}")
+    return summary
 
-            error = validate_installment(installment)
-            if error:
-                logger.warning(f"Skipping installment {installment.id}: {error}")
-                continue
+@celery.task(name="summarize_due_notifications")
+def summarize_due_notifications(chunk_results, days_ahead=None, started_at=None):
+    """Chord callback: combine the per-chunk results of one notification run"""
+    chunk_results = sorted(chunk_results, key=lambda chunk: chunk["chunk"])
+    summary = {
+        "days_ahead": days_ahead,
+        "kind": reminder_kind(days_ahead) if days_ahead is not None else None,
+        "chunks": len(chunk_results),
+        "installments": sum(chunk["size"] for chunk in chunk_results),
+        "sent": sum(chunk["sent"] for chunk in chunk_results),
+        "already_sent": sum(chunk.get("already_sent", 0) for chunk in chunk_results),
+        "failed": sum(chunk["failed"] for chunk in chunk_results),
+        "skipped": sum(chunk["skipped"] for chunk in chunk_results),
+        "ledger_writes": sum(chunk.get("ledger_writes", 0) for chunk in chunk_results),
+        "failed_installment_ids": [
+            installment_id for chunk in chunk_results for installment_id in chunk.get("failed_installment_ids", [])
+        ],
+        "elapsed_seconds": round(time.time() - started_at, 3) if started_at else None,
+        "slowest_chunk_seconds": max((chunk["seconds"] for chunk in chunk_results), default=0),
+        "chunk_timings": [
+            {"chunk": chunk["chunk"], "size": chunk["size"], "seconds": chunk["seconds"]}
+            for chunk in chunk_results
+        ],
+    }
+    logger.info(
+        f"Notification run for installments due in {days_ahead} days: "
+        f"{summary['sent']} sent, {summary['already_sent']} already sent, {summary['failed']} failed, "
+        f"{summary['skipped']} skipped, {summary['ledger_writes']} ledger writes "
+        f"in {summary['chunks']} chunks ({summary['elapsed_seconds']}s)"
+    )
+    return summary
 
+@celery.task(name="schedule_due_reminders")
+def schedule_due_reminders(days_ahead=3):
+    """
+    Task to queue reminders for installments due in the next days_ahead days.
+    Each reminder is queued for the customer's slot in their local delivery
+    window; drain_due_reminders sends it once that time has come.
+    """
+    logger.info(f"Scheduling reminders for installments due in {days_ahead} days")
+    return run_async(_schedule_due_reminders(days_ahead))
 
-            try:
-                
-                logger.info(f"Sending email to {installment.user.email} for installment {installment.id}")
-                await send_due_email(
-                    to_email=installment.user.email,
-                    product_name=installment.product.name,
-                    due_date=installment.due_date
+async def _schedule_due_reminders(days_ahead):
+    """Look up the due installments chunk by chunk, skipping the ones already reminded"""
+    kind = reminder_kind(days_ahead)
+    now = datetime.now(timezone.utc)
+    chunk_size = settings.NOTIFICATION_CHUNK_SIZE
+    scanned = already_sent = queued = 0
+    
+    redis = _queue_redis()
+    async with get_session() as session:
+        ids = await _due_installment_ids(session, redis, days_ahead)
+        for start in range(0, len(ids), chunk_size):
+            # Primary-key lookups; the filters drop entries the index has wrong
+            result = await session.execute(
+                select(Installment.id, Installment.due_date, Installment.user_id, User.timezone)
+                .join(User, Installment.user_id == User.id)
+                .where(Installment.id.in_(ids[start:start + chunk_size]), *due_installment_filters(days_ahead))
+            )
+            rows = result.all()
+            
+            sent = await delivered_installment_ids(session, rows, kind)
+            queued += await reminder_schedule.enqueue(redis, [
+                (
+                    kind, row.id, row.due_date,
+                    reminder_schedule.next_send_time(row.user_id, row.timezone, now, row.due_date),
                 )
-                notification_count += 1
-                logger.info(f"Email sent successfully to {installment.user.email} for installment {installment.id}")
-            except Exception as e:
-                logger.error(f"Failed to notify for installment {installment.id}: {str(e)}")
-        
-        return f"Sent {notification_count} notifications for installments due in the next {days_ahead} days"
+                for row in rows if row.id not in sent
+            ])
+            scanned += len(rows)
+            already_sent += len(sent)
+    depth = await reminder_schedule.queue_depth(redis)
+    
+    summary = {
+        "days_ahead": days_ahead,
+        "kind": kind,
+        "indexed": len(ids),
+        "scanned": scanned,
+        "already_sent": already_sent,
+        "queued": queued,
+        "queue_depth": depth,
+    }
+    logger.info(f"Reminder scheduling done: {summary}")
+    return summary
+
+@celery.task(name="drain_due_reminders")
+def drain_due_reminders():
+    """
+    Task run by beat every few minutes: pop the reminders whose send time
+    has come and send them through chunk tasks.
+    """
+    due, depth = run_async(_pop_due_reminders())
+    
+    dispatched = {}
+    started_at = time.time()
+    chunk_size = settings.NOTIFICATION_CHUNK_SIZE
+    for kind, reminders in due.items():
+        installment_ids = [installment_id for installment_id, _ in reminders]
+        due_dates = [due_date.isoformat() if due_date else None for _, due_date in reminders]
+        starts = range(0, len(reminders), chunk_size)
+        header = group(
+            send_due_notification_chunk.s(
+                installment_ids[start:start + chunk_size], index, kind, due_dates[start:start + chunk_size]
+            )
+            for index, start in enumerate(starts)
+        )
+        chord(header)(summarize_due_notifications.s(days_ahead=reminder_days_ahead(kind), started_at=started_at))
+        dispatched[kind] = {"installments": len(installment_ids), "chunks": len(starts)}
+    
+    if dispatched:
+        logger.info(f"Drained due reminders: {dispatched}, {depth} still queued")
+    return {"dispatched": dispatched, "queue_depth": depth}
+
+async def _pop_due_reminders():
+    redis = _queue_redis()
+    due = await reminder_schedule.pop_due(redis)
+    depth = await reminder_schedule.queue_depth(redis)
+    return due, depth
 
 @celery.task(name="check_tomorrow_due_installments")
 def check_tomorrow_due_installments():
     """
-    Task to check and send notifications for installments due tomorrow
+    Task to queue reminders for installments due tomorrow
     """
     logger.info("Checking installments due tomorrow")
-    return send_all_due_notifications.delay(days_ahead=1)
+    return schedule_due_reminders.delay(days_ahead=1).id
 
 @celery.task(name="check_upcoming_due_installments")
 def check_upcoming_due_installments():
     """
-    Task to check and send notifications for installments due in the next 3 days
+    Task to queue reminders for installments due in the next 3 days
     """
     logger.info("Checking installments due in the next 3 days")
-    return send_all_due_notifications.delay(days_ahead=3)
\ No newline at end of file
+    return schedule_due_reminders.delay(days_ahead=3).id
+
+@celery.task(name="reconcile_due_index")
+def reconcile_due_index():
+    """
+    Task to rebuild the Redis due index from the installments table, repairing
+    any drift from failed or lost index updates
+    """
+    logger.info("Rebuilding the installment due index")
+    return run_async(_reconcile_due_index())
+
+async def _reconcile_due_index():
+    redis = _queue_redis()
+    previous = await due_index.index_size(redis)
+    async with get_session() as session:
+        indexed = await due_index.rebuild(session, redis)
+    
+    if indexed != previous:
+        logger.warning(f"Due index drift repaired: {previous} entries before, {indexed} after rebuild")
+    return {"previous_size": previous, "indexed": indexed}
@@ -0,0 +1,83 @@
+import logging
+
+from app.core.celery_app import app as celery
+from app.core.cache import cache
+from app.services import aging, report_cache, rollups
+from app.tasks.base import run_async, get_session
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+@celery.task(name="reconcile_report_rollups")
+def reconcile_report_rollups():
+    """Task to rebuild the daily report rollups from the raw tables"""
+    logger.info("Rebuilding payments_daily and dues_daily rollups")
+    return run_async(_reconcile_rollups())
+
+async def _reconcile_rollups():
+    """Async function to rebuild the rollup tables"""
+    async with get_session() as session:
+        result = await rollups.rebuild_rollups(session)
+        logger.info(f"Rollups rebuilt: {result}")
+    await _invalidate_report_cache()
+    return result
+
+async def _invalidate_report_cache():
+    """Drop cached reports after the rollups they were computed from changed"""
+    await report_cache.invalidate_all()
+
+@celery.task(name="verify_report_rollups")
+def verify_report_rollups(repair=False):
+    """
+    Task to compare the daily report rollups against the raw tables.
+    When repair is True, a mismatch triggers a full rebuild.
+    """
+    logger.info("Verifying payments_daily and dues_daily rollups")
+    return run_async(_verify_rollups(repair))
+
+async def _verify_rollups(repair):
+    """Async function to verify (and optionally repair) the rollup tables"""
+    async with get_session() as session:
+        mismatches = await rollups.verify_rollups(session)
+        payments_count = len(mismatches["payments_daily"])
+        dues_count = len(mismatches["dues_daily"])
+        
+        if not payments_count and not dues_count:
+            logger.info("Rollups match the raw tables")
+            return {"consistent": True, "payments_daily": 0, "dues_daily": 0, "repaired": False}
+        
+        for table, rows in mismatches.items():
+            for row in rows[:20]:
+                logger.warning(f"{table} mismatch: {row}")
+        logger.warning(
+            f"Rollup drift detected: {payments_count} payments_daily days, {dues_count} dues_daily days"
+        )
+        
+        repaired = False
+        if repair:
+            await session.rollback()
+            await rollups.rebuild_rollups(session)
+            await _invalidate_report_cache()
+            repaired = True
+            logger.info("Rollups rebuilt after drift")
+        
+        return {
+            "consistent": False,
+            "payments_daily": payments_count,
+            "dues_daily": dues_count,
+            "repaired": repaired,
+        }
+
+@celery.task(name="refresh_aging_snapshot")
+def refresh_aging_snapshot():
+    """Task to rebuild the aging report snapshot as of today"""
+    logger.info("Refreshing aging report snapshot")
+    return run_async(_refresh_aging_snapshot())
+
+async def _refresh_aging_snapshot():
+    """Async function to rebuild the aging snapshot tables"""
+    async with get_session() as session:
+        result = await aging.rebuild_snapshot(session)
+        logger.info(f"Aging snapshot refreshed: {result}")
+    await cache.invalidate(aging.CACHE_NAMESPACE)
+    return result
@@ -1,4 +1,6 @@
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import calendar
 
 def now():
     """
@@ -62,4 +64,68 @@ def format_date(dt=None, format_str="%Y-%m-%d %H:%M:%S"):
     """
     if dt is None:
         dt = now()
-    return dt.strftime(format_str)
\ No newline at end of file
+    return dt.strftime(format_str)
+
+def week_bounds(year, week):
+    """
+    Get the first (Monday) and last (Sunday) day of an ISO calendar week.
+    
+    Args:
+        year (int): ISO year
+        week (int): ISO week number (1-53)
+        
+    Returns:
+        tuple[date, date]: First and last day of the week
+        
+    Raises:
+        ValueError: If the year has no such ISO week
+    """
+    try:
+        first_day = date.fromisocalendar(year, week, 1)
+    except ValueError:
+        raise ValueError(f"Year {year} has no ISO week {week}")
+    return first_day, first_day + timedelta(days=6)
+
+def week_of(day):
+    """
+    Get the ISO (year, week) containing a day, the inverse of week_bounds.
+    
+    Args:
+        day (date): The day to look up
+        
+    Returns:
+        tuple[int, int]: ISO year and week number
+    """
+    iso_year, iso_week, _ = day.isocalendar()
+    return iso_year, iso_week
+
+def month_bounds(year, month):
+    """
+    Get the first and last day of a calendar month.
+    
+    Args:
+        year (int): Calendar year
+        month (int): Month number (1-12)
+        
+    Returns:
+        tuple[date, date]: First and last day of the month
+    """
+    last_day = calendar.monthrange(year, month)[1]
+    return date(year, month, 1), date(year, month, last_day)
+
+
+def is_valid_timezone(name):
+    """
+    Check whether a name is a known IANA timezone.
+    
+    Args:
+        name (str): Timezone name, e.g. 'Asia/Dhaka'
+        
+    Returns:
+        bool: True if the timezone exists
+    """
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
@@ -0,0 +1,4 @@
+"""
+Benchmark scripts. Run from the backend directory, e.g.
+python -m benchmarks.bench_report_fanout
+"""
@@ -0,0 +1,76 @@
+"""
+Measure Celery throughput for I/O-bound async tasks: the solo pool (one
+task at a time, as the worker used to run) versus the thread pool with
+every task's coroutine on the worker's shared event loop.
+
+An embedded worker consumes a dedicated 'benchmark' queue on the broker,
+so run it against a local Redis (default REDIS_URL_QUEUE). Usage:
+
+    python -m benchmarks.bench_celery_pool --tasks 500 --latency-ms 50 --concurrency 32
+
+--broker memory:// --backend cache+memory:// works without Redis for a
+smoke test, but that transport polls and understates the thread pool.
+"""
+import argparse
+import asyncio
+import time
+
+from celery import group
+from celery.contrib.testing.worker import start_worker
+
+from app.core.celery_app import app as celery
+from app.core.config import settings
+from app.tasks import base
+
+QUEUE = "benchmark"
+
+
+@celery.task(name="benchmarks.io_task")
+def io_task(latency):
+    """Stands in for a notification task: one awaited I/O call"""
+    async def run():
+        await asyncio.sleep(latency)
+        return latency
+
+    return base.run_async(run())
+
+
+def measure(pool, concurrency, tasks, latency):
+    with start_worker(
+        celery,
+        pool=pool,
+        concurrency=concurrency,
+        queues=[QUEUE],
+        perform_ping_check=False,
+        shutdown_timeout=30,
+    ):
+        job = group(io_task.s(latency).set(queue=QUEUE) for _ in range(tasks))
+        started = time.perf_counter()
+        job.apply_async().get(timeout=tasks * latency + 60, disable_sync_subtasks=False)
+        elapsed = time.perf_counter() - started
+    base.shutdown_worker_resources()
+    print(f"{pool:<8} concurrency={concurrency:<4} {tasks} tasks in {elapsed:.2f}s ({tasks / elapsed:.1f} tasks/sec)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Simulated I/O time per task")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY)
+    parser.add_argument("--prefetch", type=int, default=settings.WORKER_PREFETCH_MULTIPLIER)
+    parser.add_argument("--broker", default=settings.REDIS_URL_QUEUE)
+    parser.add_argument("--backend", default=settings.REDIS_URL_QUEUE)
+    args = parser.parse_args()
+
+    celery.conf.update(
+        broker_url=args.broker,
+        result_backend=args.backend,
+        worker_prefetch_multiplier=args.prefetch,
+    )
+    latency = args.latency_ms / 1000.0
+    measure("solo", 1, args.tasks, latency)
+    measure("threads", args.concurrency, args.tasks, latency)
+
+
+if __name__ == "__main__":
+    main()
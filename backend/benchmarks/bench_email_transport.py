@@ -0,0 +1,92 @@
+"""
+Measure email send throughput: one message at a time (what the old
+per-message SendGridAPIClient effectively did), the pooled async transport
+with bounded concurrency, and batched requests with per-recipient
+substitutions.
+
+Uses the local fake provider, so no network or API key is needed. Usage:
+
+    python -m benchmarks.bench_email_transport --messages 500 --latency-ms 50
+"""
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+from app.services.email_transport import BatchRecipient, EmailBatch, EmailMessage, EmailTransport, FakeBackend
+
+
+def _messages(count):
+    return [
+        EmailMessage(to_email=f"user{i}@example.com", subject="Benchmark", html_content="<p>Hello</p>")
+        for i in range(count)
+    ]
+
+
+async def sequential(messages, latency_ms):
+    backend = FakeBackend(latency_ms=latency_ms, failure_rate=0.0)
+    for message in messages:
+        await backend.send(message)
+    return backend.request_count
+
+
+async def concurrent(messages, latency_ms, concurrency, rate, failure_rate):
+    backend = FakeBackend(latency_ms=latency_ms, failure_rate=failure_rate)
+    transport = EmailTransport(backend, max_concurrency=concurrency, rate=rate)
+    results = await asyncio.gather(*(transport.send(message) for message in messages))
+    await transport.aclose()
+    failed = sum(1 for result in results if not result.ok)
+    return backend.request_count, failed
+
+
+async def batched(messages, latency_ms, concurrency, rate, failure_rate, batch_size):
+    backend = FakeBackend(latency_ms=latency_ms, failure_rate=failure_rate)
+    transport = EmailTransport(backend, max_concurrency=concurrency, rate=rate)
+    recipients = [BatchRecipient(message.to_email, {"-name-": message.to_email}) for message in messages]
+    batches = [
+        EmailBatch("Benchmark", "<p>Hello -name-</p>", recipients[start:start + batch_size])
+        for start in range(0, len(recipients), batch_size)
+    ]
+    results = await asyncio.gather(*(transport.send_batch(batch) for batch in batches))
+    await transport.aclose()
+    failed = sum(len(batch.recipients) for batch, result in zip(batches, results) if not result.ok)
+    return backend.request_count, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Simulated provider latency")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=0.0, help="Send rate limit in msgs/sec (0 = unlimited)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of simulated 429 responses")
+    parser.add_argument("--batch-size", type=int, default=settings.EMAIL_BATCH_SIZE, help="Recipients per batch request")
+    args = parser.parse_args()
+
+    messages = _messages(args.messages)
+
+    started = time.perf_counter()
+    requests = asyncio.run(sequential(messages, args.latency_ms))
+    elapsed = time.perf_counter() - started
+    print(f"sequential: {args.messages} msgs in {elapsed:.2f}s "
+          f"({args.messages / elapsed:.1f} msgs/sec, {requests} requests)")
+
+    started = time.perf_counter()
+    requests, failed = asyncio.run(
+        concurrent(messages, args.latency_ms, args.concurrency, args.rate, args.failure_rate)
+    )
+    elapsed = time.perf_counter() - started
+    print(f"transport:  {args.messages} msgs in {elapsed:.2f}s "
+          f"({args.messages / elapsed:.1f} msgs/sec, {requests} requests, {failed} failed)")
+
+    started = time.perf_counter()
+    requests, failed = asyncio.run(
+        batched(messages, args.latency_ms, args.concurrency, args.rate, args.failure_rate, args.batch_size)
+    )
+    elapsed = time.perf_counter() - started
+    print(f"batched:    {args.messages} msgs in {elapsed:.2f}s "
+          f"({args.messages / elapsed:.1f} msgs/sec, {requests} requests, {failed} failed)")
+
+
+if __name__ == "__main__":
+    main()
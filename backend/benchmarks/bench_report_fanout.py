@@ -0,0 +1,188 @@
+"""
+Compare admin report latency with the four report queries run sequentially
+on one session versus concurrently through fetch_concurrently.
+
+Needs the database from DATABASE_URL (ideally seeded with a realistic number
+of payments). Usage:
+
+    python -m benchmarks.bench_report_fanout --iterations 200 --days 30
+
+With --concurrency N, N simulated requests run at once, each holding its own
+session (as get_current_user does) while its report queries run. This shows
+behaviour near the pool limit (DB_POOL_SIZE + DB_MAX_OVERFLOW): throughput,
+tail latency, timed-out requests and the most connections checked out:
+
+    python -m benchmarks.bench_report_fanout --iterations 500 --concurrency 8 16 32 64
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, async_engine, fetch_concurrently
+from app.models.db_models import Installment, Payment, User
+from app.services import rollups
+
+
+def build_statements(days: int, page: int, limit: int):
+    """Build the same four statements generate_report issues for a date range"""
+    end_date = date.today()
+    start_date = end_date - timedelta(days=days - 1)
+    start_datetime = datetime.combine(start_date, datetime.min.time())
+    end_datetime = datetime.combine(end_date, datetime.max.time())
+
+    payment_query = select(
+        Payment.id,
+        Payment.amount,
+        Payment.payment_date,
+        Payment.installment_id,
+        User.name.label("user_name"),
+        User.email.label("user_email")
+    ).join(
+        Installment, Payment.installment_id == Installment.id
+    ).join(
+        User, Installment.user_id == User.id
+    ).where(
+        Payment.payment_date >= start_datetime,
+        Payment.payment_date <= end_datetime
+    ).order_by(
+        Payment.payment_date.desc()
+    ).offset((page - 1) * limit).limit(limit)
+
+    count_query = select(func.count(Payment.id)).where(
+        Payment.payment_date >= start_datetime,
+        Payment.payment_date <= end_datetime
+    )
+    return [
+        rollups.paid_total_query(start_date, end_date),
+        rollups.due_total_query(start_date, end_date),
+        payment_query,
+        count_query,
+    ]
+
+
+async def run_sequential(statements):
+    async with AsyncSessionLocal() as session:
+        for statement in statements:
+            (await session.execute(statement)).fetchall()
+
+
+async def run_concurrent(statements):
+    for result in await fetch_concurrently(*statements):
+        result.fetchall()
+
+
+async def request_sequential(statements):
+    async with AsyncSessionLocal() as session:
+        await session.execute(text("SELECT 1"))  # the auth lookup
+        for statement in statements:
+            (await session.execute(statement)).fetchall()
+
+
+async def request_concurrent(statements):
+    async with AsyncSessionLocal() as session:
+        await session.execute(text("SELECT 1"))  # the auth lookup
+        for result in await fetch_concurrently(*statements, session=session):
+            result.fetchall()
+
+
+async def measure_under_load(fn, statements, iterations: int, concurrency: int) -> dict:
+    """Run iterations requests, concurrency at a time, and sample the pool while they run"""
+    timings, timeouts, peak = [], 0, 0
+    remaining = iter(range(iterations))
+
+    async def client():
+        nonlocal timeouts
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                await fn(statements)
+            except (asyncio.TimeoutError, PoolTimeoutError):  # fan-out deadline or pool checkout
+                timeouts += 1
+                continue
+            timings.append((time.perf_counter() - start) * 1000)
+
+    async def sample_pool():
+        nonlocal peak
+        while True:
+            peak = max(peak, async_engine.pool.checkedout())
+            await asyncio.sleep(0.001)
+
+    sampler = asyncio.create_task(sample_pool())
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+    return {"timings": timings, "timeouts": timeouts, "peak": peak, "elapsed": elapsed}
+
+
+def summarize_load(name: str, concurrency: int, run: dict) -> None:
+    timings = sorted(run["timings"]) or [0.0]
+    p50 = statistics.median(timings)
+    p99 = timings[max(int(len(timings) * 0.99) - 1, 0)]
+    print(
+        f"{name:<12} {concurrency:>5} {len(run['timings']) / run['elapsed']:9.1f}/s "
+        f"p50={p50:8.2f}ms  p99={p99:8.2f}ms  timeouts={run['timeouts']:<5} peak_conns={run['peak']}"
+    )
+
+
+async def measure(fn, statements, iterations: int) -> list:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn(statements)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(name: str, timings: list) -> float:
+    timings = sorted(timings)
+    p50 = statistics.median(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<12} mean={statistics.mean(timings):8.2f}ms  p50={p50:8.2f}ms  p95={p95:8.2f}ms")
+    return p50
+
+
+async def main(args):
+    statements = build_statements(args.days, args.page, args.limit)
+
+    # Warm up the pool so both variants start with open connections
+    await measure(run_concurrent, statements, 5)
+    await measure(run_sequential, statements, 5)
+
+    sequential = await measure(run_sequential, statements, args.iterations)
+    concurrent = await measure(run_concurrent, statements, args.iterations)
+
+    print(f"Report queries over {args.days} days, {args.iterations} iterations")
+    seq_p50 = summarize("sequential", sequential)
+    con_p50 = summarize("concurrent", concurrent)
+    print(f"p50 latency reduction: {(1 - con_p50 / seq_p50) * 100:.1f}%")
+
+    if args.concurrency:
+        print(
+            f"\nUnder load: pool {settings.DB_POOL_SIZE}+{settings.DB_MAX_OVERFLOW}, "
+            f"fan-out connections {settings.DB_FANOUT_CONNECTIONS}"
+        )
+        print(f"{'variant':<12} {'conc':>5} {'throughput':>11}")
+        for concurrency in args.concurrency:
+            for name, fn in (("sequential", request_sequential), ("concurrent", request_concurrent)):
+                run = await measure_under_load(fn, statements, args.iterations, concurrency)
+                summarize_load(name, concurrency, run)
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--days", type=int, default=30, help="Report range in days ending today")
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[],
+                        help="Also run this many simulated requests at once (one run per value)")
+    asyncio.run(main(parser.parse_args()))
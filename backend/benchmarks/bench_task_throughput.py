@@ -0,0 +1,83 @@
+"""
+Measure Celery task overhead for database-backed tasks: the old per-task
+event loop + create_async_engine + dispose, versus the persistent
+per-worker loop and pooled engine from app.tasks.base.
+
+Tasks are invoked in-process (no broker) so the numbers isolate the
+loop/engine cost. Needs a local Postgres at DATABASE_URL. Usage:
+
+    python -m benchmarks.bench_task_throughput --tasks 500
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import get_async_database_url
+from app.tasks import base
+
+
+async def _query(session):
+    await session.execute(text("SELECT 1"))
+
+
+def legacy_task():
+    """What every task did before: new loop, new engine, dispose"""
+    async def run():
+        engine = create_async_engine(get_async_database_url(), echo=False)
+        async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        session = async_session()
+        try:
+            await _query(session)
+        finally:
+            await session.close()
+            await engine.dispose()
+
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+
+
+def persistent_task():
+    """A task on the worker-wide loop and engine"""
+    async def run():
+        async with base.get_session() as session:
+            await _query(session)
+
+    base.run_async(run())
+
+
+def measure(name, task, count):
+    task()  # Warm up
+    started = time.perf_counter()
+    for _ in range(count):
+        task()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<11} {count / elapsed:9.1f} tasks/s  ({elapsed / count * 1000:.2f} ms/task)")
+    return count / elapsed
+
+
+def main(args):
+    print(f"{args.tasks} tasks each running one query")
+    legacy = measure("per-task", legacy_task, args.tasks)
+
+    base.init_worker_resources()
+    try:
+        persistent = measure("persistent", persistent_task, args.tasks)
+    finally:
+        base.shutdown_worker_resources()
+
+    print(f"Throughput gain: {persistent / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=200)
+    main(parser.parse_args())
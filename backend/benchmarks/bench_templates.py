@@ -0,0 +1,74 @@
+"""
+Measure email template rendering: the old path (get_template on an
+auto-reloading environment, full render per message), the precompiled
+template service, and batch rendering from the shared static shell.
+Also times a cold template compile with and without the bytecode cache.
+
+No services needed. Usage:
+
+    python -m benchmarks.bench_templates --renders 20000
+"""
+import argparse
+import tempfile
+import time
+from datetime import date, timedelta
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+from app.services import templates
+
+
+def _contexts(count):
+    return [
+        {"product_name": f"Product {i}", "due_date": date(2026, 1, 1) + timedelta(days=i % 365)}
+        for i in range(count)
+    ]
+
+
+def _environment(bytecode_cache=None):
+    return Environment(
+        loader=FileSystemLoader(templates.template_dir),
+        autoescape=select_autoescape(['html', 'xml']),
+        bytecode_cache=bytecode_cache,
+    )
+
+
+def report(name, count, elapsed):
+    print(f"{name:<12} {count} renders in {elapsed:.3f}s ({count / elapsed:,.0f} renders/sec)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=20000)
+    parser.add_argument("--template", default="due_email.html")
+    args = parser.parse_args()
+
+    contexts = _contexts(args.renders)
+
+    legacy_env = _environment()
+    started = time.perf_counter()
+    for context in contexts:
+        legacy_env.get_template(args.template).render(**context)
+    report("legacy", args.renders, time.perf_counter() - started)
+
+    templates.load_templates([args.template])
+    started = time.perf_counter()
+    for context in contexts:
+        templates.render(args.template, **context)
+    report("precompiled", args.renders, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    templates.render_batch(args.template, contexts)
+    report("batch shell", args.renders, time.perf_counter() - started)
+
+    # Cold compile: a fresh process without vs with a warm bytecode cache
+    with tempfile.TemporaryDirectory() as cache_dir:
+        _environment(FileSystemBytecodeCache(cache_dir)).get_template(args.template)  # Warm the cache
+        for name, bytecode_cache in (("no cache", None), ("bytecode", FileSystemBytecodeCache(cache_dir))):
+            started = time.perf_counter()
+            _environment(bytecode_cache).get_template(args.template)
+            print(f"cold load ({name}): {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
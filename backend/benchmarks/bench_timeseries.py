@@ -0,0 +1,72 @@
+"""
+Time the time-series report over a multi-year range: one grouped date_trunc
+query over the rollups versus one paid/due query pair per bucket (what a
+trend chart cost when built from per-period /admin/reports calls).
+
+Needs the database from DATABASE_URL with populated rollup tables. Usage:
+
+    python -m benchmarks.bench_timeseries --years 5 --bucket month
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import date, timedelta
+
+from app.core.database import AsyncSessionLocal, async_engine
+from app.services import reports, rollups
+
+
+async def grouped(session, start_date, end_date, bucket):
+    result = await session.execute(reports.timeseries_query(start_date, end_date, bucket))
+    return reports.fill_buckets(result.fetchall(), start_date, end_date, bucket)
+
+
+async def per_bucket(session, start_date, end_date, bucket):
+    points = []
+    current = reports.bucket_start(start_date, bucket)
+    while current <= end_date:
+        following = reports.next_bucket(current, bucket)
+        bucket_end = min(following - timedelta(days=1), end_date)
+        bucket_from = max(current, start_date)
+        points.append((
+            await rollups.sum_paid(session, bucket_from, bucket_end),
+            await rollups.sum_due(session, bucket_from, bucket_end),
+        ))
+        current = following
+    return points
+
+
+async def measure(fn, start_date, end_date, bucket, iterations):
+    timings = []
+    async with AsyncSessionLocal() as session:
+        await fn(session, start_date, end_date, bucket)  # Warm up
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await fn(session, start_date, end_date, bucket)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def main(args):
+    end_date = date.today()
+    start_date = end_date - timedelta(days=365 * args.years)
+    buckets = reports.bucket_count(start_date, end_date, args.bucket)
+    print(f"{args.years}-year range, bucket={args.bucket} ({buckets} buckets), {args.iterations} iterations")
+
+    results = {}
+    for name, fn in (("grouped", grouped), ("per-bucket", per_bucket)):
+        timings = await measure(fn, start_date, end_date, args.bucket, args.iterations)
+        results[name] = statistics.median(timings)
+        print(f"{name:<11} p50={results[name]:9.2f}ms  max={max(timings):9.2f}ms")
+    print(f"Speedup (p50): {results['per-bucket'] / results['grouped']:.1f}x")
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--bucket", choices=reports.TIMESERIES_BUCKETS, default="month")
+    parser.add_argument("--iterations", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,118 @@
+"""
+Measure how request throughput scales with the number of web worker
+processes (python -m app.server --workers N) on this machine.
+
+Each worker count gets a fresh server, a warm-up, and then --clients
+load-generating processes that each keep --concurrency requests in flight
+against --path for --duration seconds. Usage:
+
+    python -m benchmarks.bench_web_workers --workers 1 2 4 8 --path /
+
+'/' goes through the whole middleware stack without touching the database
+(requests from 127.0.0.1 skip the rate limiter). With a seeded database and
+Redis running, a read endpoint such as --path /products/ includes the
+queries. Set RUN_STARTUP_TASKS=false when no database is running.
+
+The load generators share the machine with the server, so give them fewer
+cores than the largest worker count (or pin them elsewhere with taskset),
+otherwise they cap the measured scaling. On a host with N free cores,
+throughput of the '/' route should grow close to linearly up to N workers
+and flatten beyond it. A single-core host shows no gain from extra workers,
+only slightly higher latency from the additional processes.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import List, Tuple
+
+import httpx
+
+from benchmarks.loadtest import _percentile, wait_until_ready
+
+
+async def _drive(base_url: str, path: str, concurrency: int, seconds: float) -> Tuple[List[float], int]:
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def loop():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    ok = (await client.get(path)).status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def drive(base_url: str, path: str, concurrency: int, seconds: float) -> Tuple[List[float], int]:
+    """One load-generating process"""
+    return asyncio.run(_drive(base_url, path, concurrency, seconds))
+
+
+def measure(workers: int, args) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.server", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(args.port)],
+        env={**os.environ, "LOG_LEVEL": "WARNING"},
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    try:
+        asyncio.run(wait_until_ready(base_url))
+        with ProcessPoolExecutor(max_workers=args.clients, mp_context=get_context("spawn")) as pool:
+            def run(seconds):
+                n = args.clients
+                return list(pool.map(drive, [base_url] * n, [args.path] * n, [args.concurrency] * n, [seconds] * n))
+
+            run(args.warmup)
+            results = run(args.duration)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+    return {
+        "workers": workers,
+        "requests_per_second": len(latencies) / args.duration,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "errors": sum(errors for _, errors in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--clients", type=int, default=2, help="Load-generating processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight per client process")
+    parser.add_argument("--duration", type=float, default=15.0, help="Measured seconds per worker count")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+
+    print(f"GET {args.path}, {args.clients} clients x {args.concurrency} in flight, "
+          f"{args.duration:.0f}s per run on {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    baseline = None
+    for workers in args.workers:
+        result = measure(workers, args)
+        baseline = baseline or result["requests_per_second"]
+        print(f"{workers:>8} {result['requests_per_second']:>10.0f} {result['requests_per_second'] / baseline:>7.2f}x "
+              f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
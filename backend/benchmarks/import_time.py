@@ -0,0 +1,115 @@
+"""
+Check the web process's import time (cold start) against a budget.
+
+Imports app.main with -X importtime in --runs fresh interpreters and takes
+the median. It fails (exit 1) when:
+
+- the median exceeds --budget-ms (DEFAULT_BUDGET_MS unless given), or the
+  stored baseline by more than --threshold percent;
+- importing the app pulled in a module that must load lazily, at the point
+  of use (LAZY_MODULES).
+
+The baseline lives in benchmarks/baselines/import_time.json and is only
+meaningful on the machine that recorded it; --save-baseline stores this
+run. The slowest modules are listed to show where the time goes. Usage:
+
+    python -m benchmarks.import_time --save-baseline
+    python -m benchmarks.import_time --threshold 15
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "import_time.json")
+
+# Absolute ceiling for the median app.main import time (ms), generous enough
+# for a slow CI machine; the baseline catches smaller regressions
+DEFAULT_BUDGET_MS = 2000.0
+
+# Heavy dependencies the web process only needs on some requests
+LAZY_MODULES = ("celery", "kombu", "jinja2", "httpx", "sendgrid", "pyarrow", "psycopg2")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+_PROBE = "import sys, json; import app.main; print(json.dumps(sorted(sys.modules)))"
+
+
+def measure_once() -> Tuple[float, Dict[str, float], List[str]]:
+    """Cumulative app.main import time (ms), self time per module (ms), and the loaded modules"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    total, self_times = None, {}
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, module = match.groups()
+        self_times[module] = int(self_us) / 1000
+        if module == "app.main":
+            total = int(cumulative_us) / 1000
+    return total, self_times, json.loads(completed.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Absolute budget for the median import time")
+    parser.add_argument("--threshold", type=float, default=15.0, help="Allowed slowdown against the baseline (percent)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list")
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    median = statistics.median(total for total, _, _ in runs)
+    self_times = {
+        module: statistics.median(times.get(module, 0.0) for _, times, _ in runs)
+        for module in runs[-1][1]
+    }
+    loaded = set(runs[-1][2])
+
+    print(f"import app.main: median {median:.0f} ms over {args.runs} runs "
+          f"({', '.join(f'{total:.0f}' for total, _, _ in runs)})")
+    print("Slowest modules (self time):")
+    for module, ms in sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {ms:8.1f} ms  {module}")
+
+    failures = [
+        f"{module} is imported at startup; import it where it is used"
+        for module in LAZY_MODULES
+        if module in loaded
+    ]
+    if median > args.budget_ms:
+        failures.append(f"median {median:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump({"median_ms": round(median, 1), "runs": args.runs, "python": sys.version.split()[0]}, f, indent=2)
+        print(f"Saved baseline to {BASELINE_PATH}")
+    elif os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        limit = baseline["median_ms"] * (1 + args.threshold / 100)
+        print(f"Baseline {baseline['median_ms']:.0f} ms, limit {limit:.0f} ms (+{args.threshold:.0f}%)")
+        if median > limit:
+            failures.append(f"median {median:.0f} ms regressed beyond {limit:.0f} ms")
+
+    if failures:
+        print("FAILED:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+"""
+Load test the API with realistic request mixes and compare against a stored
+baseline.
+
+'seed' writes a reproducible dataset (same --seed, same rows relative to
+today): customers
+under @loadtest.example.com, one installment product, installments due
+around today and their past payments. It replaces the previous load-test
+data and rebuilds the report rollups and the Redis due index.
+
+'run' drives the API with virtual users. Each one logs in and then loops
+over its scenario's weighted requests (customers: list installments, list
+payments, post a payment, log in again; admins: payment reports, time
+series, aging). Per request type it reports requests/sec, error count and
+p50/p95/p99 latency. With --start-app it starts uvicorn locally first;
+otherwise it targets --base-url.
+
+Needs Postgres (DATABASE_URL) and Redis (REDIS_URL_*), e.g. from
+docker-compose. The app runs with the fake email provider when started
+here. Requests from 127.0.0.1 bypass the rate limiter (whitelisted).
+Usage:
+
+    python -m benchmarks.loadtest seed --users 500 --installments 3 --payments 4
+    python -m benchmarks.loadtest run --start-app --mix mixed --users 50 --duration 60
+
+Baselines live in benchmarks/baselines/<mix>.json. --save-baseline stores
+the run's results there. Otherwise an existing baseline is compared and the
+command exits with status 1 when a request type's p95 latency rose, or its
+throughput fell, by more than --threshold percent.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import delete, insert, select
+
+from app.core.client import QUEUE, close_redis_pools, get_redis
+from app.core.database import AsyncSessionLocal, async_engine
+from app.core.security import get_password_hash
+from app.models.db_models import AgingCustomerSnapshot, Installment, Payment, Product, User
+from app.services import due_index, rollups
+
+LOADTEST_DOMAIN = "loadtest.example.com"
+LOADTEST_PASSWORD = "loadtest-password"
+LOADTEST_PRODUCT = "Load test product"
+# Every seeded installment runs this many months, so clients can work out the
+# monthly amount (the API does not return it)
+SEED_PERIOD_MONTHS = 12
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+# Request weights per virtual user scenario
+SCENARIOS = {
+    "customer": {
+        "list_installments": 40,
+        "list_payments": 35,
+        "create_payment": 15,
+        "login": 10,
+    },
+    "admin": {
+        "report_monthly": 35,
+        "report_weekly": 20,
+        "report_all": 10,
+        "report_timeseries": 20,
+        "report_aging": 15,
+    },
+}
+
+# Share of virtual users running each scenario
+MIXES = {
+    "customer": {"customer": 1.0},
+    "admin": {"admin": 1.0},
+    "mixed": {"customer": 0.9, "admin": 0.1},
+}
+
+
+# Seeding
+
+def _user_email(index: int) -> str:
+    return f"user{index:06d}@{LOADTEST_DOMAIN}"
+
+
+def _monthly_amount(total_amount: int) -> int:
+    return Installment.calculate_installment_amount(total_amount, SEED_PERIOD_MONTHS)
+
+
+async def _delete_previous(db) -> None:
+    user_ids = select(User.id).where(User.email.like(f"%@{LOADTEST_DOMAIN}"))
+    installment_ids = select(Installment.id).where(Installment.user_id.in_(user_ids))
+    await db.execute(delete(Payment).where(Payment.installment_id.in_(installment_ids)))
+    await db.execute(delete(Installment).where(Installment.user_id.in_(user_ids)))
+    await db.execute(delete(AgingCustomerSnapshot).where(AgingCustomerSnapshot.user_id.in_(user_ids)))
+    await db.execute(delete(User).where(User.email.like(f"%@{LOADTEST_DOMAIN}")))
+
+
+async def seed(args) -> None:
+    rng = random.Random(args.seed)
+    today = date.today()
+    now = datetime.now(timezone.utc)
+    # bcrypt is slow on purpose; every load-test user shares one hash
+    password_hash = get_password_hash(LOADTEST_PASSWORD)
+    timezones = ["Asia/Dhaka", "UTC", "Europe/London", "America/New_York", None]
+
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        await _delete_previous(db)
+
+        product_id = (await db.execute(select(Product.id).where(Product.name == LOADTEST_PRODUCT))).scalar()
+        if product_id is None:
+            product_id = (await db.execute(
+                insert(Product).values(name=LOADTEST_PRODUCT, price=1_200_000).returning(Product.id)
+            )).scalar()
+
+        user_rows = [
+            {
+                "name": f"Load Test {index}",
+                "email": _user_email(index),
+                "hashed_password": password_hash,
+                "is_verified": True,
+                "timezone": rng.choice(timezones),
+            }
+            for index in range(args.users)
+        ]
+        user_ids = []
+        for start in range(0, len(user_rows), args.batch_size):
+            user_ids += (await db.execute(
+                insert(User).returning(User.id, sort_by_parameter_order=True),
+                user_rows[start:start + args.batch_size],
+            )).scalars().all()
+
+        installment_rows, payment_plans = [], []
+        for user_id in user_ids:
+            for _ in range(args.installments):
+                total = rng.randrange(600_000, 2_400_000, 100)
+                monthly = _monthly_amount(total)
+                paid_count = rng.randint(0, min(args.payments, SEED_PERIOD_MONTHS - 2))
+                installment_rows.append({
+                    "user_id": user_id,
+                    "product_id": product_id,
+                    "total_amount": total,
+                    "installment_amount": monthly,
+                    "remaining_amount": total - paid_count * monthly,
+                    "due_date": today + timedelta(days=rng.randint(-60, 60)),
+                    "created_at": now - timedelta(days=30 * paid_count + rng.randint(0, 29)),
+                })
+                payment_plans.append((monthly, paid_count))
+
+        installment_ids = []
+        for start in range(0, len(installment_rows), args.batch_size):
+            installment_ids += (await db.execute(
+                insert(Installment).returning(Installment.id, sort_by_parameter_order=True),
+                installment_rows[start:start + args.batch_size],
+            )).scalars().all()
+
+        payment_rows = [
+            {
+                "installment_id": installment_id,
+                "amount": monthly,
+                "payment_date": now - timedelta(days=30 * month + rng.randint(0, 29), seconds=rng.randint(0, 86399)),
+            }
+            for installment_id, (monthly, paid_count) in zip(installment_ids, payment_plans)
+            for month in range(paid_count)
+        ]
+        for start in range(0, len(payment_rows), args.batch_size):
+            await db.execute(insert(Payment), payment_rows[start:start + args.batch_size])
+        await db.commit()
+
+        # The inserts bypassed the rollup and index upkeep of the API
+        await rollups.rebuild_rollups(db)
+        try:
+            indexed = await due_index.rebuild(db, get_redis(QUEUE))
+        except Exception as e:
+            indexed = f"skipped ({e})"
+
+    await close_redis_pools()
+    await async_engine.dispose()
+    print(f"Seeded {len(user_ids)} users, {len(installment_ids)} installments and "
+          f"{len(payment_rows)} payments in {time.perf_counter() - started:.1f}s (seed={args.seed}, "
+          f"due index: {indexed})")
+
+
+# Load generation
+
+class Stats:
+    """Latencies and errors per request type, ignoring the warm-up period"""
+
+    def __init__(self, measure_from: float):
+        self.measure_from = measure_from
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, name: str, started: float, ok: bool) -> None:
+        if started < self.measure_from:
+            return
+        self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, seconds: float) -> Dict[str, dict]:
+        results = {}
+        everything = []
+        for name, latencies in sorted(self.latencies.items()):
+            results[name] = _summarize(latencies, self.errors.get(name, 0), seconds)
+            everything += latencies
+        if everything:
+            results["TOTAL"] = _summarize(everything, sum(self.errors.values()), seconds)
+        return results
+
+
+def _percentile(ordered: List[float], percent: float) -> float:
+    # Nearest-rank percentile
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def _summarize(latencies: List[float], errors: int, seconds: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / seconds, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(_percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(_percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(_percentile(ordered, 99) * 1000, 2),
+    }
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, scenario: str, email: str, password: str, rng: random.Random):
+        self.client = client
+        self.stats = stats
+        self.scenario = scenario
+        self.email = email
+        self.password = password
+        self.rng = rng
+        self.headers: Dict[str, str] = {}
+        # Installment id -> (total, remaining) in cents, as last seen
+        self.installments: Dict[int, Tuple[int, int]] = {}
+        names, weights = zip(*SCENARIOS[scenario].items())
+        self.names, self.weights = list(names), list(weights)
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        except httpx.HTTPError:
+            self.stats.record(name, started, ok=False)
+            return None
+        self.stats.record(name, started, ok=response.status_code < 400)
+        return response
+
+    async def login(self) -> bool:
+        response = await self.request(
+            "login", "POST", "/auth/login", data={"username": self.email, "password": self.password}
+        )
+        if response is None or response.status_code != 200:
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return True
+
+    async def run(self, deadline: float, think: float) -> None:
+        if not await self.login():
+            return
+        while time.perf_counter() < deadline:
+            name = self.rng.choices(self.names, self.weights)[0]
+            await getattr(self, name)()
+            if think:
+                await asyncio.sleep(self.rng.uniform(0, 2 * think))
+
+    # Customer requests
+
+    async def list_installments(self) -> None:
+        page = self.rng.randint(1, 2)
+        response = await self.request("list_installments", "GET", "/installments", params={"page": page, "limit": 10})
+        if response is not None and response.status_code == 200:
+            for item in response.json()["items"]:
+                self.installments[item["id"]] = (int(item["total_amount"]), int(item["remaining_amount"]))
+
+    async def list_payments(self) -> None:
+        await self.request("list_payments", "GET", "/payments/", params={"page": self.rng.randint(1, 3), "limit": 10})
+
+    async def create_payment(self) -> None:
+        open_installments = [installment_id for installment_id, (_, remaining) in self.installments.items() if remaining > 0]
+        if not open_installments:
+            return await self.list_installments()
+        installment_id = self.rng.choice(open_installments)
+        total, remaining = self.installments[installment_id]
+        # Pay one month, or what is left when that is less
+        amount = min(_monthly_amount(total), remaining)
+        response = await self.request(
+            "create_payment", "POST", "/payments/",
+            json={"installment_id": installment_id, "amount_in_bdt": amount / 100},
+        )
+        if response is not None and response.status_code == 200:
+            self.installments[installment_id] = (total, remaining - amount)
+        else:
+            # Paid off or changed by another request; look again on the next listing
+            self.installments.pop(installment_id, None)
+
+    # Admin requests
+
+    async def report_monthly(self) -> None:
+        await self.request("report_monthly", "GET", "/admin/reports", params={"report_type": "monthly", "page": self.rng.randint(1, 5)})
+
+    async def report_weekly(self) -> None:
+        await self.request("report_weekly", "GET", "/admin/reports", params={"report_type": "weekly"})
+
+    async def report_all(self) -> None:
+        await self.request("report_all", "GET", "/admin/reports", params={"report_type": "all"})
+
+    async def report_timeseries(self) -> None:
+        start = date.today() - timedelta(days=self.rng.choice([30, 90, 365]))
+        await self.request("report_timeseries", "GET", "/admin/reports/timeseries", params={"from": start.isoformat(), "bucket": "day"})
+
+    async def report_aging(self) -> None:
+        await self.request("report_aging", "GET", "/admin/reports/aging")
+
+
+# Running
+
+def start_app(port: int) -> subprocess.Popen:
+    """Start uvicorn on the local database and Redis, with the fake email provider"""
+    env = {**os.environ, "EMAIL_BACKEND": "fake", "EMAIL_FAKE_LATENCY_MS": os.getenv("EMAIL_FAKE_LATENCY_MS", "50")}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+
+async def wait_until_ready(base_url: str, timeout: float = 60.0) -> None:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while True:
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"App at {base_url} did not become ready within {timeout:.0f}s")
+            await asyncio.sleep(0.5)
+
+
+def _scenario_counts(mix: str, users: int) -> Dict[str, int]:
+    counts = {scenario: int(users * share) for scenario, share in MIXES[mix].items()}
+    # Give rounding leftovers to the largest scenario, and every scenario at least one user
+    largest = max(counts, key=lambda scenario: MIXES[mix][scenario])
+    counts[largest] += users - sum(counts.values())
+    for scenario in counts:
+        if counts[scenario] == 0 and counts[largest] > 1:
+            counts[scenario], counts[largest] = 1, counts[largest] - 1
+    return counts
+
+
+async def run_load(args) -> Dict[str, dict]:
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    stats = Stats(measure_from=started + args.warmup)
+    deadline = started + args.warmup + args.duration
+
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        virtual_users = []
+        for scenario, count in _scenario_counts(args.mix, args.users).items():
+            for index in range(count):
+                if scenario == "admin":
+                    email, password = args.admin_email, args.admin_password
+                else:
+                    email, password = _user_email(rng.randrange(args.seed_users)), LOADTEST_PASSWORD
+                virtual_users.append(VirtualUser(client, stats, scenario, email, password, random.Random(rng.random())))
+        await asyncio.gather(*(user.run(deadline, args.think_ms / 1000) for user in virtual_users))
+
+    return stats.summary(args.duration)
+
+
+def print_results(results: Dict[str, dict]) -> None:
+    print(f"{'request':<20} {'count':>7} {'errors':>6} {'rps':>8} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, row in results.items():
+        print(f"{name:<20} {row['requests']:>7} {row['errors']:>6} {row['rps']:>8.1f} "
+              f"{row['mean_ms']:>7.1f}ms {row['p50_ms']:>7.1f}ms {row['p95_ms']:>7.1f}ms {row['p99_ms']:>7.1f}ms")
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Regressions of p95 latency or throughput beyond threshold percent"""
+    regressions = [f"{name}: no requests in this run" for name in baseline if name not in results]
+    for name, row in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if row["p95_ms"] > base["p95_ms"] * (1 + threshold / 100):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f}ms -> {row['p95_ms']:.1f}ms")
+        if row["rps"] < base["rps"] * (1 - threshold / 100):
+            regressions.append(f"{name}: rps {base['rps']:.1f} -> {row['rps']:.1f}")
+    return regressions
+
+
+def run(args) -> int:
+    app = None
+    if args.start_app:
+        args.base_url = f"http://127.0.0.1:{args.port}"
+        app = start_app(args.port)
+    try:
+        asyncio.run(wait_until_ready(args.base_url))
+        results = asyncio.run(run_load(args))
+    finally:
+        if app is not None:
+            app.terminate()
+            app.wait(timeout=30)
+
+    print(f"{args.mix} mix, {args.users} virtual users, {args.duration:.0f}s after {args.warmup:.0f}s warm-up")
+    print_results(results)
+    report = {
+        "mix": args.mix,
+        "users": args.users,
+        "duration": args.duration,
+        "think_ms": args.think_ms,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"{args.mix}.json")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {baseline_path}")
+        return 0
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+        return 0
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if (baseline["users"], baseline["duration"], baseline["think_ms"]) != (args.users, args.duration, args.think_ms):
+        print("Warning: the baseline was recorded with different --users/--duration/--think-ms")
+    regressions = compare(results, baseline["results"], args.threshold)
+    if regressions:
+        print(f"Regressions beyond {args.threshold:.0f}% against {baseline_path}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"No regressions beyond {args.threshold:.0f}% against {baseline_path}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Write the load-test dataset")
+    seed_parser.add_argument("--users", type=int, default=500)
+    seed_parser.add_argument("--installments", type=int, default=3, help="Installments per user")
+    seed_parser.add_argument("--payments", type=int, default=4, help="Most past payments per installment")
+    seed_parser.add_argument("--seed", type=int, default=42)
+    seed_parser.add_argument("--batch-size", type=int, default=1000, help="Rows per insert statement")
+
+    run_parser = commands.add_parser("run", help="Drive the API and report latency per request type")
+    run_parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    run_parser.add_argument("--users", type=int, default=50, help="Concurrent virtual users")
+    run_parser.add_argument("--duration", type=float, default=60.0, help="Measured seconds")
+    run_parser.add_argument("--warmup", type=float, default=10.0, help="Seconds before measuring starts")
+    run_parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between a user's requests")
+    run_parser.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--seed-users", type=int, default=500, help="Users in the seeded dataset")
+    run_parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    run_parser.add_argument("--start-app", action="store_true", help="Start uvicorn locally for the run")
+    run_parser.add_argument("--port", type=int, default=8765, help="Port for --start-app")
+    run_parser.add_argument("--admin-email", default="admin@example.com")
+    run_parser.add_argument("--admin-password", default="admin_password")
+    run_parser.add_argument("--output", help="Also write the results to this JSON file")
+    run_parser.add_argument("--baseline", help="Baseline file (default benchmarks/baselines/<mix>.json)")
+    run_parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    run_parser.add_argument("--threshold", type=float, default=15.0, help="Allowed regression in percent")
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        asyncio.run(seed(args))
+        return 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
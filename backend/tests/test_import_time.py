@@ -0,0 +1,30 @@
+"""
+Cold-start guard for the web process, the same checks as
+python -m benchmarks.import_time without a baseline. IMPORT_TIME_BUDGET_MS
+overrides the budget on unusually slow machines.
+"""
+import os
+import statistics
+
+import pytest
+
+from benchmarks import import_time
+
+RUNS = 3
+BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", import_time.DEFAULT_BUDGET_MS))
+
+
+@pytest.fixture(scope="module")
+def runs():
+    return [import_time.measure_once() for _ in range(RUNS)]
+
+
+def test_lazy_modules_not_imported_at_startup(runs):
+    loaded = set(runs[-1][2])
+    eager = [module for module in import_time.LAZY_MODULES if module in loaded]
+    assert not eager, f"imported at startup, import them where they are used: {eager}"
+
+
+def test_import_time_within_budget(runs):
+    median = statistics.median(total for total, _, _ in runs)
+    assert median <= BUDGET_MS, f"import app.main median {median:.0f} ms is over the {BUDGET_MS:.0f} ms budget"